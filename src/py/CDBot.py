@@ -1,25 +1,113 @@
 import discord
 from discord.ext import commands
-import sys
+from PIL import features
 import logging
-import datetime
 import traceback
-from PIL import Image, ImageDraw
-import os
 import re
+import io
+import asyncio
+import os
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from cd import CD
 from cdError import CDError
-from draw import Draw
+from cache import LRUCache
+from diskcache import DiskCache
+from draw import renderSettings
+from render import RenderPool, Coalescer, parseDiagram, countElements, composeGrid
+from metrics import Metrics, SIZE_BUCKETS
+from ratelimit import RateLimiter
+from logs import setupLogging
+from limits import SIZE_LIMITS
+from coxeter import classifyGraph, totalOrder, elementName, ELEMENT_MAX_RANK
 
 INVITE_LINK = "https://discord.com/api/oauth2/authorize?client_id=795909275880259604&permissions=34816&scope=bot"
 POLYTOPE_WIKI = "https://polytope.miraheze.org/wiki/"
-TOKEN = open("../txt/TOKEN.txt", "r").read()
-PREFIX = open("../txt/PREFIX.txt", "r").read()
+
+# Paths are relative to this file, so that the bot can be started from any directory.
+BASE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+TOKEN_FILE = os.path.join(BASE_DIRECTORY, "..", "txt", "TOKEN.txt")
+PREFIX_FILE = os.path.join(BASE_DIRECTORY, "..", "txt", "PREFIX.txt")
+
+PREFIX = "?" # Command prefix, read from PREFIX_FILE when the bot starts.
 
 USER_ID = ["370964201478553600","581141017823019038","442713612822380554","253227815338508289"] # Users to ping on unexpected error
 
-client = commands.Bot(command_prefix = PREFIX)
-fileCount = 0
+CACHE_MAX_ITEMS = 512 # Maximum number of rendered diagrams kept in memory.
+CACHE_MAX_BYTES = 64 * 1024 * 1024 # Maximum total size of the rendered diagrams kept in memory.
+
+DISK_CACHE_FILE = os.path.join(BASE_DIRECTORY, "..", "..", "cache", "renders.sqlite") # Rendered diagrams kept across restarts.
+DISK_CACHE_MAX_BYTES = 512 * 1024 * 1024 # Maximum total size of the rendered diagrams kept on disk.
+
+RENDER_POOL_MODE = 'process' # Either 'process' or 'thread'.
+RENDER_WORKERS = None # Number of render workers, None for one per CPU.
+RENDER_QUEUE_DEPTH = 32 # Maximum number of diagrams being rendered at once.
+
+# Output formats for the cd command. WebP needs Pillow to be built with it.
+FORMATS = ('png', 'svg') + (('webp',) if features.check('webp') else ())
+LAYOUTS = ('grid', 'files') # How the cd command sends several diagrams: packed in one image, or as separate files.
+
+BATCH_SEPARATORS = re.compile(r"[;|]") # Separates the diagrams of a batch.
+BATCH_MAX_DIAGRAMS = 10 # Maximum number of diagrams in a batch, also Discord's attachment limit.
+BATCH_MAX_NODES = 300 # Maximum number of nodes across all diagrams of a batch.
+
+LOG_FILE = os.path.join(BASE_DIRECTORY, "..", "..", "logs", "cdbot.log") # The current log file, rotated ones are gzipped next to it.
+
+METRICS_FILE = os.path.join(BASE_DIRECTORY, "..", "..", "logs", "metrics.prom") # Where metrics get dumped, in Prometheus text format.
+METRICS_DUMP_INTERVAL = 60 # Seconds between metric dumps.
+SLOW_REQUEST_SECONDS = 2 # Requests slower than this get their stage timings logged.
+
+# Token bucket rate limits for the cd command, as (burst size, diagrams per second) by scope.
+# A request needs a token from its user, channel and guild, and batches take one per diagram.
+RATE_LIMITS = {
+    'user': (5, 1 / 6),
+    'channel': (12, 1 / 2),
+    'guild': (30, 1)
+}
+LARGE_COST = 5 # Rate limit tokens taken by a large diagram, which can hold a render worker for seconds.
+
+STAGES = ('disk', 'queue', 'parse', 'layout', 'draw', 'encode', 'compose', 'upload') # Stages of the cd pipeline, in order.
+
+# Gets the current command prefix, so that changing it doesn't need a new client.
+def getPrefix(bot, message):
+    return PREFIX
+
+client = commands.Bot(command_prefix = getPrefix)
+
+# Rendered images, keyed by the diagram string, format and size.
+renderCache = LRUCache(maxItems = CACHE_MAX_ITEMS, maxBytes = CACHE_MAX_BYTES)
+
+# Rendered images on disk, shared by every bot process on the machine. Opened by main().
+diskCache = None
+
+# Runs disk cache reads and writes, so that a slow disk doesn't hold up the event loop.
+# Its own executor, so that main() can wait for the writes still in flight before closing the cache.
+diskExecutor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "diskcache")
+
+# Hands log records to the logging thread. Set up by main().
+logHandler = None
+
+# Renders diagrams off the event loop.
+renderPool = RenderPool(mode = RENDER_POOL_MODE, workers = RENDER_WORKERS, queueDepth = RENDER_QUEUE_DEPTH)
+
+# Identical renders running at the same time share their result.
+renderCoalescer = Coalescer()
+
+# Keeps any single user, channel or guild from hogging the renderers.
+rateLimiter = RateLimiter(RATE_LIMITS)
+
+# Runtime metrics, see the stats command.
+metrics = Metrics(prefix = "cdbot_")
+metrics.gauge("cache_hit_rate", renderCache.hitRate)
+metrics.gauge("cache_items", lambda: len(renderCache))
+metrics.gauge("cache_bytes", lambda: renderCache.bytes)
+metrics.gauge("render_queue_depth", lambda: renderPool.pending)
+metrics.gauge("disk_cache_hit_rate", lambda: diskCache.hitRate() if diskCache else 0)
+metrics.gauge("log_records_dropped", lambda: logHandler.dropped if logHandler else 0)
+
+# The task dumping the metrics, started once the bot is ready.
+metricsTask = None
 
 # Runs on client ready.
 @client.event
@@ -32,9 +120,50 @@ async def on_ready():
         )
     )
 
+    global metricsTask
+    if metricsTask is None:
+        metricsTask = asyncio.create_task(dumpMetrics())
+
     a_logger.info("INFO: Bot is ready.")
     a_logger.info(f"INFO: Prefix is {PREFIX}")
 
+# Starts timing a command.
+@client.before_invoke
+async def beforeCommand(ctx):
+    ctx.start = time.perf_counter()
+    ctx.outcome = "ok"
+
+# Logs each finished command as a structured line, with its latency and outcome.
+@client.event
+async def on_command_completion(ctx):
+    logCommand(ctx, getattr(ctx, "outcome", "ok"))
+
+# Logs commands that failed before or outside of their own error handling, like failed permission checks.
+@client.event
+async def on_command_error(ctx, e):
+    if isinstance(e, commands.CommandNotFound):
+        return
+
+    if isinstance(e, commands.CheckFailure):
+        logCommand(ctx, "forbidden")
+    else:
+        logCommand(ctx, "failed", error = repr(e))
+        a_logger.error(f"ERROR: {e}", exc_info = e)
+
+# Logs a command with its context, and its latency if it got to run.
+def logCommand(ctx, outcome, **fields):
+    start = getattr(ctx, "start", None)
+
+    a_logger.info("command", extra = {
+        "command": ctx.command.name if ctx.command else None,
+        "guild": ctx.guild.id if ctx.guild else None,
+        "channel": ctx.channel.id,
+        "user": ctx.author.id,
+        "latency_ms": round((time.perf_counter() - start) * 1000) if start is not None else None,
+        "outcome": outcome,
+        **fields
+    })
+
 # Shows a help screen with a command list.
 client.remove_command("help")
 
@@ -48,6 +177,10 @@ wikiShortExplanation = (
     "Searches for a given article within the "
     f"[Polytope Wiki]({POLYTOPE_WIKI})."
 )
+groupShortExplanation = (
+    "Identifies the [Coxeter group](https://polytope.miraheze.org/wiki/Coxeter_group) of a diagram, "
+    "whether it's finite, its order, and the element counts of its polytope."
+)
 inviteShortExplanation = f"Posts the bot [invite link]({INVITE_LINK})."
 
 @client.command(pass_context = True)
@@ -73,6 +206,12 @@ async def help(ctx, *args):
             inline = False
         )
 
+        helpEmbed.add_field(
+            name = f"`{PREFIX}group [linearized diagram]`",
+            value = groupShortExplanation,
+            inline = False
+        )
+
         helpEmbed.add_field(
             name = f"`{PREFIX}wiki [article name]`",
             value = wikiShortExplanation,
@@ -103,7 +242,23 @@ async def help(ctx, *args):
                 f"`{PREFIX}cd x3o3o`: A simple diagram.\n"
                 f"`{PREFIX}cd s3s4o3x`: A diagram with various node types.\n"
                 f"`{PREFIX}cd x3x3x3*a`: A diagram with loops.\n"
-                f"`{PREFIX}cd *-c3x3x3x o3o3o3o3o`: A branching diagram."
+                f"`{PREFIX}cd *-c3x3x3x o3o3o3o3o`: A branching diagram.\n"
+                f"`{PREFIX}cd x4o3o format=svg`: A diagram as a scalable SVG file.\n"
+                f"`{PREFIX}cd x4o3o format=webp`: A diagram as a smaller WebP file.\n"
+                f"`{PREFIX}cd x3o3o; x4o3o; x5o3o`: Several diagrams in one image.\n"
+                f"`{PREFIX}cd x3o3o | x4o3o layout=files`: Several diagrams as separate files.\n"
+                f"`{PREFIX}cd x3o3o3o3o size=large`: Allows diagrams of up to {SIZE_LIMITS['large'].nodes:,} nodes, "
+                "at a slower rate."
+            )
+        ))
+    elif args == 'group':
+        await ctx.send(embed = commandHelpEmbed(
+            command = args,
+            shortExplanation = groupShortExplanation,
+            examples = (
+                f"`{PREFIX}group x4o3o`: The B3 group, and the elements of the cube.\n"
+                f"`{PREFIX}group x3o3o3o3o *c3o`: The exceptional E6 group.\n"
+                f"`{PREFIX}group x3o x5o`: A product of groups."
             )
         ))
     elif args == 'wiki':
@@ -131,16 +286,39 @@ async def help(ctx, *args):
 # Shows a Coxeter-Dynkin diagram.
 @client.command()
 async def cd(ctx, *cd):
+    options, cd = parseOptions(cd)
     cd = ' '.join(cd)
-    a_logger.info(f"COMMAND: cd {cd}")
-
-    if cd == '':
+    a_logger.info(f"COMMAND: cd {cd} {options}")
+    metrics.increment("cd_requests_total")
+    start = time.perf_counter()
+
+    fileFormat = options.pop('format', 'png')
+    layout = options.pop('layout', 'grid')
+    size = options.pop('size', 'normal')
+
+    if options:
+        await ctx.send(f"Unknown option `{next(iter(options))}`. Run `{PREFIX}help cd` for details.")
+    elif fileFormat not in FORMATS:
+        await ctx.send(f"Unknown format `{fileFormat}`. Choose one of: {', '.join(FORMATS)}.")
+    elif layout not in LAYOUTS:
+        await ctx.send(f"Unknown layout `{layout}`. Choose one of: {', '.join(LAYOUTS)}.")
+    elif size not in SIZE_LIMITS:
+        await ctx.send(f"Unknown size `{size}`. Choose one of: {', '.join(SIZE_LIMITS)}.")
+    elif size != 'normal' and BATCH_SEPARATORS.search(cd):
+        await ctx.send(f"Only single diagrams can be {size}.")
+    elif cd == '':
         await ctx.send(f"Usage: `{PREFIX}cd x4o3o`. Run `{PREFIX}help cd` for details.")
     elif cd == 'play':
         await ctx.send(":cd: :play_pause:")
+    elif await rateLimited(ctx, len(BATCH_SEPARATORS.split(cd)) if size == 'normal' else LARGE_COST):
+        return
+    elif BATCH_SEPARATORS.search(cd):
+        result = await cdBatch(ctx, [diagram.strip() for diagram in BATCH_SEPARATORS.split(cd)], fileFormat, layout)
+        if result is not None:
+            recordRequest(cd, start, *result, fileFormat)
     else:
         try:
-            temp = Draw(CD(cd).toGraph()).draw()
+            data, timings = await renderCached(cd, fileFormat, size = size)
         except CDError as e:
             await error(ctx, e, expected = True)
             return
@@ -149,16 +327,271 @@ async def cd(ctx, *cd):
             a_logger.info(f"ERROR:\n{traceback.format_exc()}")
             return
 
-        global fileCount
-        fileName = f"temp{fileCount}.png"
-        fileCount += 1
+        uploadStart = time.perf_counter()
+        await ctx.send(file = discord.File(io.BytesIO(data), filename = f"cd.{fileFormat}"))
+        timings['upload'] = time.perf_counter() - uploadStart
+        recordRequest(cd, start, timings, len(data), fileFormat)
+
+# Renders a diagram in the pool, going through the render cache.
+# The cache is keyed by the exact diagram string, so a hit skips parsing and rendering completely.
+# Whitespace isn't normalized, since the parser rejects some strings that only differ from valid ones in it.
+# ir is the diagram already parsed, if it is, so that a miss doesn't parse it again.
+# size picks the limits, out of SIZE_LIMITS.
+# Returns the image, and the time each stage took (nothing for cache hits).
+async def renderCached(diagram, fileFormat, ir = None, size = 'normal'):
+    key = (diagram, fileFormat, size)
+    data = renderCache.get(key)
+    timings = {}
+
+    if data is None:
+        (data, timings), shared = await renderCoalescer.run(
+            key, renderUncached, diagram if ir is None else ir, diagram, fileFormat, size
+        )
+
+        # Only the request that did the work reports its timings and caches the result.
+        if shared:
+            timings = {}
+            metrics.increment("cd_coalesced_total")
+            a_logger.info("INFO: Shared an identical render in progress.")
+        else:
+            renderCache.put(key, data)
+    else:
+        a_logger.info(f"INFO: Cache hit ({renderCache.hits} hits, {renderCache.misses} misses).")
+
+    return data, timings
+
+# Gets a diagram that isn't in memory, from the disk cache if it's there, or else by rendering it.
+# Takes what to render, either the diagram string or its IR, along with the string, which keys the disk cache.
+# The disk cache runs in diskExecutor, so a slow disk doesn't hold up the event loop.
+async def renderUncached(diagram, text, fileFormat, size):
+    limits = SIZE_LIMITS[size]
+    if diskCache is None:
+        return await renderPool.renderTimed(diagram, fileFormat, limits)
+
+    loop = asyncio.get_running_loop()
+    diskKey = DiskCache.key(*renderSettings(), fileFormat, size, text)
+
+    start = time.perf_counter()
+    try:
+        data = await loop.run_in_executor(diskExecutor, diskCache.get, diskKey)
+    except Exception as e:
+        a_logger.info(f"ERROR: Disk cache read failed: {e}")
+        data = None
+    diskTime = time.perf_counter() - start
+
+    if data is not None:
+        return data, {'disk': diskTime}
+
+    data, timings = await renderPool.renderTimed(diagram, fileFormat, limits)
+    timings['disk'] = diskTime
+
+    # Writes in the background, the reply doesn't need to wait for it.
+    write = loop.run_in_executor(diskExecutor, diskCache.put, diskKey, data)
+    write.add_done_callback(lambda future: future.exception() and a_logger.info(
+        f"ERROR: Disk cache write failed: {future.exception()}"
+    ))
+
+    return data, timings
+
+# Takes tokens for a request from the rate limits of its user, channel and guild.
+# If any of them is out of tokens, asks the user to wait, and returns True.
+async def rateLimited(ctx, cost):
+    wait = rateLimiter.take((
+        ('user', ctx.author.id),
+        ('channel', ctx.channel.id),
+        ('guild', ctx.guild.id if ctx.guild else None)
+    ), cost)
+
+    if wait == 0:
+        return False
+
+    seconds = math.ceil(wait)
+    ctx.outcome = "rate_limited"
+    metrics.increment("rate_limited_total")
+    a_logger.info(f"INFO: Rate limited for {seconds}s.")
+    await ctx.send(f"Whoa, that's a lot of diagrams! Give me {seconds} second{'s' if seconds != 1 else ''} to catch up.")
+    return True
+
+# Records the stage timings of a cd request and the size of what it uploaded, and logs them if it was slow.
+def recordRequest(diagram, start, timings, size, fileFormat):
+    total = time.perf_counter() - start
+    metrics.observe("cd_request_seconds", total)
+    metrics.observe("cd_upload_bytes", size, buckets = SIZE_BUCKETS, format = fileFormat)
+
+    for stage, seconds in timings.items():
+        metrics.observe("cd_stage_seconds", seconds, stage = stage)
+
+    if total > SLOW_REQUEST_SECONDS:
+        stages = ", ".join(f"{stage} {timings[stage] * 1000:.0f}ms" for stage in STAGES if stage in timings)
+        a_logger.info(f"INFO: Slow request ({total * 1000:.0f}ms, {size} bytes) for {diagram}: {stages}.")
+
+# Shows several diagrams in a single message.
+# They get parsed and rendered in parallel, and invalid ones are reported next to the others.
+# Returns the time each stage took, added up over the diagrams, and the total size of the uploaded files,
+# or None if the batch failed.
+async def cdBatch(ctx, diagrams, fileFormat, layout):
+    if len(diagrams) > BATCH_MAX_DIAGRAMS:
+        await error(ctx, CDError(f"Too many diagrams, the limit is {BATCH_MAX_DIAGRAMS}."), expected = True)
+        return None
+
+    timings = {}
+
+    try:
+        # Parses everything in the pool first, so that a batch over the node limit doesn't get drawn at all.
+        # Renders get the parsed diagrams, so that nothing is parsed twice.
+        parsed = await asyncio.gather(
+            *(renderPool.run(parseDiagram, diagram) for diagram in diagrams), return_exceptions = True
+        )
+        unexpected(parsed)
 
-        temp.save(fileName)
-        a_logger.info(f"INFO: Created {fileName} file.")
-        await ctx.send(file = discord.File(fileName))
+        nodes = sum(len(ir) for ir in parsed if not isinstance(ir, BaseException))
+        if nodes > BATCH_MAX_NODES:
+            raise CDError(f"Diagrams have too many nodes in total ({nodes}), the limit is {BATCH_MAX_NODES}.")
 
-        os.remove(fileName)
-        a_logger.info(f"INFO: Removed {fileName} file.")
+        # Only draws the diagrams that parsed, the others keep their parsing error.
+        valid = [i for i, ir in enumerate(parsed) if not isinstance(ir, BaseException)]
+        drawn = await asyncio.gather(
+            *(renderCached(diagrams[i], fileFormat, parsed[i]) for i in valid), return_exceptions = True
+        )
+        unexpected(drawn)
+
+        results = list(parsed)
+        for i, result in zip(valid, drawn):
+            if isinstance(result, BaseException):
+                results[i] = result
+            else:
+                results[i], diagramTimings = result
+                for stage, seconds in diagramTimings.items():
+                    timings[stage] = timings.get(stage, 0) + seconds
+
+        rendered = [
+            (diagram, data) for diagram, data in zip(diagrams, results) if not isinstance(data, BaseException)
+        ]
+        errors = [f"{diagram}: ERROR: {e}" for diagram, e in zip(diagrams, results) if isinstance(e, BaseException)]
+
+        files = []
+        size = 0
+        if rendered and layout == 'grid' and fileFormat != 'svg':
+            composeStart = time.perf_counter()
+            data = await renderPool.run(composeGrid, *zip(*rendered), fileFormat)
+            timings['compose'] = time.perf_counter() - composeStart
+            files.append(discord.File(io.BytesIO(data), filename = f"cd.{fileFormat}"))
+            size = len(data)
+        else:
+            for i, (diagram, data) in enumerate(rendered):
+                files.append(discord.File(io.BytesIO(data), filename = f"cd{i + 1}.{fileFormat}"))
+                size += len(data)
+    except CDError as e:
+        await error(ctx, e, expected = True)
+        return None
+    except Exception as e:
+        await error(ctx, e, expected = False)
+        a_logger.info(f"ERROR:\n{traceback.format_exc()}")
+        return None
+
+    for line in errors:
+        a_logger.info(line)
+
+    if errors:
+        metrics.increment("errors_total", len(errors), kind = "expected", command = "cd")
+
+    uploadStart = time.perf_counter()
+    await ctx.send(
+        content = "```" + "\n".join(errors) + "```" if errors else None,
+        files = files or None
+    )
+    timings['upload'] = time.perf_counter() - uploadStart
+
+    return timings, size
+
+# Raises the first unexpected error out of the results of asyncio.gather.
+# Diagram errors (CDError) are expected, and get reported per diagram instead.
+def unexpected(results):
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, CDError):
+            raise result
+
+# Splits the `key=value` options off the arguments of a command.
+# Diagrams never contain '=', so this can't clash with them.
+def parseOptions(args):
+    options, rest = {}, []
+
+    for arg in args:
+        key, sep, value = arg.partition('=')
+        if sep and key.isalpha():
+            options[key.lower()] = value.lower()
+        else:
+            rest.append(arg)
+
+    return options, rest
+
+GROUP_MAX_LINES = 20 # Maximum number of distinct component groups listed by the group command.
+ELEMENT_TIMEOUT = 10 # Seconds after which the group command stops counting elements.
+ELEMENT_COST = 3 # Rate limit tokens taken by counting elements, which can hold a render worker for ELEMENT_TIMEOUT.
+
+# Shows the Coxeter group of a diagram, component by component.
+@client.command()
+async def group(ctx, *diagram):
+    diagram = ' '.join(diagram)
+    a_logger.info(f"COMMAND: group {diagram}")
+
+    if diagram == '':
+        await ctx.send(f"Usage: `{PREFIX}group x4o3o`. Run `{PREFIX}help group` for details.")
+        return
+
+    try:
+        graph = CD(diagram).toGraph()
+    except CDError as e:
+        await error(ctx, e, expected = True)
+        return
+
+    groups = [group for _, group in classifyGraph(graph)]
+    message = describeGroups(groups)
+
+    # Counts the elements of the polytope too, when there is one and it's small enough.
+    if all(group.finite for group in groups) and any(value != 'o' for value in graph.values):
+        if len(graph) > ELEMENT_MAX_RANK:
+            message += f"\nElement counts only work for diagrams of up to {ELEMENT_MAX_RANK} nodes."
+        elif await rateLimited(ctx, ELEMENT_COST):
+            return
+        else:
+            try:
+                counts = await renderPool.run(countElements, diagram, ELEMENT_TIMEOUT)
+                message += "\nElements: " + ", ".join(
+                    f"{count:,} {elementName(dimension)}" for dimension, count in enumerate(counts)
+                )
+            except CDError as e:
+                message += f"\n{e}"
+            except Exception as e:
+                await error(ctx, e, expected = False)
+                a_logger.info(f"ERROR:\n{traceback.format_exc()}")
+                return
+
+    await ctx.send("```" + message + "```")
+
+# Describes the groups of the components of a diagram, with repeated ones counted together.
+def describeGroups(groups):
+    counts = {}
+    for group in groups:
+        counts[str(group)] = counts.get(str(group), 0) + 1
+
+    lines = [f"{count} × {name}" if count > 1 else name for name, count in counts.items()]
+    if len(lines) > GROUP_MAX_LINES:
+        lines = lines[:GROUP_MAX_LINES] + [f"… and {len(lines) - GROUP_MAX_LINES} more"]
+
+    if len(groups) > 1:
+        order = totalOrder(groups)
+
+        if order is None:
+            lines.append("Total: unknown, the group can't be told from the diagram")
+        elif order == math.inf:
+            lines.append("Total: infinite")
+        else:
+            lines.append(f"Total: finite, order {order:,}")
+    elif groups[0].order is None:
+        lines.append("The group can't be told from the diagram.")
+
+    return "\n".join(lines)
 
 # Posts the link to a wiki article.
 @client.command()
@@ -190,6 +623,73 @@ async def ping(ctx):
     a_logger.info(f"INFO: Latency {latency}ms.")
     await ctx.send(f"Ping: {latency}ms.")
 
+# Admin command, shows the cd pipeline metrics.
+@commands.has_permissions(administrator = True)
+@client.command()
+async def stats(ctx):
+    a_logger.info("COMMAND: stats")
+
+    lines = [f"{'stage':<8} {'count':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"]
+    for stage in STAGES + ('total',):
+        if stage == 'total':
+            histogram = metrics.histogram("cd_request_seconds")
+        else:
+            histogram = metrics.histogram("cd_stage_seconds", stage = stage)
+
+        if histogram is None:
+            continue
+
+        times = " ".join(f"{histogram.percentile(p) * 1000:>8.1f}" for p in (50, 90, 99))
+        lines.append(f"{stage:<8} {histogram.count:>7} {times} {histogram.max * 1000:>8.1f}")
+
+    lines.append("")
+    lines.append(f"Requests: {metrics.counter('cd_requests_total')}")
+    lines.append(
+        f"Errors: {metrics.counter('errors_total', kind = 'expected', command = 'cd')} expected, "
+        f"{metrics.counter('errors_total', kind = 'unexpected', command = 'cd')} unexpected"
+    )
+    lines.append(
+        f"Cache: {renderCache.hitRate():.0%} hit rate, {len(renderCache)} items, "
+        f"{renderCache.bytes / 1024 / 1024:.1f} MB"
+    )
+    if diskCache is not None:
+        lines.append(f"Disk cache: {diskCache.hitRate():.0%} hit rate")
+    lines.append(f"Render queue: {renderPool.pending}/{renderPool.queueDepth}")
+    if logHandler is not None and logHandler.dropped:
+        lines.append(f"Log records dropped: {logHandler.dropped}")
+
+    for fileFormat in FORMATS:
+        histogram = metrics.histogram("cd_upload_bytes", format = fileFormat)
+        if histogram is not None:
+            lines.append(
+                f"Uploads ({fileFormat}): {histogram.count}, {histogram.mean() / 1024:.1f} KB average, "
+                f"{histogram.max / 1024:.1f} KB max"
+            )
+
+    await ctx.send("Times in ms.\n```" + "\n".join(lines) + "```")
+
+# Writes the metrics to METRICS_FILE every METRICS_DUMP_INTERVAL seconds.
+# They're formatted on the event loop, so that they're read all at once, and written in a thread,
+# so that a slow disk doesn't hold up the bot.
+async def dumpMetrics():
+    loop = asyncio.get_running_loop()
+
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+
+        try:
+            await loop.run_in_executor(None, writeMetrics, metrics.prometheus())
+        except OSError as e:
+            a_logger.info(f"ERROR: Couldn't dump metrics: {e}")
+
+# Writes a metrics dump to METRICS_FILE.
+# Writes to a temporary file first, so that readers never see a half-written dump.
+def writeMetrics(text):
+    temporary = METRICS_FILE + ".tmp"
+    with open(temporary, "w", encoding = "utf-8") as file:
+        file.write(text)
+    os.replace(temporary, METRICS_FILE)
+
 # Changes the bot prefix.
 @commands.has_permissions(administrator = True)
 @client.command()
@@ -199,14 +699,20 @@ async def prefix(ctx, *newPrefix):
 
     global PREFIX
     PREFIX = newPrefix
-    client.command_prefix = PREFIX
-    open("../txt/PREFIX.TXT", "w").write(PREFIX)
+    with open(PREFIX_FILE, "w") as file:
+        file.write(PREFIX)
 
     a_logger.info(f"INFO: prefix changed to {newPrefix}")
     await ctx.send(f"Prefix changed to {PREFIX}")
 
 # Logs an error and posts it.
 async def error(ctx, e, expected):
+    ctx.outcome = "error" if expected else "unexpected_error"
+    metrics.increment(
+        "errors_total", kind = "expected" if expected else "unexpected",
+        command = ctx.command.name if ctx.command else ""
+    )
+
     if expected:
         logMsg = f"ERROR: {str(e)}"
         msg = f"```ERROR: {str(e)}```"
@@ -231,14 +737,31 @@ def commandHelpEmbed(command, shortExplanation, examples):
 
     return embed
 
-# Configures logger.
 a_logger = logging.getLogger()
-a_logger.setLevel(logging.INFO)
-output_file_handler = logging.FileHandler("../../logs/log " +
-    datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S") + ".txt", 'w', 'utf-8')
-stdout_handler = logging.StreamHandler(sys.stdout)
-a_logger.addHandler(output_file_handler)
-a_logger.addHandler(stdout_handler)
-
-# Runs the bot.
-client.run(TOKEN)
+
+# Reads the settings, sets up logging and runs the bot.
+# Nothing happens on import, so the other modules and tools can import this one cheaply.
+def main():
+    global PREFIX, diskCache, logHandler
+
+    with open(TOKEN_FILE, "r") as file:
+        token = file.read()
+    with open(PREFIX_FILE, "r") as file:
+        PREFIX = file.read()
+
+    # Records get written by a background thread, so logging never waits on the disk.
+    logListener, logHandler = setupLogging(LOG_FILE)
+    diskCache = DiskCache(DISK_CACHE_FILE, maxBytes = DISK_CACHE_MAX_BYTES)
+
+    try:
+        client.run(token)
+    finally:
+        renderPool.shutdown()
+
+        # Background writes can still be queued once the event loop is gone, so they get finished first.
+        diskExecutor.shutdown(wait = True)
+        diskCache.close()
+        logListener.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import PIL
+from PIL import Image, features
+from cd import CD
+from draw import Draw, encodeImage, ENCODE_PROFILES
+from node import Graph
+from limits import LARGE_LIMITS, MAX_LEN
+from coxeter import classifyGraph, coxeterMatrix, totalOrder, GROUP_CACHE
+from cosets import CosetTable
+from gram import classifyBatch, classifyStream
+from ir import DiagramIR
+from testHelpers import pixelDiff, branchingDiagram
+
+# Times a function, returns the best time per call in seconds.
+def bestTime(function, repeat = 5, number = 1):
+    return min(timeit.repeat(function, repeat = repeat, number = number)) / number
+
+# Parse time should grow linearly with the diagram length.
+def benchmarkParse(lengths = (250, 500, 1000, 2000, 4000, 8000)):
+    print("Parse time (CD.toGraph):")
+    print(f"{'nodes':>8} {'chars':>8} {'ms':>10} {'µs/node':>10}")
+
+    for length in lengths:
+        diagram = "x" + "3o" * (length - 1)
+        time = bestTime(lambda: CD(diagram, LARGE_LIMITS).toGraph())
+        print(f"{length:>8} {len(diagram):>8} {time * 1e3:>10.2f} {time * 1e6 / length:>10.2f}")
+
+# Large-diagram mode should scale linearly from parsing to drawing.
+def benchmarkLarge(lengths = (500, 1000, 2000, 4000)):
+    print("Large-diagram mode (parse, layout and draw):")
+    print(f"{'nodes':>8} {'size':>12} {'ms':>10} {'µs/node':>10}")
+
+    for length in lengths:
+        diagram = "x" + "3o" * (length - 1)
+        size = Draw(CD(diagram, LARGE_LIMITS).toGraph(), LARGE_LIMITS).size()
+        time = bestTime(lambda: Draw(CD(diagram, LARGE_LIMITS).toGraph(), LARGE_LIMITS).draw(), repeat = 3)
+        print(f"{length:>8} {f'{size[0]}x{size[1]}':>12} {time * 1e3:>10.2f} {time * 1e6 / length:>10.2f}")
+
+# Compares drawing at the final resolution with drawing at full size and resizing, by time per render.
+# test_render.py checks that both look the same.
+def benchmarkRenderModes(diagrams = (
+    "x3o3o", "x4o3o3o3o", "x4x4x4x4x4*a *a4*c4*e4*b4*d4*a x4x", "*-c3x3x3x o3o3o3o3o", "x" + "3o" * 99
+), modes = (('resize', 1), ('direct', 1), ('direct', 2), ('direct', 3))):
+    print("Render modes (ms per render):")
+    print(f"{'diagram':>20} " + " ".join(f"{f'{mode}x{supersample}':>12}" for mode, supersample in modes))
+
+    for diagram in diagrams:
+        graph = CD(diagram).toGraph()
+        row = []
+
+        for mode, supersample in modes:
+            time = bestTime(lambda: Draw(graph, mode = mode, supersample = supersample).draw())
+            row.append(f"{time * 1e3:>12.2f}")
+
+        print(f"{diagram[:20]:>20} " + " ".join(row))
+
+# Compares stamping node sprites with drawing each node shape by shape, by time per render.
+# test_render.py checks that both look the same.
+def benchmarkNodeSprites(diagrams = (
+    "x3o3o", "s3s4o3x", "(-a)3(5/2)4(7)3s3ß q3f4u", "x" + "3o" * 99, "x" + "4q" * 50, "s" + "3ß" * 99
+)):
+    print("Node sprites (ms per render):")
+    print(f"{'diagram':>20} {'shapes':>10} {'sprites':>10}")
+
+    for diagram in diagrams:
+        graph = CD(diagram).toGraph()
+        shapes = bestTime(lambda: Draw(graph, sprites = False).draw())
+        sprites = bestTime(lambda: Draw(graph).draw())
+        print(f"{diagram[:20]:>20} {shapes * 1e3:>10.2f} {sprites * 1e3:>10.2f}")
+
+# Compares the tree layout with the polygon fallback, by image area and render time.
+def benchmarkTreeLayout(diagrams = (
+    "*-c3x3x3x o3o3o3o3o", "o3o3o3o3o3o *c3o3o *d3o *b3o3o3o *a3o", "x3x3x3*a3o3o *b3o *c3o4o",
+    branchingDiagram(15), branchingDiagram(24, every = 2, branch = 1)
+)):
+    print("Tree layout against polygon fallback (image area in megapixels, ms per render):")
+    print(f"{'diagram':>20} {'nodes':>6} {'polygon':>16} {'tree':>16}")
+
+    for diagram in diagrams:
+        graph = CD(diagram).toGraph()
+        row = []
+
+        for layout in ('polygon', 'tree'):
+            image = Draw(graph, layout = layout).draw()
+            time = bestTime(lambda: Draw(graph, layout = layout).draw())
+            row.append(f"{f'{image.size[0] * image.size[1] / 1e6:.3f} / {time * 1e3:.2f}':>16}")
+
+        print(f"{diagram[:20]:>20} {len(graph):>6} " + " ".join(row))
+
+# Group classification should take linear time, and repeated components should come from the cache.
+def benchmarkGroups(lengths = (250, 1000, 4000, 10000)):
+    print("Group classification (classifyGraph):")
+    print(f"{'nodes':>8} {'chain µs/node':>14} {'cold D µs/node':>15} {'repeated A3 µs/node':>20}")
+
+    for length in lengths:
+        chain = CD("x" + "3o" * (length - 1), LARGE_LIMITS).toGraph()
+        branch = CD("x" + "3o" * (length - 2) + " *b3o", LARGE_LIMITS).toGraph()
+        repeated = CD(" ".join(["x3o3o"] * (length // 3)), LARGE_LIMITS).toGraph()
+
+        def cold(graph):
+            GROUP_CACHE.clear()
+            classifyGraph(graph)
+
+        times = [
+            bestTime(lambda: cold(chain)), bestTime(lambda: cold(branch)), bestTime(lambda: classifyGraph(repeated))
+        ]
+        print(f"{length:>8} {times[0] * 1e6 / length:>14.2f} {times[1] * 1e6 / length:>15.2f} {times[2] * 1e6 / length:>20.2f}")
+
+# Builds the graph made out of some of the nodes of a graph, and the edges between them.
+def inducedGraph(graph, nodes):
+    subgraph = Graph()
+    ids = {node: subgraph.addNode(graph.values[node], graph.stringIndices[node]).id for node in nodes}
+
+    for source, target, label in graph.edges():
+        if source in ids and target in ids:
+            subgraph.link(ids[source], ids[target], label)
+
+    return subgraph
+
+# Coset enumeration speed, checked against the index computed from the group orders.
+# Each case is a diagram and the nodes generating the subgroup.
+def benchmarkCosets(cases = (
+    ("x5o3o3o", ()), ("x4o3o3o3o3o", ()), ("x3o3o3o3o *c3o", ()), ("x3o3o3o3o3o *c3o", (0, 1, 2, 3, 4, 6)),
+    ("x3o3o3o3o3o *c3o", (0, 1, 2)), ("x3o3o3o3o3o *c3o", (0, 1)), ("x3o3o3o3o3o3o *c3o", (0, 1, 2, 3, 4, 5, 7))
+)):
+    print("Coset enumeration (index, cosets defined, seconds, thousands of cosets per second):")
+
+    for diagram, subgroup in cases:
+        graph = CD(diagram).toGraph()
+        matrix = coxeterMatrix(graph)
+
+        # The subgroup is generated by some nodes, so its order is the one of their diagram.
+        order = totalOrder(group for _, group in classifyGraph(graph))
+        subgroupOrder = totalOrder(group for _, group in classifyGraph(inducedGraph(graph, subgroup)))
+
+        table = CosetTable(matrix, subgroup)
+        start = time.perf_counter()
+        index = table.enumerate()
+        seconds = time.perf_counter() - start
+
+        status = "" if index * subgroupOrder == order else " WRONG"
+        print(
+            f"{diagram[:20]:>20} {str(subgroup)[:20]:>20} {index:>10} {table.count:>10} "
+            f"{seconds:>8.2f} {table.count / seconds / 1e3:>8.1f}{status}"
+        )
+
+# Builds a random linear diagram, with labels picked from a few common ones.
+def randomDiagram(nodes, generator, labels = ("3", "3", "3", "4", "5", "6", "∞")):
+    return "x" + "".join(generator.choice(labels) + "o" for _ in range(nodes - 1))
+
+# Compares classifying diagrams one by one against classifying them in batches, and checks that the results
+# agree with classifyGraph: finite groups are the ones with positive definite Gram matrices.
+def benchmarkGram(sizes = (3, 4, 6, 8), count = 2000):
+    generator = random.Random(0)
+    print("Gram matrix classification (µs per diagram, one by one and streamed):")
+
+    for size in sizes:
+        graphs = [CD(randomDiagram(size, generator)).toGraph() for _ in range(count)]
+
+        single = bestTime(lambda: [classifyBatch([graph]) for graph in graphs], repeat = 3)
+        streamed = bestTime(lambda: list(classifyStream(graphs)), repeat = 3)
+
+        wrong = sum(
+            (result.kind == 'finite') != all(group.finite for _, group in classifyGraph(graph))
+            for graph, result in zip(graphs, classifyStream(graphs))
+        )
+
+        status = "" if wrong == 0 else f" WRONG ({wrong})"
+        print(f"{size:>8} {single * 1e6 / count:>10.1f} {streamed * 1e6 / count:>10.1f}{status}")
+
+# Compares shipping parsed diagrams as pickled graphs against shipping them as IRs.
+def benchmarkIR(lengths = (100, 1000, 10000)):
+    print("Parsed diagram transport (pickle bytes, pickle round trip ms, IR bytes, IR round trip ms):")
+
+    for length in lengths:
+        graph = CD("x" + "3o" * (length - 1), LARGE_LIMITS).toGraph()
+        pickled = pickle.dumps(graph)
+        encoded = DiagramIR.fromGraph(graph).toBytes()
+
+        graphTime = bestTime(lambda: pickle.loads(pickle.dumps(graph)))
+        irTime = bestTime(lambda: DiagramIR.fromBytes(DiagramIR.fromGraph(graph).toBytes()).toGraph())
+        print(f"{length:>8} {len(pickled):>10} {graphTime * 1e3:>8.2f} {len(encoded):>10} {irTime * 1e3:>8.2f}")
+
+# Compares image encodings over a few diagrams: total bytes, total ms, and worst mean pixel difference to the drawing.
+def benchmarkEncoding(diagrams = ("x4o3o", "s3s4o3x", "(-a)3(5/2)4(7)3s3ß q3f4u", "x3o3o3o *c3o3o3o3o", "x" + "3o" * 99)):
+    images = [Draw(CD(diagram).toGraph()).draw() for diagram in diagrams]
+    formats = [format for format in ENCODE_PROFILES if format != "WEBP" or features.check("webp")]
+
+    print("Image encoding (total bytes, total ms, worst mean pixel difference):")
+    print(f"{'format':>8} {'colors':>8} {'profile':>10} {'bytes':>10} {'ms':>10} {'diff':>8}")
+
+    for format in formats:
+        for mode in ('rgb', 'gray', 'palette'):
+            for profile in ENCODE_PROFILES[format]:
+                encoded = [encodeImage(image, format, profile, mode) for image in images]
+                seconds = sum(bestTime(lambda: encodeImage(image, format, profile, mode), repeat = 3) for image in images)
+                diff = max(
+                    pixelDiff(image, Image.open(io.BytesIO(data)).convert("RGB")) for image, data in zip(images, encoded)
+                )
+
+                size = sum(len(data) for data in encoded)
+                print(f"{format:>8} {mode:>8} {profile:>10} {size:>10} {seconds * 1e3:>10.2f} {diff:>8.2f}")
+
+# Builds a diagram where every node is linked to every other one, through virtual nodes.
+def completeDiagram(nodes):
+    diagram = "x" + "3o" * (nodes - 1)
+    for i in range(nodes):
+        for j in range(i + 2, nodes):
+            diagram += f" *({i + 1})3*({j + 1})"
+
+    return diagram
+
+# The diagrams the stage benchmark runs on, by name.
+# Covers everyday diagrams, chains near the node limit, dense virtual-node graphs and many components.
+BENCHMARK_CORPUS = {
+    "simple": "x3o3o",
+    "node types": "s3s4o3x",
+    "labels": "(-a)3(5/2)4(7)3s3ß q3f4u",
+    "loop": "x3x3x3*a",
+    "branching": "*-c3x3x3x o3o3o3o3o",
+    "e8": "x3o3o3o *c3o3o3o3o",
+    "chain 50": "x" + "3o" * 49,
+    "chain max": "x" + "4o" * (MAX_LEN - 1),
+    "complete 8": completeDiagram(8),
+    "complete 14": completeDiagram(14),
+    "tree": branchingDiagram(24, every = 2, branch = 1),
+    "components 20": " ".join(["x3o"] * 20),
+    "components max": " ".join(["x"] * MAX_LEN)
+}
+
+# Times each stage of rendering a diagram separately, in milliseconds.
+# The stages are parsing (CD.toGraph), finding the components, laying out (Draw.__init__), drawing and PNG encoding
+# (encodeImage, with the default colors and profile).
+# Each stage only gets the output of the previous one, so none of them is timed twice.
+def stageTimes(diagram, repeat = 5):
+    graph = CD(diagram).toGraph()
+    drawing = Draw(graph)
+    image = drawing.draw()
+
+    def encode():
+        encodeImage(image, "PNG")
+
+    return {
+        "parse": bestTime(lambda: CD(diagram).toGraph(), repeat = repeat) * 1e3,
+        "components": bestTime(graph.components, repeat = repeat) * 1e3,
+        "layout": bestTime(lambda: Draw(graph), repeat = repeat) * 1e3,
+        "draw": bestTime(drawing.draw, repeat = repeat) * 1e3,
+        "encode": bestTime(encode, repeat = repeat) * 1e3
+    }
+
+# Peak memory allocated while rendering a diagram from scratch to PNG, in KiB.
+def peakMemory(diagram):
+    tracemalloc.start()
+    try:
+        Draw(CD(diagram).toGraph()).encode("PNG")
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+# Runs the stage benchmark on a corpus, returns the results as a JSON-compatible dict.
+def benchmarkStages(corpus = BENCHMARK_CORPUS, repeat = 5):
+    stages = ("parse", "components", "layout", "draw", "encode")
+    print("Stages (ms per call, peak memory in KiB):")
+    print(f"{'diagram':>14} {'nodes':>6} " + " ".join(f"{stage:>10}" for stage in stages) + f" {'peak':>10}")
+
+    results = []
+    for name, diagram in corpus.items():
+        # Warms up the font, label and sprite caches, so that the first diagram isn't penalized.
+        Draw(CD(diagram).toGraph()).encode("PNG")
+
+        graph = CD(diagram).toGraph()
+        times = stageTimes(diagram, repeat = repeat)
+        peak = peakMemory(diagram)
+
+        results.append({
+            "name": name,
+            "diagram": diagram,
+            "nodes": len(graph),
+            "edges": len(graph.edgeLabels),
+            "ms": times,
+            "peakKiB": peak
+        })
+        print(f"{name:>14} {len(graph):>6} " + " ".join(f"{times[stage]:>10.3f}" for stage in stages) + f" {peak:>10.1f}")
+
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results
+    }
+
+# Compares two stage benchmark results, as saved by benchmarkStages.
+# Prints the ratio of new to old for each stage, flagging the ones that got slower by more than the tolerance.
+def compareStages(old, new, tolerance = 1.2):
+    oldResults = {result["name"]: result for result in old["results"]}
+    print("Stage comparison (new / old):")
+
+    for result in new["results"]:
+        previous = oldResults.get(result["name"])
+        if previous is None or previous["diagram"] != result["diagram"]:
+            continue
+
+        ratios = {stage: result["ms"][stage] / max(previous["ms"][stage], 1e-6) for stage in result["ms"]}
+        ratios["peak"] = result["peakKiB"] / max(previous["peakKiB"], 1e-6)
+
+        row = " ".join(f"{stage} {ratio:.2f}{'!' if ratio > tolerance else ''}" for stage, ratio in ratios.items())
+        print(f"{result['name']:>14} {row}")
+
+# Times a snippet in a fresh interpreter, started outside of this directory, so that nothing is cached or relative to it.
+# The snippet runs after the setup, and gets timed on its own. Returns its time in seconds, or None if it failed.
+def coldTime(snippet, setup = ""):
+    script = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n"
+        f"{setup}\n"
+        "start = time.perf_counter()\n"
+        f"{snippet}\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd = tempfile.gettempdir(), capture_output = True, text = True)
+
+    if result.returncode != 0:
+        return None
+
+    return float(result.stdout.split()[-1])
+
+# Startup cost: importing each module, and the first render in a fresh process (which loads the fonts).
+# Returns the median times in milliseconds, with None for the modules that can't be imported here.
+def benchmarkStartup(modules = ("cd", "draw", "render", "server", "CDBot"), repeat = 5):
+    print("Startup (ms, median of fresh processes):")
+    results = {}
+
+    tasks = [(f"import {module}", f"import {module}", "") for module in modules]
+    tasks.append((
+        "first render", "Draw(CD('x4o3o').toGraph()).encode('PNG')", "from cd import CD\nfrom draw import Draw"
+    ))
+
+    for name, snippet, setup in tasks:
+        times = [coldTime(snippet, setup) for _ in range(repeat)]
+
+        if None in times:
+            results[name] = None
+            print(f"{name:>16} {'failed':>10}")
+        else:
+            results[name] = statistics.median(times) * 1e3
+            print(f"{name:>16} {results[name]:>10.1f}")
+
+    return results
+
+# Usage: python benchmark.py [output.json [baseline.json]]
+# With an output path, only runs the stage benchmark and saves its results there.
+# With a baseline, also compares the results against it.
+if __name__ == "__main__" and len(sys.argv) > 1:
+    results = benchmarkStages()
+    results["startup"] = benchmarkStartup()
+    with open(sys.argv[1], "w") as file:
+        json.dump(results, file, indent = 2, ensure_ascii = False)
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as file:
+            compareStages(json.load(file), results)
+elif __name__ == "__main__":
+    benchmarkParse()
+    benchmarkLarge()
+    benchmarkRenderModes()
+    benchmarkNodeSprites()
+    benchmarkTreeLayout()
+    benchmarkStages()
+    benchmarkStartup()
+    benchmarkGroups()
+    benchmarkCosets()
+    benchmarkGram()
+    benchmarkIR()
+    benchmarkEncoding()
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+# A bounded least-recently-used cache.
+# Evicts the oldest entries once either the entry count or the total size goes over its limit.
+class LRUCache:
+    # Class constructor.
+    # sizeOf measures a single value, and is only used if maxBytes is set.
+    def __init__(self, maxItems, maxBytes = None, sizeOf = len):
+        self.maxItems = maxItems
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+
+        # Total size of the stored values.
+        self.bytes = 0
+
+        # Lookup counters.
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    # Gets a value from the cache, or None if it's not there.
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return entry[0]
+
+    # Stores a value in the cache, evicting old values if necessary.
+    def put(self, key, value):
+        size = self.sizeOf(value) if self.maxBytes is not None else 0
+
+        # Values that could never fit aren't stored at all.
+        if self.maxBytes is not None and size > self.maxBytes:
+            return
+
+        with self.__lock:
+            old = self.__entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+
+            self.__entries[key] = (value, size)
+            self.bytes += size
+
+            while len(self.__entries) > self.maxItems or (
+                self.maxBytes is not None and self.bytes > self.maxBytes
+            ):
+                _, (_, oldSize) = self.__entries.popitem(last = False)
+                self.bytes -= oldSize
+
+    # Removes every value from the cache.
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.bytes = 0
+
+    # Fraction of lookups that were hits.
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
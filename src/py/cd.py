@@ -1,10 +1,7 @@
 import re
-from node import Node, Graph
-import sys
-import math
+from node import Graph
 from cdError import CDError
-
-MAX_LEN = 100 # Hardcoded node limit.
+from limits import DEFAULT_LIMITS
 
 # Stores the index of a node, and its position in the string.
 class NodeRef:
@@ -13,15 +10,15 @@ class NodeRef:
         self.pos = pos
 
 # Various regexes:
-numberRegex = "([1-9][0-9]*)"
-fractionRegex = f"({numberRegex}\/{numberRegex})"
+numberRegex = r"([1-9][0-9]*)"
+fractionRegex = rf"({numberRegex}/{numberRegex})"
 
 # Matches one of the following:
 # A letter or the german eszett.
 # A letter, surrounded by parentheses, with a possible hyphen.
 # A fraction surrounded by parentheses.
 # A number surrounded by parentheses.
-nodeLabels = f"[a-zA-Zß]|\(((-?[a-zA-Z])|{fractionRegex}|{numberRegex})\)"
+nodeLabels = re.compile(rf"[a-zA-Zß]|\(((-?[a-zA-Z])|{fractionRegex}|{numberRegex})\)")
 
 # Matches one of the follwing:
 # A fraction of two natural numbers.
@@ -30,41 +27,36 @@ nodeLabels = f"[a-zA-Zß]|\(((-?[a-zA-Z])|{fractionRegex}|{numberRegex})\)"
 # ∞, possibly followed by '.
 # Ø
 # 3 or more dots in succession. (...)
-edgeLabels = f"({fractionRegex}|{numberRegex}|[a-zA-Z]|∞)'?|Ø|\.\.\.+"
+edgeLabels = re.compile(rf"({fractionRegex}|{numberRegex}|[a-zA-Z]|∞)'?|Ø|\.\.\.+")
 
-virtualNodesLetter = "\*-?[a-z]"
-virtualNodesNumber = f"\*-?[1-9]|\*\(-?{numberRegex}\)"
+virtualNodesLetter = re.compile(r"\*-?[a-z]")
+virtualNodesNumber = re.compile(rf"\*-?[1-9]|\*\(-?{numberRegex}\)")
 
 # Represents a Coxeter Diagram, and contains the necessary methods to parse it.
 class CD:
     # Class initializer.
-    def __init__(self, string):
+    # limits bounds the size of the parsed graph.
+    def __init__(self, string, limits = DEFAULT_LIMITS):
         # The index of the CD at which we're reading.
         self.index = 0
         self.string = string
+        self.limits = limits
 
-    # Tries to match a regex at certain point in the string.
+    # Tries to match a compiled regex at the current point in the string.
+    # Anchors the match there, so the rest of the string is neither copied nor scanned.
     def matchRegex(self, regex):
-        match = re.search(regex, self.string[self.index:])
+        match = regex.match(self.string, self.index)
         if match is None:
             return None
 
-        span = match.span()
-
-        if span[0] != 0:
-            return None
-
-        self.index += span[1] - span[0] - 1
+        self.index = match.end() - 1
 
         return match.group()
 
+    # Reads a node label from a given position.
     def readNode(self):
         return self.matchRegex(nodeLabels)
 
-    # Reads a number from a given position.
-    def readNumber(self):
-        return self.matchRegex(edgeLabels)
-
     # Reads a virtual node from a given position.
     def readVirtualNode(self, nodeType):
         if nodeType == 'letter':
@@ -83,7 +75,7 @@ class CD:
         self.index = 0
         cd = self.string
 
-        nodes = [] # The nodes in the final graph.
+        graph = Graph() # The final graph.
         edges = [] # The node pairs to link in the final graph.
 
         prevNodeRef = None # Most recently read node.
@@ -155,11 +147,11 @@ class CD:
                 if newNodeLabel[0] == '(':
                     newNodeLabel = newNodeLabel[1:-1]
 
-                if len(nodes) > MAX_LEN:
+                if self.limits.nodes is not None and len(graph) > self.limits.nodes:
                     self.error("Diagram too big.")
 
-                newNodeRef = NodeRef(len(nodes), index)
-                nodes.append(Node(newNodeLabel, index))
+                newNodeRef = NodeRef(len(graph), index)
+                graph.addNode(newNodeLabel, index)
 
                 # Toggles the flag to link stuff.
                 linkNodes = True
@@ -175,6 +167,9 @@ class CD:
             # Links two nodes if necessary.
             if linkNodes:
                 if not (prevNodeRef is None or edgeLabel is None):
+                    if self.limits.edges is not None and len(edges) >= self.limits.edges:
+                        self.error("Diagram has too many edges.")
+
                     edges.append({
                         0: newNodeRef,
                         1: prevNodeRef,
@@ -201,7 +196,7 @@ class CD:
                 self.index = edge[i].pos
 
                 index = edge[i].index
-                if index >= len(nodes) or index < -len(nodes):
+                if index >= len(graph) or index < -len(graph):
                     self.error("Virtual node index out of range")
 
             # Attempts to link each pair.
@@ -209,12 +204,12 @@ class CD:
                 # Configures where the error will appear.
                 self.index = max(edge[0].pos, edge[1].pos)
 
-                nodes[edge[0].index].linkTo(nodes[edge[1].index], edge["label"])
+                graph.link(edge[0].index % len(graph), edge[1].index % len(graph), edge["label"])
             except CDError as e:
                 self.error(str(e))
 
         # Returns the graph.
-        return Graph(nodes)
+        return graph
 
     # Raises an error with a certain message.
     # Shows as an "Unexpected error" if dev = True (these are errors that the devs didn't consider).
@@ -0,0 +1,223 @@
+import time
+from array import array
+from cdError import CDError
+from cache import LRUCache
+
+# Todd–Coxeter coset enumeration, for the subgroups of Coxeter groups generated by some of their generators.
+# The group is given by its Coxeter matrix: generators 0, 1, ..., n - 1 are involutions, and
+# (g h)^m[g][h] = 1 for every pair of them. The coset table is a flat array of ints, n entries per coset,
+# with -1 for the entries that aren't known yet. Since every generator is its own inverse, it needs no inverse columns.
+
+MAX_TABLE_BYTES = 64 * 1024 * 1024 # Memory cap for the arrays of a coset enumeration.
+
+# Subgroup indices, by (Coxeter matrix, subgroup generators). Shared by every enumeration in the process.
+INDEX_CACHE_SIZE = 4096
+INDEX_CACHE = LRUCache(maxItems = INDEX_CACHE_SIZE)
+
+# Enumerates the cosets of a subgroup, using the HLT strategy: goes through the cosets in order,
+# scanning every relator at each of them, and defining new cosets to complete the scans.
+class CosetTable:
+    # Class constructor.
+    # matrix is the Coxeter matrix, as a list of rows. Entries off the diagonal are at least 2.
+    # subgroup lists the generators of the subgroup.
+    # maxCosets bounds the number of cosets defined at once, by default so that the table, along with the parent
+    # and closed arrays, fits in MAX_TABLE_BYTES.
+    # timeout is the time in seconds after which the enumeration is given up, or None.
+    def __init__(self, matrix, subgroup, maxCosets = None, timeout = None):
+        self.rank = len(matrix)
+        self.subgroup = subgroup
+        self.deadline = time.perf_counter() + timeout if timeout is not None else None
+
+        # The relators (g h)^m, as words.
+        self.relators = [
+            [g, h] * matrix[g][h] for g in range(self.rank) for h in range(g + 1, self.rank)
+        ]
+
+        # Each coset takes an int per generator in the table, an int in parent, and a byte per relator in closed.
+        bytesPerCoset = 4 * self.rank + 4 + len(self.relators)
+        self.maxCosets = maxCosets or MAX_TABLE_BYTES // bytesPerCoset
+
+        self.table = array('i', [-1] * self.rank)
+
+        # For each coset, the coset it's been merged into, or itself if it's still alive.
+        self.parent = array('i', [0])
+
+        # Cosets defined so far, including dead ones.
+        self.count = 1
+
+        # Number of live cosets.
+        self.alive = 1
+
+        self.blank = array('i', [-1] * self.rank)
+
+        # For each coset, which relators are known to close up at it, one byte per relator.
+        # A relator (g h)^m that closes up at a coset also does at every coset along the way,
+        # so a single scan marks 2m cosets, and the other 2m - 1 don't need to scan it again.
+        self.closed = bytearray(len(self.relators))
+        self.blankClosed = bytes(len(self.relators))
+
+    # Runs the enumeration. Returns the index of the subgroup, which is the number of live cosets.
+    def enumerate(self):
+        for g in self.subgroup:
+            self.scanAndFill(0, [g])
+
+        table, rank, parent, closed = self.table, self.rank, self.parent, self.closed
+        relators = len(self.relators)
+        c = 0
+        while c < self.count:
+            if parent[c] == c:
+                # Goes through the relators that aren't known to close up at this coset yet.
+                base = c * relators
+                r = closed.find(0, base, base + relators)
+
+                while r >= 0:
+                    relator = self.relators[r - base]
+                    self.scanAndFill(c, relator)
+
+                    if parent[c] != c:
+                        break
+
+                    # Marks the cosets along the relator, which now closes up at all of them.
+                    f = c
+                    for g in relator:
+                        closed[f * relators + r - base] = 1
+                        f = table[f * rank + g]
+
+                        if f < 0:
+                            break
+
+                    r = closed.find(0, r + 1, base + relators)
+                else:
+                    row = c * rank
+                    for g in range(rank):
+                        if table[row + g] < 0:
+                            self.define(c, g)
+
+            c += 1
+
+            # Checking the time costs as much as a scan, so it's only done every now and then.
+            if self.deadline is not None and c % 1024 == 0 and time.perf_counter() > self.deadline:
+                raise CDError("Coset enumeration took too long.")
+
+        return self.alive
+
+    # Defines a new coset as the image of a coset under a generator.
+    def define(self, c, g):
+        if self.count >= self.maxCosets:
+            raise CDError(f"Coset enumeration needs more than {self.maxCosets} cosets.")
+
+        d = self.count
+        self.count += 1
+        self.alive += 1
+
+        self.table.extend(self.blank)
+        self.parent.append(d)
+        self.closed.extend(self.blankClosed)
+
+        self.table[c * self.rank + g] = d
+        self.table[d * self.rank + g] = c
+
+    # Scans a relator at a coset from both ends, defining cosets to complete it, and processing the deduction
+    # or coincidence it ends in.
+    def scanAndFill(self, c, word):
+        table, rank = self.table, self.rank
+        f, i = c, 0
+        b, j = c, len(word) - 1
+
+        while True:
+            # Scans forwards as far as the table allows.
+            while i <= j:
+                image = table[f * rank + word[i]]
+                if image < 0:
+                    break
+                f, i = image, i + 1
+
+            if i > j:
+                if f != b:
+                    self.coincidence(f, b)
+                return
+
+            # Scans backwards. Generators are their own inverses.
+            while j >= i:
+                image = table[b * rank + word[j]]
+                if image < 0:
+                    break
+                b, j = image, j - 1
+
+            if j < i:
+                self.coincidence(f, b)
+                return
+
+            # A single gap left: it gets deduced.
+            if i == j:
+                table[f * rank + word[i]] = b
+                table[b * rank + word[i]] = f
+                return
+
+            self.define(f, word[i])
+
+    # Gets the live coset a coset has been merged into.
+    def find(self, c):
+        parent = self.parent
+
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+
+        return c
+
+    # Merges two cosets, the higher one into the lower one. Queues the dead one.
+    def merge(self, a, b, queue):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+
+        if a > b:
+            a, b = b, a
+
+        self.parent[b] = a
+        self.alive -= 1
+        queue.append(b)
+
+    # Processes the coincidence of two cosets, and all the ones it leads to.
+    def coincidence(self, a, b):
+        table, rank = self.table, self.rank
+        queue = []
+        self.merge(a, b, queue)
+
+        for dead in queue:
+            base = dead * rank
+
+            # Moves the entries of the dead coset over to its replacement.
+            for g in range(rank):
+                image = table[base + g]
+                if image < 0:
+                    continue
+
+                table[image * rank + g] = -1
+                table[base + g] = -1
+
+                live, liveImage = self.find(dead), self.find(image)
+
+                if table[live * rank + g] >= 0:
+                    self.merge(liveImage, table[live * rank + g], queue)
+                elif table[liveImage * rank + g] >= 0:
+                    self.merge(live, table[liveImage * rank + g], queue)
+                else:
+                    table[live * rank + g] = liveImage
+                    table[liveImage * rank + g] = live
+
+# Gets the index of the subgroup of a Coxeter group generated by some of its generators.
+# Cached by Coxeter matrix and subgroup, see CosetTable for the arguments.
+def cosetIndex(matrix, subgroup, maxCosets = None, timeout = None):
+    matrix = tuple(tuple(row) for row in matrix)
+    subgroup = tuple(sorted(set(subgroup)))
+    key = (matrix, subgroup)
+
+    index = INDEX_CACHE.get(key)
+
+    if index is None:
+        index = CosetTable(matrix, subgroup, maxCosets, timeout).enumerate()
+        INDEX_CACHE.put(key, index)
+
+    return index
@@ -0,0 +1,305 @@
+import math
+import time
+from cache import LRUCache
+from cdError import CDError
+from cosets import cosetIndex
+
+# Classification of the Coxeter groups of diagrams.
+# Each connected component of a diagram generates an irreducible Coxeter group. The finite ones are
+# A_n, B_n, D_n, E6, E7, E8, F4, H3, H4 and I2(p), and they're told apart by the degrees and edge labels
+# of their component, which takes linear time.
+
+# Orders of the exceptional groups.
+EXCEPTIONAL_ORDERS = {
+    'E6': 51840,
+    'E7': 2903040,
+    'E8': 696729600,
+    'F4': 1152,
+    'H3': 120,
+    'H4': 14400
+}
+
+# Element counts are only computed for diagrams up to this many nodes, since they go through every subset of nodes.
+ELEMENT_MAX_RANK = 10
+
+# Nodes that don't stand for a Wythoffian construction, so element counts don't work for them.
+SNUB_NODES = ('s', '+')
+
+# Classified components, by canonical key. Shared by every diagram in the process.
+GROUP_CACHE_SIZE = 1024
+GROUP_CACHE = LRUCache(maxItems = GROUP_CACHE_SIZE)
+
+# The Coxeter group generated by a component.
+class CoxeterGroup:
+    # Class constructor.
+    # name is the type, like 'A3' or 'I2(5)', or None if the group is infinite or unknown.
+    # order is the group order, math.inf if it's infinite, or None if it can't be told from the diagram.
+    def __init__(self, name, rank, order):
+        self.name = name
+        self.rank = rank
+        self.order = order
+
+    # Whether the group is finite, or None if it's unknown.
+    @property
+    def finite(self):
+        if self.order is None:
+            return None
+
+        return self.order != math.inf
+
+    def __str__(self):
+        if self.order is None:
+            return "unknown"
+        elif self.order == math.inf:
+            return "infinite"
+        else:
+            return f"{self.name}, order {self.order:,}"
+
+    def __repr__(self):
+        return f"CoxeterGroup({self.name!r}, {self.rank}, {self.order!r})"
+
+# Gets the Coxeter group order an edge label stands for.
+# Fractions p/q and primes (n' is n/(n-1)) give the same group as p and n, since they only change the polytope.
+# Returns math.inf for ∞, and None for labels without a fixed order, like letters and dotted lines.
+def labelOrder(label):
+    label = label.rstrip("'")
+
+    if label == "∞":
+        return math.inf
+
+    numerator = label.partition("/")[0]
+    return int(numerator) if numerator.isdigit() else None
+
+# The order of the group generated by several components, or None if any of them is unknown.
+def totalOrder(groups):
+    order = 1
+
+    for group in groups:
+        if group.order is None:
+            return None
+
+        order *= group.order
+
+    return order
+
+# Classifies every connected component of a graph.
+# Returns a list of (component, group) pairs, with components as lists of node ids.
+def classifyGraph(graph):
+    components = ([node.id for node in component] for component in graph.components())
+    return [(ids, classify(graph, ids)) for ids in components]
+
+# Classifies a connected component, given as a list of node ids.
+def classify(graph, ids):
+    adjacency = graph.adjacency
+    labels = graph.labels
+    n = len(ids)
+
+    # The orders of the edges around each node, by neighbor.
+    orders = {}
+    for node in ids:
+        orders[node] = {neighbor: labelOrder(labels[label]) for neighbor, label in adjacency[node].items()}
+
+    edgeOrders = [order for node in ids for order in orders[node].values()]
+    if None in edgeOrders:
+        return CoxeterGroup(None, n, None)
+
+    group = classifyOrders(orders, ids, edgeOrders)
+
+    # Fractional labels can make a finite group out of what would otherwise be an infinite one,
+    # like the great dodecahedron x5o5/2o with the symmetry of H3. That isn't told apart here.
+    if group.order == math.inf and any(
+        "/" in labels[label] or "'" in labels[label] for node in ids for label in adjacency[node].values()
+    ):
+        return CoxeterGroup(None, n, None)
+
+    return group
+
+# Classifies a connected component, given the orders of its edges around each node, and all of them in a list.
+def classifyOrders(orders, ids, edgeOrders):
+    n = len(ids)
+
+    # Any cycle, ∞ edge, node of degree 4 or more, or second branch node makes the group infinite.
+    branches = [node for node in ids if len(orders[node]) >= 3]
+    if (
+        len(edgeOrders) // 2 != n - 1 or math.inf in edgeOrders or
+        len(branches) > 1 or any(len(orders[node]) > 3 for node in branches)
+    ):
+        return CoxeterGroup(None, n, math.inf)
+
+    # What's left are paths and trees with a single branch node.
+    # The edge orders along them, read in a fixed direction, make a canonical key.
+    if branches:
+        center = branches[0]
+        arms = sorted(
+            (armOrders(orders, center, neighbor) for neighbor in orders[center]), key = lambda arm: (len(arm), arm)
+        )
+        key = ('branch', tuple(arms))
+    else:
+        path = armOrders(orders, None, next(node for node in ids if len(orders[node]) <= 1))
+        key = ('path', min(path, path[::-1]))
+
+    group = GROUP_CACHE.get(key)
+
+    if group is None:
+        group = classifyBranch(key[1]) if branches else classifyPath(key[1])
+        GROUP_CACHE.put(key, group)
+
+    return group
+
+# Classifies a tree with a single branch node, given the edge orders along its three arms, shortest first.
+# Only the D and E families branch, with all edges labeled 3.
+def classifyBranch(arms):
+    n = sum(len(arm) for arm in arms) + 1
+    p, q, r = (len(arm) for arm in arms)
+
+    if any(m != 3 for arm in arms for m in arm):
+        return CoxeterGroup(None, n, math.inf)
+
+    if p == 1 and q == 1:
+        return CoxeterGroup(f'D{n}', n, 2 ** (n - 1) * math.factorial(n))
+
+    if p == 1 and q == 2 and r <= 4:
+        name = f'E{n}'
+        return CoxeterGroup(name, n, EXCEPTIONAL_ORDERS[name])
+
+    return CoxeterGroup(None, n, math.inf)
+
+# Classifies a path, given the edge orders from one end to the other.
+def classifyPath(path):
+    n = len(path) + 1
+
+    if n == 1:
+        return CoxeterGroup('A1', 1, 2)
+
+    if n == 2:
+        m = path[0]
+        if m == 3:
+            return CoxeterGroup('A2', 2, 6)
+        elif m == 4:
+            return CoxeterGroup('B2', 2, 8)
+        else:
+            return CoxeterGroup(f'I2({m})', 2, 2 * m)
+
+    # Puts the unusual edge, if any, towards the start.
+    if path[-1] != 3:
+        path = path[::-1]
+
+    others = [m for m in path if m != 3]
+
+    if not others:
+        return CoxeterGroup(f'A{n}', n, math.factorial(n + 1))
+
+    if len(others) > 1:
+        return CoxeterGroup(None, n, math.inf)
+
+    if path[0] == 4:
+        return CoxeterGroup(f'B{n}', n, 2 ** n * math.factorial(n))
+
+    if path[0] == 5 and n <= 4:
+        name = f'H{n}'
+        return CoxeterGroup(name, n, EXCEPTIONAL_ORDERS[name])
+
+    if n == 4 and path[1] == 4:
+        return CoxeterGroup('F4', 4, EXCEPTIONAL_ORDERS['F4'])
+
+    return CoxeterGroup(None, n, math.inf)
+
+# The edge orders along a chain of nodes, starting at a node and walking away from the previous one (or None),
+# until the chain ends or reaches a branch node. Returns them as a tuple, including the edge to the previous node.
+# Used for the arms of a branch node, and for whole paths, starting from an end.
+def armOrders(orders, prev, node):
+    arm = [orders[node][prev]] if prev is not None else []
+
+    while len(orders[node]) <= 2:
+        following = [neighbor for neighbor in orders[node] if neighbor != prev]
+        if not following:
+            break
+
+        arm.append(orders[node][following[0]])
+        prev, node = node, following[0]
+
+    return tuple(arm)
+
+# Gets the Coxeter matrix of a graph, as a list of rows. Nodes that aren't linked get a 2.
+def coxeterMatrix(graph):
+    n = len(graph)
+    matrix = [[1 if i == j else 2 for j in range(n)] for i in range(n)]
+
+    for source, target, label in graph.edges():
+        order = labelOrder(label)
+        if order is None:
+            raise CDError(f"Edge label {label} has no fixed order.")
+
+        matrix[source][target] = matrix[target][source] = order
+
+    return matrix
+
+# Counts the elements of the polytope of a diagram, by dimension, from the vertices up to the facets.
+# Uses Wythoff's construction: the k-faces come in one orbit for each set S of k nodes where every connected
+# piece of S has a ringed node. The stabilizer of one of them is generated by S, together with the unringed nodes
+# that aren't in S or linked to it, so the orbit's size is the index of that subgroup, found by coset enumeration.
+# timeout is the time in seconds after which counting is given up, or None.
+def elementCounts(graph, timeout = None):
+    n = len(graph)
+    deadline = time.perf_counter() + timeout if timeout is not None else None
+
+    if n > ELEMENT_MAX_RANK:
+        raise CDError(f"Element counts only work for diagrams of up to {ELEMENT_MAX_RANK} nodes.")
+
+    if any(value in SNUB_NODES for value in graph.values):
+        raise CDError("Element counts don't work for snub nodes.")
+
+    ringedMask = sum(1 << node for node in range(n) if graph.values[node] != 'o')
+    if ringedMask == 0:
+        raise CDError("Element counts need a ringed node.")
+
+    for _, group in classifyGraph(graph):
+        if group.finite is None:
+            raise CDError("Element counts need a group that's known to be finite.")
+        elif not group.finite:
+            raise CDError("Element counts only work for finite groups.")
+
+    matrix = coxeterMatrix(graph)
+    neighborMasks = [sum(1 << neighbor for neighbor in graph.adjacency[node]) for node in range(n)]
+    counts = [0] * n
+
+    for subset in range(1 << n):
+        k = bin(subset).count('1')
+        if k == n or not everyPieceRinged(subset, ringedMask, neighborMasks):
+            continue
+
+        # The unringed nodes that aren't in the subset, and aren't linked to it.
+        linked = 0
+        for node in range(n):
+            if subset >> node & 1:
+                linked |= neighborMasks[node]
+
+        stabilizer = subset | (((1 << n) - 1) & ~ringedMask & ~subset & ~linked)
+
+        remaining = deadline - time.perf_counter() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            raise CDError("Counting elements took too long.")
+
+        counts[k] += cosetIndex(matrix, [node for node in range(n) if stabilizer >> node & 1], timeout = remaining)
+
+    return counts
+
+# Whether every connected piece of a set of nodes, given as a bitmask, has a ringed node.
+def everyPieceRinged(subset, ringedMask, neighborMasks):
+    reached = subset & ringedMask
+    frontier = reached
+
+    # Spreads out from the ringed nodes, without leaving the subset.
+    while frontier:
+        node = (frontier & -frontier).bit_length() - 1
+        frontier &= frontier - 1
+
+        new = neighborMasks[node] & subset & ~reached
+        reached |= new
+        frontier |= new
+
+    return reached == subset
+
+# Names the elements of each dimension.
+def elementName(dimension):
+    return ("vertices", "edges", "faces", "cells")[dimension] if dimension < 4 else f"{dimension}-faces"
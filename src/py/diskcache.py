@@ -0,0 +1,155 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# How long an entry's access time can go stale before a read refreshes it, in seconds.
+# Saves a write on most hits, at the cost of a coarser LRU order.
+TOUCH_INTERVAL = 60
+
+# Number of entries looked up at a time when evicting.
+EVICT_BATCH = 64
+
+# A persistent cache of rendered diagrams, stored in a SQLite database.
+# Several processes can share the same file: SQLite runs in WAL mode, so readers don't block the writer,
+# and every write is a single transaction, so a crash never leaves a half-written entry behind.
+# Evicts the least recently used entries once the total size goes over maxBytes.
+class DiskCache:
+    # Class constructor.
+    # mmapSize is how much of the database SQLite reads through memory-mapped I/O.
+    def __init__(self, path, maxBytes = 256 * 1024 * 1024, mmapSize = 256 * 1024 * 1024, timeout = 5):
+        self.path = path
+        self.maxBytes = maxBytes
+
+        # Lookup counters.
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        # Shared by whatever threads the cache gets called from, one at a time.
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, timeout = timeout, isolation_level = None, check_same_thread = False)
+
+        with self.__lock:
+            self.__db.execute("PRAGMA journal_mode = WAL")
+            self.__db.execute("PRAGMA synchronous = NORMAL")
+            self.__db.execute(f"PRAGMA mmap_size = {int(mmapSize)}")
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS renders ("
+                "key BLOB PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self.__db.execute("CREATE INDEX IF NOT EXISTS rendersAccessed ON renders (accessed)")
+
+            # The total size of the entries, kept up to date by every write, so that writes don't need to add up
+            # the whole table. Databases from before it existed get it counted once.
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)"
+            )
+            self.__db.execute("INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM renders")
+
+    # Hashes the parts of a key into a fixed-size one.
+    # The parts should include everything the output depends on, like the renderer version and options.
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256("\0".join(str(part) for part in parts).encode('utf-8')).digest()
+
+    # Gets a value from the cache, or None if it's not there.
+    def get(self, key):
+        now = time.time()
+
+        with self.__lock:
+            row = self.__db.execute("SELECT data, accessed FROM renders WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            data, accessed = row
+
+            if now - accessed > TOUCH_INTERVAL:
+                self.__db.execute("UPDATE renders SET accessed = ? WHERE key = ?", (now, key))
+
+            return data
+
+    # Stores a value in the cache, evicting old values if necessary.
+    # Values bigger than the whole cache aren't stored.
+    # Only touches the entries it replaces or evicts, so it takes the same time however big the cache is.
+    def put(self, key, data):
+        if len(data) > self.maxBytes:
+            return
+
+        with self.__lock:
+            db = self.__db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                total = db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+                replaced = db.execute("SELECT size FROM renders WHERE key = ?", (key,)).fetchone()
+                if replaced is not None:
+                    total -= replaced[0]
+
+                db.execute(
+                    "INSERT OR REPLACE INTO renders (key, data, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, data, len(data), time.time())
+                )
+                total += len(data)
+
+                # Drops the least recently used entries until everything fits, going through the index on accessed.
+                # The new entry is the most recent one, and fits on its own, so it never gets dropped.
+                while total > self.maxBytes:
+                    oldest = db.execute(
+                        "SELECT key, size FROM renders ORDER BY accessed LIMIT ?", (EVICT_BATCH,)
+                    ).fetchall()
+
+                    for oldKey, size in oldest:
+                        if total <= self.maxBytes:
+                            break
+
+                        db.execute("DELETE FROM renders WHERE key = ?", (oldKey,))
+                        total -= size
+
+                db.execute("UPDATE totals SET bytes = ? WHERE id = 0", (total,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    # Removes every entry.
+    def clear(self):
+        with self.__lock:
+            db = self.__db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM renders")
+                db.execute("UPDATE totals SET bytes = 0 WHERE id = 0")
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    # Fraction of lookups that were hits.
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    # Number of stored entries.
+    def __len__(self):
+        with self.__lock:
+            return self.__db.execute("SELECT COUNT(*) FROM renders").fetchone()[0]
+
+    # Total size of the stored values.
+    @property
+    def bytes(self):
+        with self.__lock:
+            return self.__db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    # Closes the database.
+    def close(self):
+        with self.__lock:
+            self.__db.close()
@@ -1,11 +1,30 @@
-from PIL import Image, ImageDraw, ImageFont
-from node import Node, Graph
+from PIL import Image, ImageDraw
+import io
+from html import escape
+from ir import DiagramIR
 from cdError import CDError
+from limits import DEFAULT_LIMITS
+from cache import LRUCache
+from layout import isTree, treeLayout, findCycle, cycleLayout, ringLayout, foldLayout
+import fonts
 import math
 
 # Constants:
+
+# Version of the rendered output. Bump it whenever the same diagram would render differently,
+# so that renders cached on disk by older versions stop being used.
+RENDERER_VERSION = 3
+
 SCALE = 0.8
 
+# How the image gets scaled down to its final size:
+# 'resize' draws everything at full size, and then resizes the whole image.
+# 'direct' scales the geometry and fonts, and draws straight at the final size.
+RENDER_MODE = 'direct'
+
+# In 'direct' mode, the image is drawn this many times bigger and then box-filtered down, for anti-aliasing.
+SUPERSAMPLE = 2
+
 NODE_RADIUS = 12
 NODE_BORDER_WIDTH = 4
 
@@ -20,23 +39,134 @@ TEXT_DISTANCE = 20
 
 ELLIPSIS_RADIUS = 3
 
-FONT_NAME = "Lora-regular"
+FONT_NAME = "Lora-Regular"
+SVG_FONT_FAMILY = "Lora, serif"
 FONT_OUTLINE = 2
 
 EDGE_FONT_SIZE = 24
 NODE_FONT_SIZE = 18
 HOLOSNUB_FONT_SIZE = 36
 
-EDGE_FONT = ImageFont.truetype(f"../ttf/{FONT_NAME}.ttf", EDGE_FONT_SIZE, layout_engine = ImageFont.LAYOUT_BASIC)
-NODE_FONT = ImageFont.truetype(f"../ttf/{FONT_NAME}.ttf", NODE_FONT_SIZE, layout_engine = ImageFont.LAYOUT_BASIC)
-HOLOSNUB_FONT = ImageFont.truetype(f"../ttf/{FONT_NAME}.ttf", HOLOSNUB_FONT_SIZE, layout_engine = ImageFont.LAYOUT_BASIC)
+# Gets the diagram font at a given size. Fonts only get loaded once they're first drawn with.
+def getFont(size):
+    return fonts.getFont(FONT_NAME, size)
 
 PADDING = 40
 
+# Outlined labels, shared by every render in the process.
+LABEL_CACHE_SIZE = 1024
+LABEL_CACHE = LRUCache(maxItems = LABEL_CACHE_SIZE)
+
+# Node images, shared by every render in the process.
+NODE_CACHE_SIZE = 256
+NODE_CACHE = LRUCache(maxItems = NODE_CACHE_SIZE)
+
+# Nodes are drawn this many times bigger and scaled down, for anti-aliasing.
+NODE_SUPERSAMPLE = 4
+
+# How images get stored before encoding. Diagrams are black on white, with grey anti-aliasing, so:
+# 'rgb' keeps the 24-bit image as drawn.
+# 'gray' turns it into 8-bit grayscale, which loses nothing.
+# 'palette' also rounds it to PALETTE_LEVELS grey levels, which makes PNGs about half as big and faster to encode.
+IMAGE_MODE = 'palette'
+PALETTE_LEVELS = 16
+
+# Encoder settings by format and profile: 'speed' encodes fastest, 'size' makes the smallest files.
+# Formats without settings here are saved as they are.
+ENCODE_PROFILES = {
+    "PNG": {
+        'speed': {'compress_level': 1},
+        'balanced': {'compress_level': 6},
+        'size': {'optimize': True}
+    },
+    "WEBP": {
+        'speed': {'lossless': True, 'quality': 0, 'method': 2},
+        'balanced': {'lossless': True, 'quality': 80, 'method': 4},
+        'size': {'lossless': True, 'quality': 100, 'method': 6}
+    }
+}
+ENCODE_PROFILE = 'balanced'
+
+# The settings besides the diagram that rendered output depends on, for cache keys.
+# Read when called, like the defaults of the functions below, so that settings changed at runtime are picked up.
+def renderSettings():
+    return (RENDERER_VERSION, RENDER_MODE, SUPERSAMPLE, IMAGE_MODE, PALETTE_LEVELS, ENCODE_PROFILE)
+
+# Reduces an image to grayscale, or to a palette of evenly spaced grey levels. See IMAGE_MODE.
+# mode and levels default to IMAGE_MODE and PALETTE_LEVELS.
+def reduceColors(image, mode = None, levels = None):
+    mode = IMAGE_MODE if mode is None else mode
+    levels = PALETTE_LEVELS if levels is None else levels
+
+    if mode == 'rgb':
+        return image
+
+    gray = image.convert('L')
+    if mode == 'gray':
+        return gray
+
+    # Maps each grey to the index of the closest level, and gives the palette those levels.
+    indices = gray.point([round(value * (levels - 1) / 255) for value in range(256)])
+    reduced = Image.frombytes('P', indices.size, indices.tobytes())
+    reduced.putpalette([round(i * 255 / (levels - 1)) for i in range(levels) for _ in range(3)])
+    return reduced
+
+# Encodes an image, returns the bytes of the file.
+# PNGs and WebPs get their colors reduced, and the settings of an encoding profile. params override them.
+# profile, mode and levels default to ENCODE_PROFILE, IMAGE_MODE and PALETTE_LEVELS.
+def encodeImage(image, format = "PNG", profile = None, mode = None, levels = None, **params):
+    format = format.upper()
+    profile = ENCODE_PROFILE if profile is None else profile
+    levels = PALETTE_LEVELS if levels is None else levels
+    profiles = ENCODE_PROFILES.get(format)
+
+    if profiles is not None:
+        if profile not in profiles:
+            raise CDError(f"Encoding profile {profile} not recognized.")
+
+        image = reduceColors(image, mode, levels)
+        params = {**profiles[profile], **params}
+
+        # Palettes of up to 16 colors fit in 4 bits per pixel.
+        if format == "PNG" and image.mode == 'P' and levels <= 16:
+            params.setdefault('bits', 4)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format, **params)
+    return buffer.getvalue()
+
+# Formats a coordinate for SVG output, with at most two decimals.
+def svgNumber(x):
+    return f"{x:.2f}".rstrip('0').rstrip('.')
+
 # Draws a graph.
 class Draw:
     # Class constructor.
-    def __init__(self, graph):
+    # limits bounds the size of the drawn image, and sets the row width for large diagrams.
+    # mode and supersample configure how the image is scaled, and default to RENDER_MODE and SUPERSAMPLE.
+    # sprites stamps pre-rendered node images, instead of drawing each node shape by shape.
+    # layout is 'tree' to lay out branching components as trees, or 'polygon' to always use the polygon fallback.
+    # graph can also be a DiagramIR, which gets turned back into a graph.
+    def __init__(
+        self, graph, limits = DEFAULT_LIMITS, mode = None, supersample = None,
+        sprites = True, layout = 'tree'
+    ):
+        if isinstance(graph, DiagramIR):
+            graph = graph.toGraph()
+
+        self.limits = limits
+        self.layout = layout
+        self.graph = graph
+        self.mode = RENDER_MODE if mode is None else mode
+        self.supersample = SUPERSAMPLE if supersample is None else supersample
+        self.sprites = sprites
+
+        # The factor from layout coordinates to image pixels, set when drawing.
+        self.scale = 1
+
+        # The index of each node in the nodes array, by node id.
+        self.arrayIndex = [None] * len(graph)
+
         # Variables to see where the next node goes.
         # Provisional, probably.
         self.x, self.y = 0, 0
@@ -54,13 +184,39 @@ class Draw:
         return (self.x, self.y)
 
     # Adds a new component to the diagram.
-    # Currently, just puts everything in a straight line.
-    # TODO: make this draw the trees prettily.
+    # Lines are drawn straight, trees as tidy trees, and cycles with trees hanging off them as polygons.
+    # Anything else falls back to a regular polygon.
+    # Trees and plain cycles wider than the row width get folded to fit, like long lines.
     def add(self, component):
         straight, firstNode = self.isStraight(component)
+        layout = None
+
+        if not straight and self.layout == 'tree':
+            ids = [node.id for node in component]
+            columns = self.columns()
+
+            if isTree(self.graph, ids):
+                layout = treeLayout(self.graph, ids)
+                if columns is not None and max(xy[0] for _, xy, _ in layout) > columns:
+                    layout = foldLayout(self.graph, layout, columns)
+            else:
+                cycle = findCycle(self.graph, ids)
+                if cycle is not None:
+                    # The polygon of a plain cycle is 1 / sin(π/n) node spacings wide.
+                    wide = columns is not None and 1 / math.sin(math.pi / len(cycle)) > columns
+
+                    if wide and len(cycle) == len(ids):
+                        layout = foldLayout(self.graph, ringLayout(cycle), columns)
+                    else:
+                        layout = cycleLayout(self.graph, cycle)
 
         if straight:
             drawingMode = 'line'
+            self.wrap(width = (len(component) - 1) * NODE_SPACING, above = 0)
+
+            startX = self.x
+            rightX = self.x
+            self.direction = 1
 
             self.addNode(firstNode, self.currentPos(), drawingMode)
             prevNode = firstNode
@@ -69,8 +225,9 @@ class Draw:
                 node = firstNode.neighbors[0]
 
                 while node.degree() != 1:
-                    self.x += NODE_SPACING
-                    self.addNode(node, self.currentPos(), drawingMode)
+                    edgeMode = self.advance(startX)
+                    self.addNode(node, self.currentPos(), edgeMode)
+                    rightX = max(rightX, self.x)
 
                     if node.neighbors[0] is prevNode:
                         prevNode = node
@@ -79,13 +236,27 @@ class Draw:
                         prevNode = node
                         node = node.neighbors[0]
 
-                self.x += NODE_SPACING
-                self.addNode(node, self.currentPos(), drawingMode)
+                edgeMode = self.advance(startX)
+                self.addNode(node, self.currentPos(), edgeMode)
+                rightX = max(rightX, self.x)
+
+            self.x = rightX
+        elif layout is not None:
+            xs = [xy[0] * NODE_SPACING for _, xy, _ in layout]
+            ys = [xy[1] * NODE_SPACING for _, xy, _ in layout]
+            self.wrap(width = max(xs) - min(xs), above = -min(ys))
+
+            originX = self.x - min(xs)
+            for (id, xy, drawingMode), x, y in zip(layout, xs, ys):
+                self.addNode(self.graph.array[id], (originX + x, self.y + y), drawingMode)
+
+            self.x += max(xs) - min(xs)
         else:
             drawingMode = 'polygon'
 
             n = len(component)
             radius = NODE_SPACING / (2 * math.sin(math.pi / n))
+            self.wrap(width = 2 * radius, above = radius)
             self.x += radius
 
             angle = math.pi / 2 + math.pi / n
@@ -100,6 +271,36 @@ class Draw:
 
         self.x += COMPONENT_SPACING
 
+    # The number of node spacings that fit in the row width, or None if rows don't wrap.
+    def columns(self):
+        if self.limits.rowWidth is None:
+            return None
+
+        return int(self.limits.rowWidth // NODE_SPACING)
+
+    # Starts a new row if a component of a given width doesn't fit in the current one.
+    # above is how far the component reaches above the current position.
+    def wrap(self, width, above):
+        rowWidth = self.limits.rowWidth
+
+        if rowWidth is not None and self.x > 0 and self.x + width > rowWidth:
+            self.x = 0
+            self.y = self.maxY + COMPONENT_SPACING + above
+
+    # Moves to the position of the next node in a line, returns the drawing mode of the edge leading to it.
+    # Lines longer than the row width snake back and forth.
+    def advance(self, startX):
+        rowWidth = self.limits.rowWidth
+        x = self.x + self.direction * NODE_SPACING
+
+        if rowWidth is not None and not startX <= x <= startX + rowWidth:
+            self.y += NODE_SPACING
+            self.direction = -self.direction
+            return 'turn'
+
+        self.x = x
+        return 'line'
+
     # Adds a node in a particular position.
     def addNode(self, node, coords, drawingMode):
         # Adds the node.
@@ -109,24 +310,21 @@ class Draw:
         }
         self.updateBoundingBox(coords)
 
-        # Adds the arrayIndex property to the node, storing its index in the array.
-        node.arrayIndex = len(self.nodes)
+        # Stores the index of the node in the array.
+        self.arrayIndex[node.id] = len(self.nodes)
         self.nodes.append(newNode)
 
         # Adds edges.
-        i = 0
-        for neighbor in node.neighbors:
+        for neighbor, label in self.graph.adjacency[node.id].items():
             # Guarantees no duplicates.
-            if hasattr(neighbor, 'arrayIndex'):
+            if self.arrayIndex[neighbor] is not None:
                 self.edges.append({
-                    0: neighbor.arrayIndex,
-                    1: node.arrayIndex,
-                    "label": node.edgeLabels[i],
+                    0: self.arrayIndex[neighbor],
+                    1: self.arrayIndex[node.id],
+                    "label": self.graph.labels[label],
                     "drawingMode": drawingMode
                 })
 
-            i += 1
-
     # A connected graph is a line graph iff every vertex has degree ≤ 2,
     # and at least one vertex has degree 1.
     # Returns whether the graph is a line graph, and if so, its first node (in string order).
@@ -151,7 +349,14 @@ class Draw:
 
     # Transforms node coordinates to image coordinates.
     def transformCoords(self, coords):
-        return (coords[0] - self.minX + PADDING, coords[1] - self.minY + PADDING)
+        return (
+            (coords[0] - self.minX + PADDING) * self.scale,
+            (coords[1] - self.minY + PADDING) * self.scale
+        )
+
+    # Scales a length from layout units to image pixels.
+    def px(self, length):
+        return length * self.scale
 
     # Updates the bounding box of the nodes.
     def updateBoundingBox(self, coords):
@@ -169,34 +374,66 @@ class Draw:
             round(self.maxY - self.minY + 2 * PADDING)
         )
 
+    # Gets the size of the canvas the image gets drawn on, in pixels.
+    # In resize mode, that's the full layout size, which gets scaled down afterwards.
+    # In direct mode, it's the size at the given scale, times the supersampling factor.
+    def canvasSize(self, mode, supersample, scale = SCALE):
+        width, height = self.size()
+
+        if mode == 'resize':
+            return (width, height)
+
+        return (round(width * scale) * supersample, round(height * scale) * supersample)
+
+    # Whether an image of a given size, in pixels, fits in the pixel limit.
+    def fits(self, size):
+        return self.limits.pixels is None or size[0] * size[1] <= self.limits.pixels
+
+    # Picks how to draw the image, so that its canvas fits in the pixel limit.
+    # Returns the render mode, the supersampling factor and the scale of the final image.
+    # Images that don't fit first give up on supersampling, and then get scaled down, see fitScale.
+    def plan(self):
+        if self.mode not in ('resize', 'direct'):
+            self.error(f"Render mode {self.mode} not recognized.", dev = True)
+
+        if self.fits(self.canvasSize(self.mode, self.supersample)):
+            return self.mode, self.supersample, SCALE
+
+        return 'direct', 1, self.fitScale()
+
+    # Gets the biggest scale, up to SCALE, at which the image fits in the pixel limit.
+    # Raises an error if that's below limits.minScale. Without a minScale, images only get drawn at full scale.
+    def fitScale(self):
+        width, height = self.size()
+        scale = min(SCALE, math.sqrt(self.limits.pixels / (width * height)))
+
+        # Rounding the size up can still go over the limit.
+        while not self.fits(self.canvasSize('direct', 1, scale)):
+            scale *= 0.99
+
+        minScale = SCALE if self.limits.minScale is None else self.limits.minScale
+        if scale < minScale:
+            self.error("Diagram too big to draw.")
+
+        return scale
+
     # Draws the graph.
     def draw(self):
-        self.image = Image.new('RGB', size = self.size(), color = 'white')
-        self.draw = ImageDraw.Draw(self.image)
+        # Checked before allocating anything, against the canvas that actually gets allocated.
+        mode, supersample, scale = self.plan()
+        canvasSize = self.canvasSize(mode, supersample, scale)
+        self.scale = 1 if mode == 'resize' else scale * supersample
+
+        self.image = Image.new('RGB', size = canvasSize, color = 'white')
+        self.canvas = ImageDraw.Draw(self.image)
 
         # Draws the edges.
         for edge in self.edges:
-            node0, node1, label = self.nodes[edge[0]], self.nodes[edge[1]], edge['label']
-
-            # Edge coordinates.
-            edgeXy = (
-                self.transformCoords(node0['xy']),
-                self.transformCoords(node1['xy']),
-            )
-
-            # Text coordinates.
-            textXy = list(map(lambda a, b: (a + b) / 2, edgeXy[0], edgeXy[1]))
-            if edge['drawingMode'] == 'line':
-                textXy[1] += TEXT_DISTANCE
+            label = edge['label']
+            edgeXy, textXy = self.edgeCoords(edge)
 
             # Draws edge.
-            if label == 'Ø':
-                edgeType = 'dotted'
-            elif label[:3] == '...':
-                edgeType = 'ellipsis'
-            else:
-                edgeType = 'normal'
-
+            edgeType = self.edgeType(label)
             self.drawEdge(edgeXy, edgeType)
 
             # Draws label.
@@ -205,32 +442,13 @@ class Draw:
 
         # Draws each node.
         for node in self.nodes:
-            value = node['value']
-            xy = self.transformCoords(node['xy'])
+            self.drawNode(self.transformCoords(node['xy']), node['value'])
 
-            # Chooses the fill color.
-            if value == 's' or value == '+':
-                nodeFill = 'white'
-                radius = RING_RADIUS
-            else:
-                nodeFill = 'black'
-                radius = NODE_RADIUS
+        if mode == 'direct':
+            if supersample == 1:
+                return self.image
 
-            # Draws the node.
-            self.__drawCircle(xy = xy, radius = radius, fill = nodeFill)
-
-            # Draws the ring.
-            if value != 'o' and value != 's':
-                self.__drawRing(xy = xy, radius = RING_RADIUS, fill = 'black')
-
-                # Draws the mark.
-                if value != 'x':
-                    if value == '+':
-                        textType = 'holosnub'
-                    else:
-                        textType = 'node'
-
-                    self.drawText(xy = xy, text = value, textType = textType)
+            return self.image.reduce(supersample)
 
         return self.image.resize(
             size = (round(self.image.size[0] * SCALE), round(self.image.size[1] * SCALE)),
@@ -239,12 +457,25 @@ class Draw:
 
     # Draws an edge on the image, of one of various parts..
     def drawEdge(self, xy, edgeType):
+        for shape, shapeXy in self.edgeShapes(xy, edgeType):
+            if shape == 'line':
+                self.__drawLine(
+                    xy = shapeXy,
+                    width = round(self.px(LINE_WIDTH)),
+                    fill = 'black'
+                )
+            else:
+                self.__drawCircle(
+                    xy = shapeXy,
+                    radius = self.px(ELLIPSIS_RADIUS),
+                    fill = 'black'
+                )
+
+    # Splits an edge into the lines and dots that make it up.
+    # Yields ('line', endpoints) and ('dot', center) pairs, shared by every output format.
+    def edgeShapes(self, xy, edgeType):
         if edgeType == 'normal':
-            self.__drawLine(
-                xy = xy,
-                width = LINE_WIDTH,
-                fill = 'black'
-            )
+            yield ('line', xy)
         elif edgeType == 'dotted':
             # Number of dashes in edge.
             dashes = 5
@@ -256,11 +487,7 @@ class Draw:
             xy[1] = tuple(map(lambda x, y: x + y, xy[0], delta))
 
             for i in range(dashes):
-                self.__drawLine(
-                    xy = tuple(xy),
-                    width = LINE_WIDTH,
-                    fill = 'black'
-                )
+                yield ('line', tuple(xy))
 
                 xy[0] = tuple(map(lambda x, y: x + 2 * y, xy[0], delta))
                 xy[1] = tuple(map(lambda x, y: x + 2 * y, xy[1], delta))
@@ -274,58 +501,229 @@ class Draw:
             xy = tuple(map(lambda x, y: x + y * (spacing / 2 - 1), xy[0], delta))
 
             for i in range(3):
-                self.__drawCircle(
-                    xy = xy,
-                    radius = ELLIPSIS_RADIUS,
-                    fill = 'black'
-                )
+                yield ('dot', xy)
 
                 xy = tuple(map(lambda x, y: x + y, xy, delta))
         else:
             self.error("Edge type not recognized.", dev = True)
 
+    # Gets the type of an edge from its label.
+    def edgeType(self, label):
+        if label == 'Ø':
+            return 'dotted'
+        elif label[:3] == '...':
+            return 'ellipsis'
+        else:
+            return 'normal'
+
+    # Gets the endpoints of an edge and the position of its label, in image coordinates.
+    def edgeCoords(self, edge):
+        node0, node1 = self.nodes[edge[0]], self.nodes[edge[1]]
+
+        # Edge coordinates.
+        edgeXy = (
+            self.transformCoords(node0['xy']),
+            self.transformCoords(node1['xy']),
+        )
+
+        # Text coordinates.
+        textXy = list(map(lambda a, b: (a + b) / 2, edgeXy[0], edgeXy[1]))
+        if edge['drawingMode'] == 'line':
+            textXy[1] += self.px(TEXT_DISTANCE)
+
+        return edgeXy, textXy
+
+    # Draws a node at some particular location.
+    # Pastes its sprite, unless sprites are turned off.
+    def drawNode(self, xy, value):
+        if not self.sprites:
+            self.drawNodeShapes(xy, value)
+            return
+
+        colors, mask = self.nodeSprite(value)
+        x, y = xy
+        half = mask.size[0] / 2
+
+        self.image.paste(colors, (round(x - half), round(y - half)), mask)
+
+    # Draws a node at some particular location, shape by shape.
+    def drawNodeShapes(self, xy, value):
+        # Chooses the fill color.
+        if value == 's' or value == '+':
+            nodeFill = 'white'
+            radius = self.px(RING_RADIUS)
+        else:
+            nodeFill = 'black'
+            radius = self.px(NODE_RADIUS)
+
+        # Draws the node.
+        self.__drawCircle(xy = xy, radius = radius, fill = nodeFill)
+
+        # Draws the ring.
+        if value != 'o' and value != 's':
+            self.__drawRing(xy = xy, radius = self.px(RING_RADIUS), fill = 'black')
+
+            # Draws the mark.
+            if value != 'x':
+                if value == '+':
+                    textType = 'holosnub'
+                else:
+                    textType = 'node'
+
+                self.drawText(xy = xy, text = value, textType = textType)
+
+    # Gets the image of a node of a given value, anti-aliased, and the mask to paste it with.
+    # Nodes get cached across renders, since there's only a few distinct ones.
+    def nodeSprite(self, value):
+        key = (value, self.scale)
+        sprite = NODE_CACHE.get(key)
+        if sprite is not None:
+            return sprite
+
+        # Draws the node this many times bigger, and then scales it down.
+        factor = NODE_SUPERSAMPLE
+        scale = self.scale * factor
+
+        # Leaves room for the outermost circle, keeping the size a multiple of the factor.
+        outerRadius = NODE_RADIUS if value == 'o' else RING_RADIUS
+        size = (math.ceil(self.px(outerRadius)) + 1) * 2 * factor
+        center = size / 2
+
+        image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        canvas = ImageDraw.Draw(image)
+
+        # Chooses the fill color.
+        if value == 's' or value == '+':
+            nodeFill = 'white'
+            radius = RING_RADIUS * scale
+        else:
+            nodeFill = 'black'
+            radius = NODE_RADIUS * scale
+
+        # Draws the node.
+        canvas.ellipse(
+            xy = (center - radius, center - radius, center + radius, center + radius),
+            fill = nodeFill,
+            outline = 'black',
+            width = round(NODE_BORDER_WIDTH * scale)
+        )
+
+        # Draws the ring.
+        if value != 'o' and value != 's':
+            radius = RING_RADIUS * scale
+            canvas.arc(
+                xy = (center - radius, center - radius, center + radius, center + radius),
+                start = 0,
+                end = 360,
+                fill = 'black',
+                width = round(RING_WIDTH * scale)
+            )
+
+            # Draws the mark.
+            if value != 'x':
+                # Offset, seems necessary for some reason.
+                if value == '+':
+                    textType = 'holosnub'
+                    offset = (0.5, -3)
+                else:
+                    textType = 'node'
+                    offset = (1, -2)
+
+                colors, mask, textSize, origin = self.labelSprite(value, textType, scale)
+                xy = list(map(lambda a, b: round(center + a * scale - b / 2), offset, textSize))
+
+                label = colors.convert('RGBA')
+                label.putalpha(mask)
+                layer = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+                layer.paste(label, (xy[0] - origin[0], xy[1] - origin[1]))
+                image = Image.alpha_composite(image, layer)
+
+        # Scales down with premultiplied alpha, so the edges don't darken.
+        # Splits off the mask, so that pasting doesn't have to convert the image every time.
+        image = image.convert('RGBa').reduce(factor).convert('RGBA')
+        sprite = (image.convert('RGB'), image.getchannel('A'))
+        NODE_CACHE.put(key, sprite)
+        return sprite
+
     # Draws text with a border at some particular location.
     def drawText(self, xy, text, textType):
         xy = list(map(float, xy))
 
+        # Offset, seems necessary for some reason.
+        if textType == 'node':
+            xy = list(map(lambda a, b: a + self.px(b), xy, (1, -2)))
+        elif textType == 'holosnub':
+            xy = list(map(lambda a, b: a + self.px(b), xy, (0.5, -3)))
+
+        colors, mask, textSize, origin = self.labelSprite(text, textType)
+
+        # Positions text correctly.
+        xy = list(map(lambda a, b: round(a - b / 2), xy, textSize))
+
+        # Pastes the outlined text.
+        self.image.paste(colors, (xy[0] - origin[0], xy[1] - origin[1]), mask)
+
+    # Gets a label with its border, pre-composited.
+    # Returns the image, the mask to paste it with, the size of the text, and where the text starts within the image.
+    # Labels get cached across renders, since the same few get drawn over and over.
+    def labelSprite(self, text, textType, scale = None):
+        if scale is None:
+            scale = self.scale
+
+        key = (text, textType, scale)
+        label = LABEL_CACHE.get(key)
+        if label is not None:
+            return label
+
         # Configures text attributes.
         if textType == 'node':
-            font = NODE_FONT
+            font = getFont(round(NODE_FONT_SIZE * scale))
             foreColor = 'white'
             backColor = 'black'
-
-            # Offset, seems necessary for some reason.
-            xy = list(map(lambda a, b: a + b, xy, (1, -2)))
         elif textType == 'holosnub':
-            font = HOLOSNUB_FONT
+            font = getFont(round(HOLOSNUB_FONT_SIZE * scale))
             foreColor = 'black'
             backColor = 'white'
-
-            # Offset, seems necessary for some reason.
-            xy = list(map(lambda a, b: a + b, xy, (0.5, -3)))
         elif textType == 'edge':
-            font = EDGE_FONT
+            font = getFont(round(EDGE_FONT_SIZE * scale))
             foreColor = 'black'
             backColor = 'white'
         else:
             self.error("Text type not recognized.", dev = True)
 
-        # Positions text correctly.
-        textSize = self.draw.textsize(text = text, font = font)
-        xy = list(map(lambda a, b: round(a - b / 2), xy, textSize))
+        outline = max(1, round(FONT_OUTLINE * scale))
+
+        # The text box runs from the drawing origin to the bottom right corner of the glyphs.
+        left, top, right, bottom = font.getbbox(text)
+        textSize = (right, bottom)
 
-        # Draws border.
-        self.__drawText(xy = (xy[0] - FONT_OUTLINE, xy[1]), text = text, fill = backColor, font = font)
-        self.__drawText(xy = (xy[0] + FONT_OUTLINE, xy[1]), text = text, fill = backColor, font = font)
-        self.__drawText(xy = (xy[0], xy[1] - FONT_OUTLINE), text = text, fill = backColor, font = font)
-        self.__drawText(xy = (xy[0], xy[1] + FONT_OUTLINE), text = text, fill = backColor, font = font)
+        # Leaves room for the border, and for glyphs that stick out of the text box.
+        origin = (outline - min(0, left), outline - min(0, top))
+        size = (origin[0] + right + outline, origin[1] + bottom + outline)
 
-        # Overlays text.
-        self.__drawText(xy = xy, text = text, fill = foreColor, font = font)
+        # Draws the border and the text as separate masks.
+        backMask = Image.new('L', size, 0)
+        backDraw = ImageDraw.Draw(backMask)
+        for offset in ((-outline, 0), (outline, 0), (0, -outline), (0, outline)):
+            backDraw.text(xy = (origin[0] + offset[0], origin[1] + offset[1]), text = text, fill = 255, font = font)
+
+        foreMask = Image.new('L', size, 0)
+        ImageDraw.Draw(foreMask).text(xy = origin, text = text, fill = 255, font = font)
+
+        # Overlays the text on the border.
+        back = Image.new('RGBA', size, backColor)
+        back.putalpha(backMask)
+        fore = Image.new('RGBA', size, foreColor)
+        fore.putalpha(foreMask)
+
+        image = Image.alpha_composite(back, fore)
+        label = (image.convert('RGB'), image.getchannel('A'), textSize, origin)
+        LABEL_CACHE.put(key, label)
+        return label
 
     # Primitive to draw a line on the image.
     def __drawLine(self, xy, width, fill):
-        self.draw.line(
+        self.canvas.line(
             xy = xy,
             width = width,
             fill = fill
@@ -334,27 +732,115 @@ class Draw:
     # Primitive to draw a circle on the image.
     def __drawCircle(self, xy, radius, fill):
         x, y = xy
-        self.draw.ellipse(
+        self.canvas.ellipse(
             xy = (x - radius, y - radius, x + radius, y + radius),
             fill = fill,
             outline = 'black',
-            width = NODE_BORDER_WIDTH
+            width = round(self.px(NODE_BORDER_WIDTH))
         )
 
     # Primitive to draw a ring on the image.
     def __drawRing(self, xy, radius, fill):
         x, y = xy
-        self.draw.arc(
+        self.canvas.arc(
             xy = (x - radius, y - radius, x + radius, y + radius),
             start = 0,
             end = 360,
             fill = 'black',
-            width = RING_WIDTH
+            width = round(self.px(RING_WIDTH))
         )
 
-    # Primitive to draw text on the image.
-    def __drawText(self, xy, text, fill, font):
-        self.draw.text(xy = xy, text = text, fill = fill, font = font)
+    # Draws the graph as an SVG image, returns its source.
+    # Shares the layout with the raster output, but only builds up markup, without any pixel buffers.
+    def svg(self):
+        self.scale = SCALE if self.fits(self.canvasSize('direct', 1)) else self.fitScale()
+        width, height = self.canvasSize('direct', 1, self.scale)
+
+        elements = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">',
+            '<rect width="100%" height="100%" fill="white"/>'
+        ]
+
+        # Draws the edges.
+        for edge in self.edges:
+            label = edge['label']
+            edgeXy, textXy = self.edgeCoords(edge)
+            edgeType = self.edgeType(label)
+
+            for shape, shapeXy in self.edgeShapes(edgeXy, edgeType):
+                if shape == 'line':
+                    elements.append(self.__svgLine(shapeXy, width = self.px(LINE_WIDTH)))
+                else:
+                    elements.append(self.__svgCircle(shapeXy, radius = self.px(ELLIPSIS_RADIUS), fill = 'black'))
+
+            # Draws label.
+            if edgeType == 'normal' and label != '3':
+                elements.append(self.__svgText(textXy, label, textType = 'edge'))
+
+        # Draws each node.
+        for node in self.nodes:
+            xy = self.transformCoords(node['xy'])
+            value = node['value']
+
+            # Chooses the fill color.
+            if value == 's' or value == '+':
+                nodeFill = 'white'
+                radius = self.px(RING_RADIUS)
+            else:
+                nodeFill = 'black'
+                radius = self.px(NODE_RADIUS)
+
+            elements.append(self.__svgCircle(xy, radius = radius, fill = nodeFill))
+
+            # Draws the ring, and the mark.
+            if value != 'o' and value != 's':
+                elements.append(self.__svgCircle(xy, radius = self.px(RING_RADIUS), fill = 'none', width = RING_WIDTH))
+
+                if value == '+':
+                    elements.append(self.__svgText(xy, value, textType = 'holosnub'))
+                elif value != 'x':
+                    elements.append(self.__svgText(xy, value, textType = 'node'))
+
+        elements.append('</svg>')
+        return '\n'.join(elements)
+
+    # SVG primitive for a line.
+    def __svgLine(self, xy, width):
+        (x1, y1), (x2, y2) = xy
+        return (
+            f'<line x1="{svgNumber(x1)}" y1="{svgNumber(y1)}" x2="{svgNumber(x2)}" y2="{svgNumber(y2)}" '
+            f'stroke="black" stroke-width="{svgNumber(width)}"/>'
+        )
+
+    # SVG primitive for a circle, with its outline inside the radius like PIL draws it.
+    def __svgCircle(self, xy, radius, fill, width = NODE_BORDER_WIDTH):
+        x, y = xy
+        width = self.px(width)
+        return (
+            f'<circle cx="{svgNumber(x)}" cy="{svgNumber(y)}" r="{svgNumber(max(radius - width / 2, 0))}" '
+            f'fill="{fill}" stroke="black" stroke-width="{svgNumber(width)}"/>'
+        )
+
+    # SVG primitive for text with a border, centered at some particular location.
+    def __svgText(self, xy, text, textType):
+        # Configures text attributes.
+        if textType == 'node':
+            size, foreColor, backColor, offset = NODE_FONT_SIZE, 'white', 'black', (1, -2)
+        elif textType == 'holosnub':
+            size, foreColor, backColor, offset = HOLOSNUB_FONT_SIZE, 'black', 'white', (0.5, -3)
+        elif textType == 'edge':
+            size, foreColor, backColor, offset = EDGE_FONT_SIZE, 'black', 'white', (0, 0)
+        else:
+            self.error("Text type not recognized.", dev = True)
+
+        x, y = map(lambda a, b: a + self.px(b), xy, offset)
+        return (
+            f'<text x="{svgNumber(x)}" y="{svgNumber(y)}" font-family="{escape(SVG_FONT_FAMILY)}" '
+            f'font-size="{svgNumber(self.px(size))}" text-anchor="middle" dominant-baseline="central" '
+            f'fill="{foreColor}" stroke="{backColor}" stroke-width="{svgNumber(self.px(2 * FONT_OUTLINE))}" '
+            f'paint-order="stroke">{escape(text, quote = False)}</text>'
+        )
 
     # Shows the graph.
     def show(self):
@@ -364,6 +850,14 @@ class Draw:
     def save(self, *args):
         self.draw().save(*args)
 
+    # Encodes the graph in memory, returns the bytes of the image file.
+    # Besides the formats PIL can write, supports "SVG". See encodeImage for the other arguments.
+    def encode(self, format = "PNG", profile = None, **params):
+        if format.upper() == "SVG":
+            return self.svg().encode('utf-8')
+
+        return encodeImage(self.draw(), format, profile, **params)
+
     def error(self, text, dev = False):
         msg = f"Graph drawing failed. {text}"
 
@@ -0,0 +1,12 @@
+import os
+import functools
+from PIL import ImageFont
+
+# Where the fonts live, relative to this file, so that they load from any working directory.
+FONT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ttf")
+
+# Loads a font at a given size, the first time it's asked for.
+# Shared by every module, and cached, since only a few fonts and sizes ever get used.
+@functools.lru_cache(maxsize = None)
+def getFont(name, size):
+    return ImageFont.truetype(os.path.join(FONT_DIRECTORY, f"{name}.ttf"), size, layout_engine = ImageFont.Layout.BASIC)
@@ -0,0 +1,171 @@
+import math
+from cd import CD
+from cdError import CDError
+
+# NumPy is optional: without it, matrices get classified one by one in pure Python, which is much slower.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Batched Gram matrix analysis of diagrams.
+# The Gram matrix of a diagram has 1s on its diagonal, and -cos(π/m) for each pair of nodes linked by an edge
+# labeled m (0 for unlinked ones, since they're labeled 2). Its signature tells the group apart:
+# positive definite for finite groups, positive semidefinite and singular for affine ones,
+# and a single negative eigenvalue for hyperbolic ones.
+# With NumPy, matrices of the same size are stacked, and their eigenvalues computed all at once.
+
+TOLERANCE = 1e-9 # Eigenvalues closer to 0 than this, times the number of nodes, count as 0.
+BATCH_SIZE = 1024 # Diagrams read at once by classifyStream.
+JACOBI_SWEEPS = 100 # Maximum number of sweeps of the pure Python eigenvalue solver.
+
+# The classification of a diagram by its Gram matrix.
+class GramResult:
+    __slots__ = ('diagram', 'kind', 'signature', 'determinant', 'error')
+
+    # Class constructor.
+    # kind is 'finite', 'affine', 'hyperbolic' or 'indefinite', or None if the diagram couldn't be analyzed.
+    # signature is the number of positive, zero and negative eigenvalues.
+    # error is the reason the diagram couldn't be analyzed, if any.
+    def __init__(self, diagram, kind = None, signature = None, determinant = None, error = None):
+        self.diagram = diagram
+        self.kind = kind
+        self.signature = signature
+        self.determinant = determinant
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return f"GramResult({self.diagram!r}, error = {self.error!r})"
+
+        return f"GramResult({self.diagram!r}, {self.kind!r}, {self.signature}, {self.determinant:.6g})"
+
+# Gets the m an edge label stands for, as a float.
+# Fractions p/q are kept as they are, primes n' stand for n/(n-1), and ∞ is math.inf.
+# Raises a CDError for labels without a fixed value, like letters and dotted lines.
+def labelValue(label):
+    prime = label.endswith("'")
+    label = label.rstrip("'")
+
+    if label == "∞":
+        return math.inf
+
+    numerator, _, denominator = label.partition("/")
+    if not numerator.isdigit() or not (denominator.isdigit() or denominator == ""):
+        raise CDError(f"Edge label {label} has no fixed value.")
+
+    m = int(numerator) / int(denominator or 1)
+    return m / (m - 1) if prime else m
+
+# Gets the Gram matrix of a graph, as a list of rows.
+def gramMatrix(graph):
+    n = len(graph)
+    matrix = [[1.0 if i == j else 0.0 for j in range(n)] for i in range(n)]
+
+    for source, target, label in graph.edges():
+        matrix[source][target] = matrix[target][source] = -math.cos(math.pi / labelValue(label))
+
+    return matrix
+
+# Names the kind of a group from the signature of its Gram matrix.
+def signatureKind(positive, zero, negative):
+    if zero == 0 and negative == 0:
+        return 'finite'
+    elif negative == 0:
+        return 'affine'
+    elif negative == 1 and zero == 0:
+        return 'hyperbolic'
+    else:
+        return 'indefinite'
+
+# Classifies Gram matrices of the same size.
+# Returns the kinds, the signatures as (positive, zero, negative) triples, and the determinants.
+def classifyMatrices(matrices):
+    n = len(matrices[0])
+    tolerance = TOLERANCE * n
+
+    if n == 0:
+        return ['finite'] * len(matrices), [(0, 0, 0)] * len(matrices), [1.0] * len(matrices)
+
+    if np is not None:
+        eigenvalues = np.linalg.eigvalsh(np.array(matrices))
+        positive = (eigenvalues > tolerance).sum(axis = 1).tolist()
+        negative = (eigenvalues < -tolerance).sum(axis = 1).tolist()
+        determinants = eigenvalues.prod(axis = 1).tolist()
+    else:
+        eigenvalues = [jacobiEigenvalues(matrix) for matrix in matrices]
+        positive = [sum(value > tolerance for value in values) for values in eigenvalues]
+        negative = [sum(value < -tolerance for value in values) for values in eigenvalues]
+        determinants = [math.prod(values) for values in eigenvalues]
+
+    signatures = [(p, n - p - q, q) for p, q in zip(positive, negative)]
+    return [signatureKind(*signature) for signature in signatures], signatures, determinants
+
+# Gets the eigenvalues of a symmetric matrix, with the cyclic Jacobi method.
+# Used when NumPy isn't available. Takes cubic time per sweep, and converges in a handful of sweeps.
+def jacobiEigenvalues(matrix):
+    a = [list(row) for row in matrix]
+    n = len(a)
+
+    for _ in range(JACOBI_SWEEPS):
+        if sum(a[i][j] ** 2 for i in range(n) for j in range(i + 1, n)) < (TOLERANCE / 1000) ** 2:
+            break
+
+        for p in range(n):
+            for q in range(p + 1, n):
+                if a[p][q] == 0:
+                    continue
+
+                # The rotation in the (p, q) plane that zeroes a[p][q].
+                theta = (a[q][q] - a[p][p]) / (2 * a[p][q])
+                t = math.copysign(1, theta) / (abs(theta) + math.sqrt(theta * theta + 1))
+                c = 1 / math.sqrt(t * t + 1)
+                s = t * c
+
+                for row in a:
+                    row[p], row[q] = c * row[p] - s * row[q], s * row[p] + c * row[q]
+
+                rowP, rowQ = a[p], a[q]
+                for k in range(n):
+                    rowP[k], rowQ[k] = c * rowP[k] - s * rowQ[k], s * rowP[k] + c * rowQ[k]
+
+    return [a[i][i] for i in range(n)]
+
+# Classifies diagrams, given as strings or graphs, all at once.
+# Diagrams of the same size get classified together. Returns a GramResult for each one, in order.
+def classifyBatch(diagrams):
+    results = [None] * len(diagrams)
+    bySize = {}
+
+    for i, diagram in enumerate(diagrams):
+        try:
+            graph = CD(diagram).toGraph() if isinstance(diagram, str) else diagram
+            matrix = gramMatrix(graph)
+        except CDError as e:
+            results[i] = GramResult(diagram, error = str(e))
+            continue
+
+        bySize.setdefault(len(graph), []).append((i, matrix))
+
+    for entries in bySize.values():
+        kinds, signatures, determinants = classifyMatrices([matrix for _, matrix in entries])
+
+        for (i, _), kind, signature, determinant in zip(entries, kinds, signatures, determinants):
+            results[i] = GramResult(diagrams[i], kind, signature, determinant)
+
+    return results
+
+# Classifies a stream of diagrams, given as strings or graphs, yielding a GramResult for each one in order.
+# Reads them batchSize at a time, so any number of them can go through in bounded memory.
+def classifyStream(diagrams, batchSize = BATCH_SIZE):
+    batch = []
+
+    for diagram in diagrams:
+        batch.append(diagram)
+
+        if len(batch) >= batchSize:
+            yield from classifyBatch(batch)
+            batch = []
+
+    if batch:
+        yield from classifyBatch(batch)
@@ -0,0 +1,241 @@
+import struct
+import sys
+from array import array
+from cd import CD
+from cdError import CDError
+from limits import DEFAULT_LIMITS
+from node import Graph, Node, UnionFind
+
+# A compact, serializable form of a parsed diagram.
+# A Graph is a web of node views, dicts and arrays, which is slow to pickle and bulky to store.
+# The IR keeps only what drawing needs: a label id for each node, the edges as pairs of node ids with a label id
+# each, and a table of interned labels, shared by nodes and edges. It has a binary encoding, for shipping between
+# processes and storing in caches, and a canonical text encoding, for cache keys and debugging.
+
+IR_VERSION = 1 # Bump it whenever the encodings change.
+IR_MAGIC = b"CDIR"
+
+# Binary header: magic, version, and the number of labels, nodes and edges.
+HEADER = struct.Struct("<4sBIII")
+LABEL_LENGTH = struct.Struct("<H")
+
+# A parsed diagram as flat arrays.
+class DiagramIR:
+    __slots__ = ('labels', 'nodes', 'edges', 'edgeLabels')
+
+    # Class constructor.
+    # labels is the label table, nodes holds the label id of each node, edges holds the source and target
+    # of each edge one after the other, and edgeLabels holds the label id of each edge.
+    def __init__(self, labels, nodes, edges, edgeLabels):
+        self.labels = labels
+        self.nodes = nodes
+        self.edges = edges
+        self.edgeLabels = edgeLabels
+
+    # Parses a diagram string into an IR. Strings that parse to the same graph get equal IRs.
+    @staticmethod
+    def parse(string, limits = DEFAULT_LIMITS):
+        return DiagramIR.fromGraph(CD(string, limits).toGraph())
+
+    # Builds the IR of a graph.
+    # Labels are interned in order of first use, nodes first and then edges, so equal graphs give equal IRs.
+    @staticmethod
+    def fromGraph(graph):
+        labels = []
+        labelIds = {}
+
+        def intern(label):
+            labelId = labelIds.get(label)
+
+            if labelId is None:
+                labelId = labelIds[label] = len(labels)
+                labels.append(label)
+
+            return labelId
+
+        nodes = array('i', [intern(value) for value in graph.values])
+
+        # Maps the graph's own edge label table into the shared one.
+        edgeLabelIds = [intern(label) for label in graph.labels]
+        edgeLabels = array('i', [edgeLabelIds[label] for label in graph.edgeLabels])
+
+        edges = array('i', bytes(8 * len(graph.edgeSources)))
+        edges[0::2] = graph.edgeSources
+        edges[1::2] = graph.edgeTargets
+
+        return DiagramIR(labels, nodes, edges, edgeLabels)
+
+    # Rebuilds the graph.
+    # Fills the graph's arrays directly, which is several times faster than adding the nodes and edges one by one.
+    # Nodes come in id order, which is also the order they appear in the diagram string,
+    # so their ids stand in for their positions in it.
+    def toGraph(self):
+        graph = Graph()
+        n = len(self.nodes)
+        labels = self.labels
+
+        graph.values = [labels[label] for label in self.nodes]
+        graph.stringIndices = array('i', range(n))
+        graph.unionFind = unionFind = UnionFind(n)
+        graph.array = [Node(graph, id) for id in range(n)]
+        graph.adjacency = adjacency = [{} for _ in range(n)]
+
+        # Maps the shared label table into the graph's edge label table.
+        edgeLabelIds = {}
+        for label in self.edgeLabels:
+            if label not in edgeLabelIds:
+                if labels[label] in ("1", "1/2", "2"):
+                    raise CDError(f"Invalid edge label {labels[label]}.")
+
+                edgeLabelIds[label] = graph.internLabel(labels[label])
+
+        graph.edgeSources = self.edges[0::2]
+        graph.edgeTargets = self.edges[1::2]
+        graph.edgeLabels = array('i', [edgeLabelIds[label] for label in self.edgeLabels])
+
+        for source, target, label in zip(graph.edgeSources, graph.edgeTargets, graph.edgeLabels):
+            if source == target:
+                raise CDError("Can't link node to self.")
+
+            if target in adjacency[source]:
+                raise CDError("Can't link two nodes twice.")
+
+            adjacency[source][target] = adjacency[target][source] = label
+            unionFind.union(source, target)
+
+        return graph
+
+    # Encodes the IR as bytes.
+    def toBytes(self):
+        parts = [HEADER.pack(IR_MAGIC, IR_VERSION, len(self.labels), len(self.nodes), len(self.edgeLabels))]
+
+        for label in self.labels:
+            encoded = label.encode('utf-8')
+            parts.append(LABEL_LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+
+        for values in (self.nodes, self.edges, self.edgeLabels):
+            if sys.byteorder == 'big':
+                values = array('i', values)
+                values.byteswap()
+
+            parts.append(values.tobytes())
+
+        return b"".join(parts)
+
+    # Decodes an IR from bytes, as written by toBytes.
+    @staticmethod
+    def fromBytes(data):
+        try:
+            magic, version, labelCount, nodeCount, edgeCount = HEADER.unpack_from(data)
+            if magic != IR_MAGIC:
+                raise CDError("Not a diagram IR.")
+            if version != IR_VERSION:
+                raise CDError(f"Unsupported diagram IR version {version}.")
+
+            offset = HEADER.size
+            labels = []
+            for _ in range(labelCount):
+                length, = LABEL_LENGTH.unpack_from(data, offset)
+                offset += LABEL_LENGTH.size
+                labels.append(bytes(data[offset:offset + length]).decode('utf-8'))
+                offset += length
+
+            arrays = []
+            for count in (nodeCount, 2 * edgeCount, edgeCount):
+                values = array('i')
+                values.frombytes(data[offset:offset + 4 * count])
+                offset += 4 * count
+
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                arrays.append(values)
+        except (struct.error, ValueError, UnicodeDecodeError):
+            raise CDError("Invalid diagram IR.")
+
+        if offset != len(data):
+            raise CDError("Invalid diagram IR.")
+
+        ir = DiagramIR(labels, *arrays)
+        ir.validate()
+        return ir
+
+    # Encodes the IR as text, like:
+    # CDIR 1 labels x o 3 4 nodes 0 1 1 edges 0 1 2 1 2 3
+    # with each edge as its source, target and label id. Equal IRs always give the same text.
+    def toText(self):
+        edges = " ".join(
+            f"{self.edges[2 * i]} {self.edges[2 * i + 1]} {label}" for i, label in enumerate(self.edgeLabels)
+        )
+
+        return " ".join(filter(None, (
+            f"CDIR {IR_VERSION}", "labels", " ".join(self.labels),
+            "nodes", " ".join(map(str, self.nodes)), "edges", edges
+        )))
+
+    # Decodes an IR from text, as written by toText. Labels never have whitespace in them, so they need no quoting.
+    @staticmethod
+    def fromText(text):
+        tokens = text.split()
+
+        if tokens[:1] != ["CDIR"] or len(tokens) < 2:
+            raise CDError("Not a diagram IR.")
+        if tokens[1] != str(IR_VERSION):
+            raise CDError(f"Unsupported diagram IR version {tokens[1]}.")
+
+        try:
+            nodesAt = tokens.index("nodes", 3)
+            edgesAt = tokens.index("edges", nodesAt + 1)
+        except ValueError:
+            raise CDError("Invalid diagram IR.")
+
+        if tokens[2] != "labels" or (len(tokens) - edgesAt - 1) % 3 != 0:
+            raise CDError("Invalid diagram IR.")
+
+        try:
+            nodes = array('i', map(int, tokens[nodesAt + 1:edgesAt]))
+            edgeTokens = list(map(int, tokens[edgesAt + 1:]))
+        except ValueError:
+            raise CDError("Invalid diagram IR.")
+
+        edges = array('i')
+        for i in range(0, len(edgeTokens), 3):
+            edges.extend(edgeTokens[i:i + 2])
+
+        ir = DiagramIR(tokens[3:nodesAt], nodes, edges, array('i', edgeTokens[2::3]))
+        ir.validate()
+        return ir
+
+    # Checks that every id points somewhere, so that decoded IRs can't break whoever uses them.
+    def validate(self):
+        labelCount, nodeCount = len(self.labels), len(self.nodes)
+
+        if len(self.edges) != 2 * len(self.edgeLabels):
+            raise CDError("Invalid diagram IR.")
+
+        for values, count in ((self.nodes, labelCount), (self.edgeLabels, labelCount), (self.edges, nodeCount)):
+            if values and (min(values) < 0 or max(values) >= count):
+                raise CDError("Invalid diagram IR.")
+
+    # Pickles through the binary encoding, which is much smaller and faster than pickling the arrays one by one.
+    def __reduce__(self):
+        return (DiagramIR.fromBytes, (self.toBytes(),))
+
+    def __eq__(self, other):
+        if not isinstance(other, DiagramIR):
+            return NotImplemented
+
+        return (
+            self.labels == other.labels and self.nodes == other.nodes and
+            self.edges == other.edges and self.edgeLabels == other.edgeLabels
+        )
+
+    def __hash__(self):
+        return hash(self.toBytes())
+
+    # Number of nodes.
+    def __len__(self):
+        return len(self.nodes)
+
+    def __repr__(self):
+        return f"DiagramIR({self.toText()!r})"
@@ -0,0 +1,286 @@
+import math
+
+# Layouts for the components of a graph that aren't straight lines.
+# Components are given as lists of node ids. Positions are in units of the node spacing,
+# relative to the component, with y pointing down like in the image.
+# Each layout returns a list of (id, (x, y), drawingMode) triples, with every node after some neighbor.
+
+CYCLE_SEARCH_STEPS = 30 # Steps of the binary search for the radius of a cycle with trees.
+
+# Traverses the nodes reachable from a root with BFS, without going through the blocked nodes.
+# Returns the nodes in BFS order, and the parent and depth of each one.
+def bfs(adjacency, root, blocked = ()):
+    order = [root]
+    parent = {root: None}
+    depth = {root: 0}
+
+    # The order list grows as it's traversed.
+    for node in order:
+        for neighbor in adjacency[node]:
+            if neighbor not in parent and neighbor not in blocked:
+                parent[neighbor] = node
+                depth[neighbor] = depth[node] + 1
+                order.append(neighbor)
+
+    return order, parent, depth
+
+# Whether a component has no cycles.
+def isTree(graph, ids):
+    edges = sum(len(graph.adjacency[node]) for node in ids) // 2
+    return edges == len(ids) - 1
+
+# Picks the root for a tree: an end of one of its longest paths.
+# Out of both ends, picks the one that comes first in the diagram.
+def treeRoot(graph, ids):
+    order, _, depth = bfs(graph.adjacency, ids[0])
+    start = max(order, key = lambda node: depth[node])
+
+    order, _, depth = bfs(graph.adjacency, start)
+    end = max(order, key = lambda node: depth[node])
+
+    return min(start, end, key = lambda node: graph.stringIndices[node])
+
+# Lays out a tree as a tidy tree: depth goes to the right, and subtrees are stacked in rows.
+# The tallest subtree of each node continues on its row, so the longest path ends up as a straight spine.
+# The other subtrees alternate below and above, as close as their contours allow.
+# Runs in linear time: merging a subtree costs its height, and the heights of the subtrees
+# that don't continue their parent's row add up to at most the number of nodes.
+# Returns the positions as (depth, row) by id, and the nodes in BFS order with their parents.
+def tidyTree(graph, root, blocked = ()):
+    adjacency = graph.adjacency
+    order, parent, depth = bfs(adjacency, root, blocked)
+
+    # Gets the children of each node, tallest subtree first.
+    height, children = {}, {}
+    for node in reversed(order):
+        kids = [neighbor for neighbor in adjacency[node] if parent.get(neighbor) == node]
+        kids.sort(key = lambda kid: -height[kid])
+
+        children[node] = kids
+        height[node] = 1 + (height[kids[0]] if kids else 0)
+
+    # The row of each node, relative to its parent.
+    offset = {}
+
+    # The topmost and bottommost row of each subtree at each depth, relative to its root.
+    # Stored deepest first, so a parent can add its own row by appending.
+    contours = {}
+
+    for node in reversed(order):
+        kids = children[node]
+
+        if not kids:
+            contours[node] = ([0], [0])
+            continue
+
+        # The tallest subtree continues on the same row, and its contours get reused.
+        top, bottom = contours.pop(kids[0])
+        offset[kids[0]] = 0
+        side = 1
+
+        for kid in kids[1:]:
+            kidTop, kidBottom = contours.pop(kid)
+            n, m = len(kidTop), len(top)
+
+            # Moves the subtree as close as possible without overlapping at any depth.
+            if side > 0:
+                rows = max(bottom[m - 1 - d] - kidTop[n - 1 - d] for d in range(n)) + 1
+            else:
+                rows = min(top[m - 1 - d] - kidBottom[n - 1 - d] for d in range(n)) - 1
+
+            for d in range(n):
+                top[m - 1 - d] = min(top[m - 1 - d], kidTop[n - 1 - d] + rows)
+                bottom[m - 1 - d] = max(bottom[m - 1 - d], kidBottom[n - 1 - d] + rows)
+
+            offset[kid] = rows
+            side = -side
+
+        top.append(0)
+        bottom.append(0)
+        contours[node] = (top, bottom)
+
+    # Places the nodes from the root down.
+    row = {root: 0}
+    for node in order[1:]:
+        row[node] = row[parent[node]] + offset[node]
+
+    return {node: (depth[node], row[node]) for node in order}, order, parent
+
+# Lays out a tree component, see tidyTree.
+# Edges along a row are drawn as lines, the ones between rows as tree edges.
+def treeLayout(graph, ids):
+    positions, order, parent = tidyTree(graph, treeRoot(graph, ids))
+    layout = []
+
+    for node in order:
+        if parent[node] is None or positions[node][1] == positions[parent[node]][1]:
+            drawingMode = 'line'
+        else:
+            drawingMode = 'tree'
+
+        layout.append((node, positions[node], drawingMode))
+
+    return layout
+
+# Finds the cycle of a component made out of a single cycle with trees hanging off it.
+# Returns the nodes of the cycle in order, or None if the component isn't like that.
+def findCycle(graph, ids):
+    adjacency = graph.adjacency
+
+    # Strips the trees off, leaf by leaf.
+    degree = {node: len(adjacency[node]) for node in ids}
+    leaves = [node for node in ids if degree[node] == 1]
+    removed = set()
+
+    while leaves:
+        leaf = leaves.pop()
+        removed.add(leaf)
+
+        for neighbor in adjacency[leaf]:
+            if neighbor not in removed:
+                degree[neighbor] -= 1
+                if degree[neighbor] == 1:
+                    leaves.append(neighbor)
+
+    core = [node for node in ids if node not in removed]
+    if len(core) < 3 or any(degree[node] != 2 for node in core):
+        return None
+
+    # Walks around the cycle, starting from its first node towards its lowest neighbor.
+    coreSet = set(core)
+    start = core[0]
+    prev, node = start, min(neighbor for neighbor in adjacency[start] if neighbor in coreSet)
+    cycle = [start]
+
+    while node != start:
+        cycle.append(node)
+        prev, node = node, next(
+            neighbor for neighbor in adjacency[node] if neighbor in coreSet and neighbor != prev
+        )
+
+    return cycle
+
+# Lays out a cycle as a polygon, with its trees pointing outwards.
+# Each tree gets the angle it takes up around the polygon, so that trees on neighboring nodes don't overlap.
+# The polygon is made just big enough for all of them to fit around it, and the angle left over is spread evenly.
+# Without trees, that's a regular polygon.
+def cycleLayout(graph, cycle):
+    n = len(cycle)
+    cycleSet = set(cycle)
+    trees = [tidyTree(graph, node, blocked = cycleSet) for node in cycle]
+
+    # The angles each tree takes up on either side of its node, with the nodes on a circle of some radius.
+    # Each node takes up half a node spacing on either side.
+    def extents(radius):
+        result = []
+
+        for positions, _, _ in trees:
+            left, right = 0, 0
+            for depth, row in positions.values():
+                angle = math.atan2(row, radius + depth)
+                width = math.asin(min(1, 0.5 / math.hypot(radius + depth, row)))
+                left, right = min(left, angle - width), max(right, angle + width)
+
+            result.append((left, right))
+
+        return result
+
+    # The angle between each node and the next one, for the trees not to overlap.
+    def gaps(radius):
+        angles = extents(radius)
+        return [angles[i][1] - angles[(i + 1) % n][0] for i in range(n)]
+
+    # Finds the smallest radius that fits, starting from that of the regular polygon.
+    radius = 1 / (2 * math.sin(math.pi / n))
+    if sum(gaps(radius)) > 2 * math.pi + 1e-9:
+        low, high = radius, 2 * radius
+        while sum(gaps(high)) > 2 * math.pi:
+            low, high = high, 2 * high
+
+        for _ in range(CYCLE_SEARCH_STEPS):
+            middle = (low + high) / 2
+            if sum(gaps(middle)) > 2 * math.pi:
+                low = middle
+            else:
+                high = middle
+
+        radius = high
+
+    gap = gaps(radius)
+    slack = (2 * math.pi - sum(gap)) / n
+
+    layout = []
+    treeLayouts = []
+
+    angle = math.pi / 2 + math.pi / n
+    for node, (positions, order, _), nodeGap in zip(cycle, trees, gap):
+        # Unit vector pointing outwards.
+        ux, uy = math.cos(angle), math.sin(angle)
+        x, y = radius * ux, radius * uy
+        layout.append((node, (x, y), 'polygon'))
+
+        # Lays out the tree hanging off this node, turned to point outwards.
+        for treeNode in order[1:]:
+            depth, row = positions[treeNode]
+            treeLayouts.append((treeNode, (x + depth * ux - row * uy, y + depth * uy + row * ux), 'tree'))
+
+        angle += nodeGap + slack
+
+    return layout + treeLayouts
+
+# Lays out a cycle as a racetrack: half of it goes right along a row, and the rest comes back along the row below.
+# Odd cycles get their last node on the way out as a tip between both rows.
+# Unlike a polygon, it takes up space linear in its length, and it can be folded, see foldLayout.
+# Edges along the rows are drawn as lines, the ones at both ends as polygon edges.
+def ringLayout(cycle):
+    n = len(cycle)
+    out = (n + 1) // 2
+    layout = [(node, (i, 0), 'line') for i, node in enumerate(cycle[:out])]
+
+    if n % 2:
+        layout[-1] = (cycle[out - 1], (out - 1, 0.5), 'polygon')
+        out -= 1
+
+    back = cycle[len(layout):]
+    for i, node in enumerate(back):
+        drawingMode = 'polygon' if i == 0 or i == len(back) - 1 else 'line'
+        layout.append((node, (out - 1 - i, 1), drawingMode))
+
+    return layout
+
+# Folds a layout wider than a number of columns into bands, that snake back and forth like long lines do.
+# Only works for layouts with their nodes in whole columns, and their edges between neighboring columns,
+# like trees and rings. Bands are an empty row apart, and every other one is mirrored and shifted by a column,
+# so that the edges between bands lead diagonally outwards. Those get drawn as turns.
+def foldLayout(graph, layout, columns):
+    left = min(xy[0] for _, xy, _ in layout)
+    band = {node: round(xy[0] - left) // columns for node, xy, _ in layout}
+    bands = max(band.values()) + 1
+
+    # The topmost and bottommost row of each band.
+    top, bottom = [math.inf] * bands, [-math.inf] * bands
+    for node, (x, y), _ in layout:
+        top[band[node]] = min(top[band[node]], y)
+        bottom[band[node]] = max(bottom[band[node]], y)
+
+    # The row each band starts at.
+    start = [0] * bands
+    for b in range(1, bands):
+        start[b] = start[b - 1] + bottom[b - 1] - top[b - 1] + 2
+
+    folded = []
+    placed = set()
+
+    for node, (x, y), drawingMode in layout:
+        b = band[node]
+        column = round(x - left) - b * columns
+        if b % 2:
+            column = columns - column
+
+        if any(band[neighbor] != b for neighbor in graph.adjacency[node] if neighbor in placed):
+            drawingMode = 'turn'
+
+        folded.append((node, (column, start[b] + y - top[b]), drawingMode))
+        placed.add(node)
+
+    return folded
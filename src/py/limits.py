@@ -0,0 +1,27 @@
+# Size limits for parsing and drawing a diagram.
+class Limits:
+    # Class constructor.
+    # nodes and edges bound the parsed graph, pixels bounds the area of the drawn image.
+    # rowWidth is the width after which components wrap onto a new row, and long chains snake back and forth.
+    # minScale is the smallest scale, in pixels per layout unit, that images over the pixel limit can get shrunk to.
+    # Any of them can be None, meaning no limit, except for minScale, where it means images never get scaled down.
+    def __init__(self, nodes = None, edges = None, pixels = None, rowWidth = None, minScale = None):
+        self.nodes = nodes
+        self.edges = edges
+        self.pixels = pixels
+        self.rowWidth = rowWidth
+        self.minScale = minScale
+
+MAX_LEN = 100 # Node limit for everyday diagrams.
+
+# Limits for the diagrams posted on Discord.
+DEFAULT_LIMITS = Limits(nodes = MAX_LEN)
+
+# Large-diagram mode, for diagrams with thousands of nodes.
+LARGE_LIMITS = Limits(nodes = 10000, edges = 40000, pixels = 64_000_000, rowWidth = 4000, minScale = 0.25)
+
+# Limits by size, for the size option of the cd command. Large diagrams are opt-in, since they take longer to render.
+SIZE_LIMITS = {
+    'normal': DEFAULT_LIMITS,
+    'large': LARGE_LIMITS
+}
@@ -0,0 +1,121 @@
+import datetime
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+
+LOG_MAX_BYTES = 10 * 1024 * 1024 # Size after which the log file gets rotated.
+LOG_BACKUPS = 30 # Number of rotated log files kept.
+LOG_QUEUE_SIZE = 10000 # Log records waiting to be written, past which new ones get dropped.
+
+# The record attributes that are part of every log record, everything else was passed through extra.
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Formats log records as key=value pairs, like:
+# time=2024-01-01T12:00:00 level=INFO msg="Bot is ready." command=cd latency_ms=52
+# Fields passed through extra are appended in the order they were given.
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        fields = [
+            ("time", datetime.datetime.fromtimestamp(record.created).isoformat(timespec = "milliseconds")),
+            ("level", record.levelname),
+            ("msg", record.getMessage())
+        ]
+        fields += [(key, value) for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES]
+
+        line = " ".join(f"{key}={formatValue(value)}" for key, value in fields)
+        if record.exc_info:
+            line += " traceback=" + formatValue(self.formatException(record.exc_info))
+
+        return line
+
+# Formats a value for a key=value pair, quoting it if it has spaces, quotes or line breaks.
+def formatValue(value):
+    if value is None:
+        return "-"
+
+    value = str(value)
+    if value == "" or any(c in value for c in " \"=\n\r\t"):
+        value = "\"" + value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n").replace("\r", "\\r") + "\""
+
+    return value
+
+# A log file that rotates when it gets too big or at midnight, whichever comes first.
+# Rotated files are gzipped, as log.txt.1.gz, log.txt.2.gz and so on, newest first.
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    # Class constructor.
+    def __init__(self, filename, maxBytes = LOG_MAX_BYTES, backupCount = LOG_BACKUPS):
+        super().__init__(filename, maxBytes = maxBytes, backupCount = backupCount, encoding = "utf-8")
+        self.rolloverAt = self.nextMidnight()
+
+    # The timestamp of the next midnight, local time.
+    def nextMidnight(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(days = 1)
+        return time.mktime(tomorrow.timetuple())
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rolloverAt and os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            return True
+
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rolloverAt = self.nextMidnight()
+
+    def rotation_filename(self, default_name):
+        return default_name + ".gz"
+
+    # Gzips the rotated file. Runs on the logging thread, so it doesn't hold up the bot.
+    def rotate(self, source, dest):
+        with open(source, "rb") as input, gzip.open(dest, "wb") as output:
+            shutil.copyfileobj(input, output)
+
+        os.remove(source)
+
+# Hands log records to the logging thread, dropping them if it falls too far behind,
+# so that logging never blocks the caller.
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Class constructor.
+    def __init__(self, queue):
+        super().__init__(queue)
+
+        # Number of records dropped because the queue was full.
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# Sets up the root logger to write key=value lines to a rotating log file and to stdout, from a background thread.
+# Returns the listener running the thread, which should be stopped on exit to flush the remaining records,
+# and the handler feeding it, which counts the records it had to drop.
+def setupLogging(filename, level = logging.INFO):
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+
+    formatter = KeyValueFormatter()
+
+    fileHandler = CompressedRotatingFileHandler(filename)
+    fileHandler.setFormatter(formatter)
+
+    stdoutHandler = logging.StreamHandler(sys.stdout)
+    stdoutHandler.setFormatter(formatter)
+
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(records, fileHandler, stdoutHandler, respect_handler_level = True)
+
+    handler = NonBlockingQueueHandler(records)
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    logger.addHandler(handler)
+
+    listener.start()
+    return listener, handler
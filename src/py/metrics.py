@@ -0,0 +1,154 @@
+import bisect
+import math
+import threading
+
+# Upper bounds of the histogram buckets, in seconds.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the histogram buckets for sizes, in bytes.
+SIZE_BUCKETS = tuple(2 ** k for k in range(9, 24))
+
+# A histogram of observed values, with fixed buckets like Prometheus ones.
+# Takes constant memory however many values it sees, percentiles are interpolated within the buckets.
+class Histogram:
+    # Class constructor.
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    # Adds a value.
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    # Estimates a percentile, from 0 to 100. Returns None if there aren't any values.
+    def percentile(self, p):
+        if self.count == 0:
+            return None
+
+        rank = p / 100 * self.count
+        seen = 0
+
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                # The last bucket has no upper bound, so it uses the biggest value seen instead.
+                low = self.buckets[i - 1] if i > 0 else 0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+
+            seen += count
+
+        return self.max
+
+    # Mean of the values, or None if there aren't any.
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+# In-process metrics: counters, gauges and histograms, each with optional labels.
+# Thread-safe, so it can be updated from the event loop and from worker threads alike.
+class Metrics:
+    # Class constructor.
+    # prefix is prepended to every metric name in the Prometheus output.
+    def __init__(self, prefix = ""):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+
+        # Keyed by (name, labels), with labels as a sorted tuple of (key, value) pairs.
+        self.counters = {}
+        self.histograms = {}
+
+        # Gauges are functions, evaluated when the metrics are read.
+        self.gauges = {}
+
+    # Adds to a counter.
+    def increment(self, name, amount = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    # Adds a value to a histogram.
+    # buckets is only used when the histogram gets created, by its first value.
+    def observe(self, name, value, buckets = DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+
+            histogram.observe(value)
+
+    # Registers a gauge, read from a function returning a number.
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    # Gets the value of a counter.
+    def counter(self, name, **labels):
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    # Gets a histogram, or None if it has no values yet.
+    def histogram(self, name, **labels):
+        with self.lock:
+            return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    # Renders all metrics in the Prometheus text exposition format.
+    def prometheus(self):
+        lines = []
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        for name, function in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {self.prefix}{name} gauge")
+            lines.append(f"{self.prefix}{name} {formatNumber(function())}")
+
+        lastName = None
+        for (name, labels), value in counters:
+            if name != lastName:
+                lines.append(f"# TYPE {self.prefix}{name} counter")
+                lastName = name
+
+            lines.append(f"{self.prefix}{name}{formatLabels(labels)} {formatNumber(value)}")
+
+        lastName = None
+        for (name, labels), histogram in histograms:
+            if name != lastName:
+                lines.append(f"# TYPE {self.prefix}{name} histogram")
+                lastName = name
+
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else formatNumber(bound)
+                lines.append(f"{self.prefix}{name}_bucket{formatLabels(labels + (('le', le),))} {cumulative}")
+
+            lines.append(f"{self.prefix}{name}_sum{formatLabels(labels)} {formatNumber(histogram.sum)}")
+            lines.append(f"{self.prefix}{name}_count{formatLabels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+# Formats a number for the Prometheus output.
+def formatNumber(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return repr(value) if isinstance(value, float) else str(value)
+
+# Formats labels for the Prometheus output, like {stage="draw"}.
+def formatLabels(labels):
+    if not labels:
+        return ""
+
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f"{key}=\"{value}\"" for key, value in escaped) + "}"
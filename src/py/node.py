@@ -1,93 +1,216 @@
-import re
-import math
+from array import array
 from cdError import CDError
 
-# Nodes in a CD.
+# A view of a node in a graph.
+# The data lives in the graph's arrays, this just exposes it through the usual node attributes.
 class Node:
-    # Class constructor.
-    def __init__(self, value, index):
-        self.stringIndex = index
-
-        if value != 'ß':
-            self.value = value
-        else:
-            self.value = '+'
+    __slots__ = ('graph', 'id')
 
-        self.neighbors = []
-        self.edgeLabels = []
-        self.visited = False
+    # Class constructor.
+    def __init__(self, graph, id):
+        self.graph = graph
+        self.id = id
+
+    # The node label.
+    @property
+    def value(self):
+        return self.graph.values[self.id]
+
+    # The position of the node in the diagram string.
+    @property
+    def stringIndex(self):
+        return self.graph.stringIndices[self.id]
+
+    # The neighboring nodes, in the order they were linked.
+    @property
+    def neighbors(self):
+        nodes = self.graph.array
+        return [nodes[neighbor] for neighbor in self.graph.adjacency[self.id]]
+
+    # The labels of the edges to each neighbor.
+    @property
+    def edgeLabels(self):
+        labels = self.graph.labels
+        return [labels[label] for label in self.graph.adjacency[self.id].values()]
 
     # Gets the degree of a node.
     def degree(self):
-        return len(self.neighbors)
+        return len(self.graph.adjacency[self.id])
 
     # Links two nodes together.
+    # Returns whether an edge was actually added (edges labeled 2 aren't drawn).
     def linkTo(self, node, label):
-        if self is node:
+        return self.graph.link(self.id, node.id, label)
+
+    # Gets the connected component of a node.
+    def component(self):
+        root = self.graph.unionFind.find(self.id)
+        return [node for node in self.graph.array if self.graph.unionFind.find(node.id) == root]
+
+    def __repr__(self):
+        return f"Node({self.value!r}, {self.stringIndex})"
+
+# Disjoint sets over the integers 0, 1, ..., n - 1.
+# Used to keep track of the connected components of a graph as its nodes get linked.
+class UnionFind:
+    __slots__ = ('parent', 'rank')
+
+    # Class constructor.
+    def __init__(self, size = 0):
+        self.parent = array('i', range(size))
+        self.rank = array('b', bytes(size))
+
+    # Adds a new singleton set, returns its element.
+    def add(self):
+        self.parent.append(len(self.parent))
+        self.rank.append(0)
+        return len(self.parent) - 1
+
+    # Gets the representative of the set containing an element.
+    # Uses path halving, so the trees stay almost flat.
+    def find(self, x):
+        parent = self.parent
+
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+
+        return x
+
+    # Like find, but without path halving. Union by rank keeps the trees logarithmically deep, so this is still fast,
+    # and since it doesn't write to the parent array, several threads can call it at once.
+    def root(self, x):
+        parent = self.parent
+
+        while parent[x] != x:
+            x = parent[x]
+
+        return x
+
+    # Merges the sets containing two elements.
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return
+
+        if self.rank[x] < self.rank[y]:
+            x, y = y, x
+
+        self.parent[y] = x
+        if self.rank[x] == self.rank[y]:
+            self.rank[x] += 1
+
+# The CD as a graph.
+# Nodes are integer ids, and their data is stored in flat arrays indexed by them.
+class Graph:
+    __slots__ = (
+        'values', 'stringIndices', 'adjacency', 'labels', 'labelIds',
+        'edgeSources', 'edgeTargets', 'edgeLabels', 'unionFind', 'array'
+    )
+
+    # Class constructor.
+    def __init__(self):
+        # Node data, by id.
+        self.values = []
+        self.stringIndices = array('i')
+
+        # For each node, maps each neighbor to the id of the label of the edge between them.
+        # Keeps neighbors in linking order, and checks for duplicate edges in constant time.
+        self.adjacency = []
+
+        # Interned edge labels.
+        self.labels = []
+        self.labelIds = {}
+
+        # The edge table, in linking order.
+        self.edgeSources = array('i')
+        self.edgeTargets = array('i')
+        self.edgeLabels = array('i')
+
+        # The connected components of the nodes.
+        self.unionFind = UnionFind()
+
+        # Node views, by id.
+        self.array = []
+
+    # Adds a new node, returns its view.
+    def addNode(self, value, stringIndex):
+        if value == 'ß':
+            value = '+'
+
+        id = self.unionFind.add()
+        self.values.append(value)
+        self.stringIndices.append(stringIndex)
+        self.adjacency.append({})
+
+        node = Node(self, id)
+        self.array.append(node)
+        return node
+
+    # Gets the id of an edge label, adding it to the label table if necessary.
+    def internLabel(self, label):
+        labelId = self.labelIds.get(label)
+
+        if labelId is None:
+            labelId = len(self.labels)
+            self.labels.append(label)
+            self.labelIds[label] = labelId
+
+        return labelId
+
+    # Links two nodes together by id.
+    # Returns whether an edge was actually added (edges labeled 2 aren't drawn).
+    def link(self, source, target, label):
+        if source == target:
             raise CDError("Can't link node to self.")
 
-        if node in self.neighbors:
+        if target in self.adjacency[source]:
             raise CDError("Can't link two nodes twice.")
 
         if label == "1" or label == "1/2":
             raise CDError(f"Invalid edge label {label}.")
 
-        if label != "2":
-            self.neighbors.append(node)
-            self.edgeLabels.append(label)
-            node.neighbors.append(self)
-            node.edgeLabels.append(label)
+        if label == "2":
+            return False
 
-    # Gets the connected component of a node.
-    def component(self):
-        Node.__comp = []
-        self.__component()
+        labelId = self.internLabel(label)
+        self.adjacency[source][target] = labelId
+        self.adjacency[target][source] = labelId
 
-        return Node.__comp
+        self.edgeSources.append(source)
+        self.edgeTargets.append(target)
+        self.edgeLabels.append(labelId)
 
-    # Auxiliary function for component.
-    def __component(self):
-        self.visited = True
-        Node.__comp.append(self)
+        self.unionFind.union(source, target)
+        return True
 
-        # Performs DFS.
-        for node in self.neighbors:
-            if not node.visited:
-                node.__component()
+    # Gets the degree of a node by id.
+    def degree(self, id):
+        return len(self.adjacency[id])
 
-# The CD as a graph.
-class Graph:
-    # Class constructor.
-    def __init__(self, array):
-        self.array = array
-        self.idx = 0
+    # Iterates over the edges, as (source, target, label) triples.
+    def edges(self):
+        labels = self.labels
 
-    # Class iterator.
-    def __iter__(self):
-        self.idx = 0
-        return self
+        for i in range(len(self.edgeLabels)):
+            yield self.edgeSources[i], self.edgeTargets[i], labels[self.edgeLabels[i]]
 
-    # Next iterator method.
-    def __next__(self):
-        if self.idx < len(self.array):
-            x = self.array[self.idx]
-            self.idx += 1
-            return x
+    # Number of nodes.
+    def __len__(self):
+        return len(self.values)
 
-        raise StopIteration
+    # Iterates over the node views. Each call gets its own iterator, so loops can be nested.
+    def __iter__(self):
+        return iter(self.array)
 
-    # Gets the connected components of a graph.
+    # Gets the connected components of a graph, each one with its nodes in array order.
+    # Components are ordered by their first node. Only reads the graph, using UnionFind.root rather than find,
+    # so it's safe to call concurrently.
     def components(self):
-        components = []
-
-        # Puts the connected components in an array.
-        for node in self:
-            if not node.visited:
-                components.append(node.component())
+        components = {}
+        root = self.unionFind.root
 
-        # Resets visited attribute.
-        for component in components:
-            for node in component:
-                node.visited = False
+        for node in self.array:
+            components.setdefault(root(node.id), []).append(node)
 
-        return components
\ No newline at end of file
+        return list(components.values())
@@ -0,0 +1,76 @@
+import time
+
+# A token bucket: holds up to capacity tokens, and refills at rate tokens per second.
+class TokenBucket:
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    # Class constructor. Starts full.
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    # Adds the tokens refilled since the last update.
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until the bucket has a given number of tokens, 0 if it already has them.
+    # Costs above the capacity are capped to it, so that they still go through with a full bucket.
+    def wait(self, cost):
+        return max(min(cost, self.capacity) - self.tokens, 0) / self.rate
+
+    # Takes a given number of tokens, capped like in wait.
+    def take(self, cost):
+        self.tokens -= min(cost, self.capacity)
+
+# Rate limits keyed by scope and id, like ('user', 1234), each one with its own token bucket.
+# Buckets are created on demand, and the full ones get dropped every now and then, since they're the same as new ones.
+class RateLimiter:
+    # Class constructor.
+    # limits maps each scope to its (capacity, rate) pair: the size of a burst, and the tokens refilled per second.
+    # maxKeys is the number of buckets after which the full ones get dropped.
+    def __init__(self, limits, maxKeys = 10000, clock = time.monotonic):
+        self.limits = limits
+        self.maxKeys = maxKeys
+        self.clock = clock
+        self.buckets = {}
+
+    # Takes tokens from the buckets of several keys at once, given as (scope, id) pairs.
+    # Either all of them allow it, and it returns 0, or none of their tokens get taken,
+    # and it returns the seconds to wait until all of them would allow it.
+    # Scopes without a limit, and None ids (like the guild of a DM), are ignored.
+    def take(self, keys, cost = 1):
+        now = self.clock()
+        buckets = []
+
+        for scope, id in keys:
+            if scope not in self.limits or id is None:
+                continue
+
+            bucket = self.buckets.get((scope, id))
+            if bucket is None:
+                capacity, rate = self.limits[scope]
+                bucket = self.buckets[(scope, id)] = TokenBucket(capacity, rate, now)
+            else:
+                bucket.refill(now)
+
+            buckets.append(bucket)
+
+        wait = max((bucket.wait(cost) for bucket in buckets), default = 0)
+        if wait == 0:
+            for bucket in buckets:
+                bucket.take(cost)
+
+        if len(self.buckets) > self.maxKeys:
+            self.prune(now)
+
+        return wait
+
+    # Drops the buckets that have refilled completely.
+    def prune(self, now):
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[key]
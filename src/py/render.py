@@ -0,0 +1,194 @@
+import asyncio
+import concurrent.futures
+import io
+import math
+import time
+from PIL import Image, ImageDraw
+from concurrent.futures.process import BrokenProcessPool
+from cd import CD
+from cdError import CDError
+from draw import Draw, getFont, encodeImage
+from coxeter import elementCounts
+from ir import DiagramIR
+from limits import DEFAULT_LIMITS
+
+# Gets the graph of a diagram, given as a string or as a DiagramIR.
+# IRs are cheap to send to the pool workers, so diagrams parsed once don't need to be parsed again there.
+# IRs were already checked against the limits when they were parsed.
+def toGraph(diagram, limits = DEFAULT_LIMITS):
+    if isinstance(diagram, DiagramIR):
+        return diagram.toGraph()
+
+    return CD(diagram, limits).toGraph()
+
+# Parses and renders a diagram, given as a string or as a DiagramIR, returns the encoded image.
+# format is anything Draw.encode accepts, like "png" or "svg".
+# Runs inside the pool workers, so it needs to stay a top-level function.
+def renderDiagram(diagram, format = "png", limits = DEFAULT_LIMITS):
+    return Draw(toGraph(diagram, limits), limits).encode(format.upper())
+
+# Like renderDiagram, but also returns how long each stage took, in seconds.
+# The stages are parse, layout, draw and encode. SVG output has no separate encoding, it's all drawing.
+def renderTimed(diagram, format = "png", limits = DEFAULT_LIMITS):
+    timings = {}
+    start = time.perf_counter()
+
+    graph = toGraph(diagram, limits)
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    drawing = Draw(graph, limits)
+    timings['layout'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if format.upper() == "SVG":
+        data = drawing.encode("SVG")
+        timings['draw'] = time.perf_counter() - start
+        timings['encode'] = 0
+    else:
+        image = drawing.draw()
+        timings['draw'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        data = encodeImage(image, format)
+        timings['encode'] = time.perf_counter() - start
+
+    return data, timings
+
+# Parses a diagram, returns its IR.
+# Lets a batch of diagrams be checked against a node budget before any of them is drawn,
+# and then drawn without parsing them again.
+def parseDiagram(diagram, limits = DEFAULT_LIMITS):
+    return DiagramIR.parse(diagram, limits)
+
+# Parses a diagram, returns the element counts of its polytope, see coxeter.elementCounts.
+# Coset enumeration can take seconds, so it runs in the pool like rendering does.
+def countElements(diagram, timeout = None):
+    return elementCounts(CD(diagram).toGraph(), timeout = timeout)
+
+GRID_CAPTION_SIZE = 24 # Font size of the captions in a grid.
+GRID_SPACING = 24 # Space around the cells of a grid, in pixels.
+
+# Packs rendered images into a grid, with a caption above each one. Returns the grid, encoded in a format.
+# The grid is as close to square as possible, with every cell as big as the biggest image.
+# Runs inside the pool workers, like renderDiagram.
+def composeGrid(captions, images, format = "png"):
+    images = [Image.open(io.BytesIO(data)).convert("RGB") for data in images]
+    font = getFont(GRID_CAPTION_SIZE)
+
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    captionHeight = GRID_CAPTION_SIZE + GRID_SPACING // 2
+    cellWidth = max(image.size[0] for image in images)
+    cellHeight = max(image.size[1] for image in images) + captionHeight
+
+    grid = Image.new("RGB", (
+        columns * cellWidth + (columns + 1) * GRID_SPACING,
+        rows * cellHeight + (rows + 1) * GRID_SPACING
+    ), "white")
+    canvas = ImageDraw.Draw(grid)
+
+    for i, (caption, image) in enumerate(zip(captions, images)):
+        x = GRID_SPACING + (i % columns) * (cellWidth + GRID_SPACING)
+        y = GRID_SPACING + (i // columns) * (cellHeight + GRID_SPACING)
+
+        # Shortens captions that don't fit their cell.
+        if font.getlength(caption) > cellWidth:
+            while caption and font.getlength(caption + "…") > cellWidth:
+                caption = caption[:-1]
+            caption += "…"
+
+        canvas.text((x, y), caption, fill = "black", font = font)
+        grid.paste(image, (x + (cellWidth - image.size[0]) // 2, y + captionHeight))
+
+    return encodeImage(grid, format)
+
+# Shares the work of identical requests running at the same time.
+# The first request for a key starts the work, and the ones that come in before it's done wait for the same result.
+# Must be used from the event loop.
+class Coalescer:
+    # Class constructor.
+    def __init__(self):
+        # The work in flight, by key.
+        self.inFlight = {}
+
+        # Number of requests that got the result of someone else's work.
+        self.coalesced = 0
+
+    # Runs a coroutine function for a key, unless it's already running for it, and returns its result.
+    # Returns whether the result was shared as well.
+    async def run(self, key, function, *args):
+        task = self.inFlight.get(key)
+
+        if task is not None:
+            self.coalesced += 1
+            # Shielded, so that a cancelled request doesn't cancel the work for everyone else.
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(function(*args))
+        self.inFlight[key] = task
+        task.add_done_callback(lambda _: self.inFlight.pop(key, None))
+
+        return await asyncio.shield(task), False
+
+# Runs diagram rendering in a pool of workers, so that it doesn't block the event loop.
+class RenderPool:
+    # Class constructor.
+    # mode is either 'process' or 'thread'. Falls back to threads if processes aren't available.
+    # workers is the number of workers (None means one per CPU).
+    # queueDepth is the maximum number of renders that can be running or waiting at once.
+    def __init__(self, mode = 'process', workers = None, queueDepth = 32):
+        self.mode = mode
+        self.workers = workers
+        self.queueDepth = queueDepth
+
+        # Renders currently running or waiting for a worker.
+        self.pending = 0
+
+        self.executor = self.createExecutor()
+
+    # Creates the underlying executor.
+    def createExecutor(self):
+        if self.mode == 'process':
+            try:
+                return concurrent.futures.ProcessPoolExecutor(max_workers = self.workers)
+            except (ImportError, NotImplementedError, OSError):
+                self.mode = 'thread'
+
+        if self.mode == 'thread':
+            return concurrent.futures.ThreadPoolExecutor(max_workers = self.workers)
+
+        raise Exception(f"Invalid render pool mode {self.mode}.")
+
+    # Runs a function in the pool, and waits for its result.
+    # Must be called from the event loop.
+    async def run(self, function, *args):
+        if self.pending >= self.queueDepth:
+            raise CDError("Too many diagrams are being rendered right now. Try again in a moment.")
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        except BrokenProcessPool:
+            # A worker died. Replaces the pool, so that the next render works again.
+            self.executor.shutdown(wait = False)
+            self.executor = self.createExecutor()
+            raise
+        finally:
+            self.pending -= 1
+
+    # Renders a diagram in the pool, returns the encoded image.
+    async def render(self, diagram, format = "png", limits = DEFAULT_LIMITS):
+        return await self.run(renderDiagram, diagram, format, limits)
+
+    # Renders a diagram in the pool, see renderTimed.
+    # Adds a 'queue' stage to the timings: the time spent waiting for a worker and passing data around.
+    async def renderTimed(self, diagram, format = "png", limits = DEFAULT_LIMITS):
+        start = time.perf_counter()
+        data, timings = await self.run(renderTimed, diagram, format, limits)
+        timings['queue'] = max(time.perf_counter() - start - sum(timings.values()), 0)
+        return data, timings
+
+    # Stops the workers.
+    def shutdown(self, wait = True):
+        self.executor.shutdown(wait = wait)
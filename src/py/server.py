@@ -0,0 +1,282 @@
+import asyncio
+import argparse
+import hashlib
+import logging
+from urllib.parse import urlsplit, parse_qs
+from PIL import features
+from cdError import CDError
+from cache import LRUCache
+from draw import renderSettings
+from render import RenderPool, Coalescer
+
+# A small HTTP server for rendering diagrams, for tools that don't go through Discord.
+# Serves GET /cd?d=x4o3o&fmt=png, with keep-alive connections and caching headers.
+# Run it with `python server.py --port 8080`.
+
+HOST = "127.0.0.1" # Only reachable from this machine by default.
+PORT = 8080
+
+CACHE_MAX_ITEMS = 2048 # Maximum number of rendered diagrams kept in memory.
+CACHE_MAX_BYTES = 128 * 1024 * 1024 # Maximum total size of the rendered diagrams kept in memory.
+
+MAX_RENDERS = 16 # Maximum number of diagrams being rendered at once, the rest wait their turn.
+MAX_WAITING = 256 # Maximum number of requests waiting for a render, the rest get a 503.
+RENDER_WORKERS = None # Number of render workers, None for one per CPU.
+
+MAX_LINE = 8192 # Maximum length of the request line and of each header, in bytes.
+MAX_HEADERS = 64 # Maximum number of headers in a request.
+KEEP_ALIVE_TIMEOUT = 15 # Seconds an idle connection is kept open.
+
+CACHE_CONTROL = "public, max-age=86400" # Renders only change with the bot, so they can be cached for a day.
+
+# Content types of the output formats. WebP needs Pillow to be built with it.
+CONTENT_TYPES = {
+    'png': "image/png",
+    'svg': "image/svg+xml"
+}
+if features.check('webp'):
+    CONTENT_TYPES['webp'] = "image/webp"
+
+REASONS = {
+    200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    414: "URI Too Long", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable"
+}
+
+logger = logging.getLogger("server")
+
+# An HTTP error, with its status code.
+class HTTPError(Exception):
+    # Class constructor.
+    def __init__(self, status, message, headers = ()):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+# Renders diagrams over HTTP, sharing one render cache between all connections.
+class RenderServer:
+    # Class constructor.
+    def __init__(self, pool, maxRenders = MAX_RENDERS, maxWaiting = MAX_WAITING):
+        self.pool = pool
+        self.cache = LRUCache(maxItems = CACHE_MAX_ITEMS, maxBytes = CACHE_MAX_BYTES)
+        self.coalescer = Coalescer()
+        self.renders = asyncio.Semaphore(maxRenders)
+        self.maxWaiting = maxWaiting
+
+        # Requests waiting for or running a render.
+        self.waiting = 0
+
+    # Serves a connection, one request after another until the client closes it or goes idle.
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.readRequest(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as e:
+                    await self.respond(writer, e.status, str(e).encode('utf-8'), keepAlive = False)
+                    break
+
+                if request is None:
+                    break
+
+                method, target, version, headers = request
+                keepAlive = self.keepAlive(version, headers)
+
+                try:
+                    status, body, extra = await self.route(method, target, headers)
+                except HTTPError as e:
+                    status, body, extra = e.status, str(e).encode('utf-8'), e.headers
+                except Exception:
+                    # A bug, not an overload, so clients shouldn't be told to retry.
+                    logger.exception("Unexpected error.")
+                    status, body, extra = 500, b"Unexpected error.", ()
+                    keepAlive = False
+
+                await self.respond(writer, status, body, extra, keepAlive, head = method == "HEAD")
+
+                if not keepAlive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # Reads the request line and headers. Returns None if the connection closed before a new request.
+    async def readRequest(self, reader):
+        line = await self.readLine(reader, 414)
+        if not line:
+            return None
+
+        try:
+            method, target, version = line.split(" ")
+        except ValueError:
+            raise HTTPError(400, "Malformed request line.")
+
+        if not version.startswith("HTTP/1."):
+            raise HTTPError(400, "Only HTTP/1.x is supported.")
+
+        headers = {}
+        while True:
+            line = await self.readLine(reader, 431)
+            if line == "":
+                break
+
+            if len(headers) >= MAX_HEADERS:
+                raise HTTPError(431, "Too many headers.")
+
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise HTTPError(400, "Malformed header.")
+
+            headers[name.strip().lower()] = value.strip()
+
+        # Requests with a body aren't supported, and the body would be taken for the next request.
+        if headers.get("content-length", "0") != "0" or "transfer-encoding" in headers:
+            raise HTTPError(400, "Request bodies aren't supported.")
+
+        return method, target, version, headers
+
+    # Reads a CRLF-terminated line, without the line break.
+    # Returns None at the end of the stream, and raises the given status if the line is too long.
+    async def readLine(self, reader, status):
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(status, "Line too long.")
+
+        return line.rstrip(b"\r\n").decode('latin-1')
+
+    # Whether to keep the connection open after a request.
+    # HTTP/1.1 keeps it by default, HTTP/1.0 only if asked to.
+    def keepAlive(self, version, headers):
+        connection = headers.get("connection", "").lower()
+
+        if version == "HTTP/1.0":
+            return connection == "keep-alive"
+
+        return connection != "close"
+
+    # Handles a request, returns its status, body and extra headers.
+    async def route(self, method, target, headers):
+        url = urlsplit(target)
+
+        if url.path != "/cd":
+            raise HTTPError(404, "Not found. Try /cd?d=x4o3o&fmt=png.")
+
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405, "Only GET and HEAD are allowed.", (("Allow", "GET, HEAD"),))
+
+        query = parse_qs(url.query)
+        diagram = query.get("d", [""])[0]
+        fileFormat = query.get("fmt", ["png"])[0].lower()
+
+        if diagram.strip() == "":
+            raise HTTPError(400, "Missing diagram, use /cd?d=x4o3o.")
+
+        if fileFormat not in CONTENT_TYPES:
+            raise HTTPError(400, f"Unknown format {fileFormat}. Choose one of: {', '.join(CONTENT_TYPES)}.")
+
+        # Keyed by the exact diagram string, so that cache hits and ETag matches skip parsing.
+        key = (diagram, fileFormat)
+        etag = self.etag(key)
+        cacheHeaders = (("ETag", etag), ("Cache-Control", CACHE_CONTROL))
+
+        # The image only depends on the diagram, so a matching ETag doesn't need a render.
+        if etag in (tag.strip() for tag in headers.get("if-none-match", "").split(",")):
+            return 304, b"", cacheHeaders
+
+        try:
+            data = await self.render(key, diagram, fileFormat)
+        except CDError as e:
+            raise HTTPError(400, str(e))
+
+        return 200, data, cacheHeaders + (("Content-Type", CONTENT_TYPES[fileFormat]),)
+
+    # The ETag of a rendered diagram. Includes the render settings, so that clients drop renders made with others.
+    def etag(self, key):
+        diagram, fileFormat = key
+        tag = ":".join(map(str, renderSettings() + (fileFormat, diagram)))
+        return '"' + hashlib.sha256(tag.encode('utf-8')).hexdigest()[:32] + '"'
+
+    # Renders a diagram, going through the cache and sharing identical renders in progress.
+    # At most maxRenders run at once, and requests past maxWaiting get turned away.
+    async def render(self, key, diagram, fileFormat):
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        if self.waiting >= self.maxWaiting:
+            raise HTTPError(503, "Too many diagrams are being rendered right now.", (("Retry-After", "1"),))
+
+        self.waiting += 1
+        try:
+            data, _ = await self.coalescer.run(key, self.renderLimited, key, diagram, fileFormat)
+        finally:
+            self.waiting -= 1
+
+        return data
+
+    # Renders a diagram in the pool once a render slot frees up, and caches it.
+    async def renderLimited(self, key, diagram, fileFormat):
+        async with self.renders:
+            data = await self.pool.render(diagram, fileFormat)
+
+        self.cache.put(key, data)
+        return data
+
+    # Writes a response.
+    async def respond(self, writer, status, body, headers = (), keepAlive = True, head = False):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+
+        if status != 304:
+            if not any(name == "Content-Type" for name, _ in headers):
+                lines.append("Content-Type: text/plain; charset=utf-8")
+            lines.append(f"Content-Length: {len(body)}")
+
+        lines += [f"{name}: {value}" for name, value in headers]
+        lines.append("Connection: keep-alive" if keepAlive else "Connection: close")
+
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if not head and status != 304:
+            writer.write(body)
+
+        await writer.drain()
+
+# Starts the server, and serves until interrupted.
+async def serve(host = HOST, port = PORT, workers = RENDER_WORKERS, mode = 'process'):
+    # The queue depth is enforced by the server itself, so the pool's own limit only needs to be high enough.
+    pool = RenderPool(mode = mode, workers = workers, queueDepth = MAX_WAITING + 1)
+    renderServer = RenderServer(pool)
+
+    server = await asyncio.start_server(renderServer.handle, host, port, limit = MAX_LINE)
+    logger.info(f"Serving on http://{host}:{port}/cd")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description = "Serves Coxeter-Dynkin diagram renders over HTTP.")
+    parser.add_argument("--host", default = HOST)
+    parser.add_argument("--port", type = int, default = PORT)
+    parser.add_argument("--workers", type = int, default = RENDER_WORKERS)
+    parser.add_argument("--mode", choices = ('process', 'thread'), default = 'process')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO, format = "%(asctime)s %(message)s")
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.mode))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
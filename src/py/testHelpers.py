@@ -0,0 +1,16 @@
+from PIL import ImageChops, ImageStat
+
+# Helpers shared by the tests and the benchmarks.
+# Only depends on Pillow, so that the tests don't pull in anything they don't use.
+
+# Mean absolute difference between two images of the same size, in grey levels (0 to 255).
+def pixelDiff(image0, image1):
+    return sum(ImageStat.Stat(ImageChops.difference(image0, image1)).mean) / len(image0.getbands())
+
+# Builds a branching diagram: a spine with a branch of a given length hanging off every few nodes.
+def branchingDiagram(spine, every = 3, branch = 2):
+    diagram = "x" + "3o" * (spine - 1)
+    for i in range(0, spine, every):
+        diagram += f" *({i + 1})" + "3o" * branch
+
+    return diagram
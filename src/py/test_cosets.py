@@ -0,0 +1,49 @@
+import pytest
+import cosets
+from cd import CD
+from cdError import CDError
+from coxeter import coxeterMatrix
+from cosets import CosetTable, cosetIndex
+
+# Tests for coset enumeration.
+
+# Gets the Coxeter matrix of a diagram.
+def matrix(diagram):
+    return coxeterMatrix(CD(diagram).toGraph())
+
+# The trivial subgroup has as many cosets as the group has elements.
+@pytest.mark.parametrize("diagram, order", (
+    ("o", 2), ("o5o", 10), ("o3o3o", 24), ("o4o3o", 48), ("o5o3o", 120), ("o3o *b3o *b3o", 192),
+    ("o3o4o3o", 1152), ("o5o3o3o", 14400), ("o3o o4o", 48)
+))
+def test_group_order(diagram, order):
+    assert CosetTable(matrix(diagram), []).enumerate() == order
+
+# The vertices, edges and faces of the cube, as the cosets of their stabilizers.
+@pytest.mark.parametrize("subgroup, index", (((1, 2), 8), ((0, 2), 12), ((0, 1), 6), ((0, 1, 2), 1), ((2,), 24)))
+def test_subgroup_index(subgroup, index):
+    assert CosetTable(matrix("o4o3o"), subgroup).enumerate() == index
+
+# Cached indices don't depend on the order or repetition of the generators.
+def test_cached_index():
+    assert cosetIndex(matrix("o3o3o3o"), [2, 1, 1]) == cosetIndex(matrix("o3o3o3o"), [1, 2]) == 20
+
+def test_max_cosets():
+    with pytest.raises(CDError):
+        CosetTable(matrix("o4o3o"), [], maxCosets = 47).enumerate()
+
+# The default cap on cosets comes from MAX_TABLE_BYTES, which counts every array that grows with them.
+def test_max_table_bytes(monkeypatch):
+    table = CosetTable(matrix("o3o3o3o3o *c3o"), [])
+    bytesPerCoset = 4 * table.rank + 4 + len(table.relators)
+
+    monkeypatch.setattr(cosets, 'MAX_TABLE_BYTES', 1000 * bytesPerCoset)
+    table = CosetTable(matrix("o3o3o3o3o *c3o"), [])
+    assert table.maxCosets == 1000
+
+    with pytest.raises(CDError):
+        table.enumerate()
+
+def test_timeout():
+    with pytest.raises(CDError):
+        CosetTable(matrix("o3o3o3o3o *c3o"), [], timeout = 0).enumerate()
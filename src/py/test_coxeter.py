@@ -0,0 +1,76 @@
+import math
+import pytest
+from cd import CD
+from cdError import CDError
+from coxeter import classifyGraph, elementCounts, totalOrder, labelOrder
+
+# Tests for the classification of Coxeter groups, and for element counts.
+
+# Finite groups, by diagram. Both ends of a path, and every arm of a branch, are tried.
+FINITE = {
+    "x": ('A1', 2),
+    "x3o": ('A2', 6),
+    "x4o": ('B2', 8),
+    "x5o": ('I2(5)', 10),
+    "x6o": ('I2(6)', 12),
+    "x3o3o3o": ('A4', 120),
+    "x4o3o3o3o": ('B5', 3840),
+    "o3o3o3o4x": ('B5', 3840),
+    "x3o *b3o *b3o": ('D4', 192),
+    "x3o3o3o *c3o": ('D5', 1920),
+    "x3o3o3o3o *c3o": ('E6', 51840),
+    "x3o3o3o *c3o3o": ('E6', 51840),
+    "x3o3o3o3o3o *c3o": ('E7', 2903040),
+    "x3o3o3o3o3o3o *c3o": ('E8', 696729600),
+    "x3o4o3o": ('F4', 1152),
+    "x5o3o": ('H3', 120),
+    "x3o5o": ('H3', 120),
+    "o5o3o3x": ('H4', 14400),
+    "x3o5/2o": ('H3', 120)
+}
+
+# Infinite groups: affine ones first, then hyperbolic ones.
+INFINITE = (
+    "x∞o", "x3o3o3o3*a", "x4o3o4o", "x3o3o *b3o *b3o", "x3o3o3o3o3o *c3o3o", "x3o3o3o3o3o3o *c3o3o3o",
+    "x5o5o", "x3o3o3o3o3o3o3o *c3o", "x4o4o4o", "x3o3o3o3o3*a *c3o"
+)
+
+@pytest.mark.parametrize("diagram", FINITE)
+def test_finite(diagram):
+    [(ids, group)] = classifyGraph(CD(diagram).toGraph())
+    assert (group.name, group.order) == FINITE[diagram]
+    assert group.finite and group.rank == len(ids)
+
+@pytest.mark.parametrize("diagram", INFINITE)
+def test_infinite(diagram):
+    [(_, group)] = classifyGraph(CD(diagram).toGraph())
+    assert group.order == math.inf and not group.finite
+
+# Labels without a fixed order, and fractions that might fold an infinite group into a finite one, can't be told.
+@pytest.mark.parametrize("diagram", ("xPo", "x3o...o", "x5o5/2o3o3o"))
+def test_unknown(diagram):
+    [(_, group)] = classifyGraph(CD(diagram).toGraph())
+    assert group.order is None and group.finite is None
+
+def test_components():
+    groups = [group for _, group in classifyGraph(CD("x3o o4o x").toGraph())]
+    assert [group.name for group in groups] == ['A2', 'B2', 'A1']
+    assert totalOrder(groups) == 6 * 8 * 2
+
+@pytest.mark.parametrize("label, order", (("3", 3), ("5/2", 5), ("4'", 4), ("∞", math.inf), ("P", None)))
+def test_label_order(label, order):
+    assert labelOrder(label) == order
+
+@pytest.mark.parametrize("diagram, counts", (
+    ("x4o3o", [8, 12, 6]),
+    ("o4o3x", [6, 12, 8]),
+    ("x3o3o3o3o *c3o", [27, 216, 720, 1080, 648, 99]),
+    ("x3o o3x", [9, 18, 15, 6])
+))
+def test_element_counts(diagram, counts):
+    assert elementCounts(CD(diagram).toGraph()) == counts
+
+@pytest.mark.parametrize("diagram", ("o3o3o", "s3s4o", "x3o3o3*a", "xPo", "x" + "3o" * 10))
+def test_element_counts_errors(diagram):
+    with pytest.raises(CDError):
+        elementCounts(CD(diagram).toGraph())
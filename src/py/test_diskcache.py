@@ -0,0 +1,125 @@
+import sqlite3
+import pytest
+import diskcache
+from diskcache import DiskCache, TOUCH_INTERVAL
+
+# Tests for the persistent render cache.
+
+# Stands in for the time module, with a clock that only moves when told to.
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(diskcache, 'time', clock)
+    return clock
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = DiskCache(str(tmp_path / "cache" / "renders.db"), maxBytes = 100)
+    yield cache
+    cache.close()
+
+# Adds up the sizes of the entries, the slow way.
+def totalSize(cache):
+    with sqlite3.connect(cache.path) as db:
+        return db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM renders").fetchone()[0]
+
+def test_get_put(cache):
+    key = DiskCache.key(3, 'direct', "png", "x4o3o")
+    assert cache.get(key) is None
+
+    cache.put(key, b"image")
+    assert cache.get(key) == b"image"
+    assert (cache.hits, cache.misses, cache.hitRate()) == (1, 1, 0.5)
+
+    cache.put(key, b"other image")
+    assert cache.get(key) == b"other image"
+    assert len(cache) == 1 and cache.bytes == 11
+
+def test_key():
+    assert DiskCache.key(3, "png", "x4o3o") == DiskCache.key("3", "png", "x4o3o")
+    assert DiskCache.key(3, "png", "x4o3o") != DiskCache.key(3, "svg", "x4o3o")
+    assert len(DiskCache.key("x")) == 32
+
+# The least recently used entries go first, and only as many as needed.
+def test_eviction(cache, clock):
+    for i in range(5):
+        clock.now += 1
+        cache.put(bytes([i]), bytes(20))
+
+    assert cache.bytes == 100
+
+    clock.now += 1
+    cache.put(b"new", bytes(30))
+    assert [cache.get(bytes([i])) is not None for i in range(5)] == [False, False, True, True, True]
+    assert cache.bytes == 90
+
+# Eviction finds the oldest entries through the index on accessed, rather than by sorting the whole table.
+def test_eviction_index(cache):
+    with sqlite3.connect(cache.path) as db:
+        plan = db.execute("EXPLAIN QUERY PLAN SELECT key, size FROM renders ORDER BY accessed LIMIT 64").fetchall()
+
+    assert any("rendersAccessed" in row[-1] for row in plan)
+    assert not any("TEMP B-TREE" in row[-1] for row in plan)
+
+# Reads move entries to the back of the line, once their access time is stale enough.
+def test_touch(cache, clock):
+    for i in range(4):
+        clock.now += 1
+        cache.put(bytes([i]), bytes(25))
+
+    clock.now += TOUCH_INTERVAL / 2
+    cache.get(bytes([0]))
+    clock.now += TOUCH_INTERVAL
+    cache.get(bytes([1]))
+
+    cache.put(b"new", bytes(25))
+    assert [cache.get(bytes([i])) is not None for i in range(4)] == [False, True, True, True]
+
+# Values bigger than the whole cache don't get stored, and don't evict anything.
+def test_too_big(cache):
+    cache.put(b"small", bytes(10))
+    cache.put(b"big", bytes(101))
+
+    assert cache.get(b"big") is None and cache.get(b"small") is not None
+    assert cache.bytes == 10
+
+# The running total stays equal to the actual total through every kind of write.
+def test_totals(cache, clock):
+    for i in range(30):
+        clock.now += 1
+        cache.put(bytes([i % 7]), bytes(i % 13 * 3))
+        assert cache.bytes == totalSize(cache) <= 100
+
+    cache.clear()
+    assert cache.bytes == totalSize(cache) == 0 and len(cache) == 0
+
+# Databases written by several caches, or from before the running total, keep it right.
+def test_totals_shared(tmp_path, clock):
+    path = str(tmp_path / "renders.db")
+    with sqlite3.connect(path) as db:
+        db.execute(
+            "CREATE TABLE renders (key BLOB PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        db.execute("INSERT INTO renders VALUES (?, ?, ?, ?)", (b"old", bytes(40), 40, 0))
+
+    first, second = DiskCache(path, maxBytes = 100), DiskCache(path, maxBytes = 100)
+    try:
+        assert first.bytes == 40
+
+        second.put(b"a", bytes(30))
+        first.put(b"b", bytes(30))
+        assert first.bytes == second.bytes == 100
+
+        first.put(b"c", bytes(10))
+        assert first.get(b"old") is None
+        assert second.bytes == totalSize(second) == 70
+    finally:
+        first.close()
+        second.close()
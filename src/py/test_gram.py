@@ -0,0 +1,72 @@
+import math
+import pytest
+import gram
+from cd import CD
+from gram import classifyBatch, classifyStream, jacobiEigenvalues, labelValue
+
+# Tests for the classification of diagrams by their Gram matrices.
+
+# Diagrams by kind, with the signatures of their Gram matrices.
+DIAGRAMS = {
+    "x3o3o": ('finite', (3, 0, 0)),
+    "x4o3o3o": ('finite', (4, 0, 0)),
+    "x5o3o3o": ('finite', (4, 0, 0)),
+    "x3o3o3o3o *c3o": ('finite', (6, 0, 0)),
+    "x5/2o5o": ('finite', (3, 0, 0)),
+    "x3o o4o": ('finite', (4, 0, 0)),
+    "x∞o": ('affine', (1, 1, 0)),
+    "x3o3o3*a": ('affine', (2, 1, 0)),
+    "x4o3o4o": ('affine', (3, 1, 0)),
+    "x6o3o": ('affine', (2, 1, 0)),
+    "x3o3o3o3o3o3o3o *c3o": ('affine', (8, 1, 0)),
+    "x4o3o4o x∞o": ('affine', (4, 2, 0)),
+    "x7o3o": ('hyperbolic', (2, 0, 1)),
+    "x5o3o3o3o": ('hyperbolic', (4, 0, 1)),
+    "x4o4o4o": ('hyperbolic', (3, 0, 1)),
+    "x∞o∞o": ('hyperbolic', (2, 0, 1)),
+    "x7o3o x7o3o": ('indefinite', (4, 0, 2))
+}
+
+# Runs each test both with NumPy and with the pure Python fallback.
+@pytest.fixture(params = ('numpy', 'jacobi'))
+def solver(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(gram, 'np', None)
+
+    return request.param
+
+@pytest.mark.parametrize("diagram", DIAGRAMS)
+def test_signature(solver, diagram):
+    [result] = classifyBatch([diagram])
+    assert (result.kind, result.signature) == DIAGRAMS[diagram]
+
+# Diagrams of different sizes get batched apart, and results come back in order.
+def test_batch(solver):
+    results = classifyBatch(list(DIAGRAMS) + [CD("x3o").toGraph(), "xPo", "x3o  o"])
+
+    assert [(result.kind, result.signature) for result in results[:len(DIAGRAMS)]] == list(DIAGRAMS.values())
+    assert results[len(DIAGRAMS)].kind == 'finite'
+    assert all(result.kind is None and result.error for result in results[-2:])
+
+def test_stream(solver):
+    diagrams = list(DIAGRAMS) * 3
+    results = list(classifyStream(iter(diagrams), batchSize = 5))
+    assert [result.diagram for result in results] == diagrams
+    assert [result.kind for result in results] == [kind for kind, _ in DIAGRAMS.values()] * 3
+
+# The determinant of the Gram matrix of A_n is (n + 1) / 2^n.
+@pytest.mark.parametrize("n", (1, 2, 5, 8))
+def test_determinant(solver, n):
+    [result] = classifyBatch(["x" + "3o" * (n - 1)])
+    assert math.isclose(result.determinant, (n + 1) / 2 ** n)
+
+def test_jacobi():
+    matrix = [[2.0, 1.0, 0.0], [1.0, 2.0, 1.0], [0.0, 1.0, 2.0]]
+    expected = (2 - math.sqrt(2), 2.0, 2 + math.sqrt(2))
+    assert all(map(math.isclose, sorted(jacobiEigenvalues(matrix)), expected))
+
+@pytest.mark.parametrize("label, value", (("3", 3), ("5/2", 2.5), ("4'", 4 / 3), ("∞", math.inf)))
+def test_label_value(label, value):
+    assert labelValue(label) == value
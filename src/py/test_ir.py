@@ -0,0 +1,83 @@
+import pickle
+from array import array
+import pytest
+from cd import CD
+from cdError import CDError
+from draw import Draw
+from ir import DiagramIR, HEADER, IR_MAGIC, IR_VERSION
+
+# Tests for the diagram IR and its encodings.
+
+DIAGRAMS = (
+    "x", "x3o3o", "x4o3o o5/2o", "s3s4o3x", "x4x4x4x4x4*a *a4*c4*e4*b4*d4*a x4x",
+    "(-a)3(5/2)4(7)3s3ß q3f4u", "x∞o5/2oØo...o4'x", "x" + "3o" * 90 + "3*a"
+)
+
+@pytest.mark.parametrize("diagram", DIAGRAMS)
+def test_bytes(diagram):
+    ir = DiagramIR.parse(diagram)
+    assert DiagramIR.fromBytes(ir.toBytes()) == ir
+
+@pytest.mark.parametrize("diagram", DIAGRAMS)
+def test_text(diagram):
+    ir = DiagramIR.parse(diagram)
+    assert DiagramIR.fromText(ir.toText()) == ir
+    assert DiagramIR.fromText(ir.toText()).toText() == ir.toText()
+
+@pytest.mark.parametrize("diagram", DIAGRAMS)
+def test_pickle(diagram):
+    ir = DiagramIR.parse(diagram)
+    copy = pickle.loads(pickle.dumps(ir))
+    assert copy == ir and hash(copy) == hash(ir)
+
+# The graph rebuilt from an IR draws the same as the parsed one.
+@pytest.mark.parametrize("diagram", DIAGRAMS)
+def test_graph(diagram):
+    graph = CD(diagram).toGraph()
+    rebuilt = DiagramIR.fromGraph(graph).toGraph()
+
+    assert rebuilt.values == graph.values and sorted(rebuilt.edges()) == sorted(graph.edges())
+    assert Draw(rebuilt).svg() == Draw(graph).svg()
+
+def test_text_format():
+    assert DiagramIR.parse("x3o4o").toText() == f"CDIR {IR_VERSION} labels x o 3 4 nodes 0 1 1 edges 1 0 2 2 1 3"
+    assert DiagramIR.parse("x o").toText() == f"CDIR {IR_VERSION} labels x o nodes 0 1 edges"
+
+# Gets the binary encoding of x3o, with some of its fields changed.
+def encoded(magic = IR_MAGIC, version = IR_VERSION, labels = 3, nodes = 2, edges = 1, tail = b""):
+    body = DiagramIR.parse("x3o").toBytes()[HEADER.size:]
+    return HEADER.pack(magic, version, labels, nodes, edges) + body + tail
+
+@pytest.mark.parametrize("data", (
+    b"", b"CDIR", encoded(magic = b"PNG\0"), encoded(version = IR_VERSION + 1), encoded(labels = 4),
+    encoded(nodes = 3), encoded(edges = 2), encoded(tail = b"\0"), encoded()[:-1],
+    encoded(labels = 1), HEADER.pack(IR_MAGIC, IR_VERSION, 1, 0, 0) + b"\1\0\xff"
+))
+def test_bytes_invalid(data):
+    with pytest.raises(CDError):
+        DiagramIR.fromBytes(data)
+
+@pytest.mark.parametrize("text", (
+    "", "x3o", "CDIR", f"CDIR {IR_VERSION + 1} labels x nodes 0 edges", f"CDIR {IR_VERSION} labels x nodes 0",
+    f"CDIR {IR_VERSION} nodes 0 labels x edges", f"CDIR {IR_VERSION} labels x o 3 nodes 0 1 edges 0 1",
+    f"CDIR {IR_VERSION} labels x o 3 nodes 0 one edges", f"CDIR {IR_VERSION} labels x o 3 nodes 0 1 edges 0 2 2",
+    f"CDIR {IR_VERSION} labels x o 3 nodes 0 3 edges 0 1 2", f"CDIR {IR_VERSION} labels x o 3 nodes 0 1 edges 0 1 -1"
+))
+def test_text_invalid(text):
+    with pytest.raises(CDError):
+        DiagramIR.fromText(text)
+
+# IRs that decode fine but don't make for a valid graph get caught when rebuilding it.
+@pytest.mark.parametrize("text", (
+    f"CDIR {IR_VERSION} labels x 3 nodes 0 0 edges 0 0 1",
+    f"CDIR {IR_VERSION} labels x 3 nodes 0 0 edges 0 1 1 1 0 1",
+    f"CDIR {IR_VERSION} labels x 2 nodes 0 0 edges 0 1 1"
+))
+def test_graph_invalid(text):
+    with pytest.raises(CDError):
+        DiagramIR.fromText(text).toGraph()
+
+def test_validate():
+    ir = DiagramIR(["x"], array('i', [0]), array('i', [0]), array('i'))
+    with pytest.raises(CDError):
+        ir.validate()
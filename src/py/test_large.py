@@ -0,0 +1,75 @@
+import pytest
+from cd import CD
+from cdError import CDError
+from draw import Draw, SCALE, PADDING
+from limits import LARGE_LIMITS, SIZE_LIMITS
+from render import renderDiagram, renderTimed, parseDiagram
+from testHelpers import branchingDiagram
+
+# Tests for large-diagram mode: diagrams right at its limits should still get drawn.
+
+NODES = LARGE_LIMITS.nodes
+
+# Builds a diagram out of complete graphs with a given number of nodes.
+def completeDiagrams(nodes, count):
+    diagrams = []
+
+    for k in range(count):
+        first = k * nodes + 1
+        diagram = "x" + "3o" * (nodes - 1)
+        for i in range(nodes):
+            for j in range(i + 2, nodes):
+                diagram += f" *({first + i})3*({first + j})"
+
+        diagrams.append(diagram)
+
+    return " ".join(diagrams)
+
+# Draws a diagram in large-diagram mode, checks that it fits, and returns the number of nodes and edges.
+def drawLarge(diagram):
+    graph = CD(diagram, LARGE_LIMITS).toGraph()
+    image = Draw(graph, LARGE_LIMITS).draw()
+
+    assert image.size[0] * image.size[1] <= LARGE_LIMITS.pixels
+    assert image.size[0] <= (LARGE_LIMITS.rowWidth + 2 * PADDING) * SCALE
+
+    return len(graph), sum(len(neighbors) for neighbors in graph.adjacency) // 2
+
+@pytest.mark.parametrize("diagram", (
+    "x" + "3o" * (NODES - 1),
+    "x" + "3o" * (NODES - 1) + "3*a",
+    "x" + "3o" * (NODES - 2) + "3*a",
+    branchingDiagram(NODES * 2 // 3, every = 2, branch = 1),
+    " ".join(["x3o3o3o *b3o"] * (NODES // 5))
+), ids = ("chain", "even ring", "odd ring", "branching", "many trees"))
+def test_node_limit(diagram):
+    nodes, _ = drawLarge(diagram)
+    assert nodes >= NODES - 1
+
+# 1111 complete graphs on 9 nodes, and a node linked to 4 of them, make for 10000 nodes and 40000 edges.
+def test_edge_limit():
+    diagram = completeDiagrams(9, 1111) + " o" + "".join(f" *({NODES})3*({i})" for i in range(1, 5))
+    assert drawLarge(diagram) == (NODES, LARGE_LIMITS.edges)
+
+def test_over_edge_limit():
+    diagram = completeDiagrams(9, 1111) + " o" + "".join(f" *({NODES})3*({i})" for i in range(1, 6))
+    with pytest.raises(CDError):
+        CD(diagram, LARGE_LIMITS).toGraph()
+
+# Rings narrower than a row stay polygons.
+def test_small_ring():
+    graph = CD("x" + "3o" * 29 + "3*a", LARGE_LIMITS).toGraph()
+    draw = Draw(graph, LARGE_LIMITS)
+    assert draw.size() == Draw(graph).size()
+
+# The render functions the bot and the pool workers use only allow large diagrams when asked to.
+def test_render_size():
+    diagram = "x" + "3o" * 499
+    with pytest.raises(CDError):
+        renderDiagram(diagram, "png", SIZE_LIMITS['normal'])
+    with pytest.raises(CDError):
+        parseDiagram(diagram, SIZE_LIMITS['normal'])
+
+    assert renderDiagram(diagram, "png", SIZE_LIMITS['large']).startswith(b"\x89PNG")
+    assert renderTimed(diagram, "svg", SIZE_LIMITS['large'])[0].startswith(b"<svg")
+    assert len(parseDiagram(diagram, SIZE_LIMITS['large'])) == 500
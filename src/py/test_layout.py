@@ -0,0 +1,78 @@
+import math
+import random
+import pytest
+from cd import CD
+from draw import Draw, SCALE
+from limits import LARGE_LIMITS
+from testHelpers import branchingDiagram
+
+# Tests for the layouts of components that aren't straight lines.
+
+# Nodes closer than this in the final image, in pixels, count as overlapping.
+MIN_DISTANCE = 24
+
+# Builds a random diagram, made out of a cycle of a given length with a random tree hanging off it.
+def randomUnicyclic(cycle, trees, generator):
+    diagram = "o" + "3o" * (cycle - 1) + "3*a"
+    for node in range(cycle, cycle + trees):
+        diagram += f" *({generator.randrange(node) + 1})3o"
+
+    return diagram
+
+# Builds a random tree diagram with a given number of nodes.
+def randomTree(nodes, generator):
+    diagram = "o"
+    for node in range(1, nodes):
+        diagram += f" *({generator.randrange(node) + 1})3o"
+
+    return diagram
+
+# Gets the smallest distance between two nodes of a drawn diagram, in pixels of the final image.
+def minDistance(diagram, limits = None):
+    graph = CD(diagram, LARGE_LIMITS).toGraph()
+    draw = Draw(graph) if limits is None else Draw(graph, limits)
+    points = sorted(node['xy'] for node in draw.nodes)
+    distance = math.inf
+
+    # Only compares nodes less than the current minimum apart horizontally.
+    for i, (x, y) in enumerate(points):
+        for otherX, otherY in points[i + 1:]:
+            if otherX - x >= distance:
+                break
+
+            distance = min(distance, math.hypot(otherX - x, otherY - y))
+
+    return distance * SCALE
+
+@pytest.mark.parametrize("diagram", (
+    "o3o3o3o3o3o3o3*a *c3o3o *d3o *d3o *d3o *c3o *d3o *b3o",
+    "x3o3o3*a *a3o *b3o *c3o *d3o",
+    "o3o3o3*a *a3o3o3o *a3o3o *a3o *b3o3o *b3o *b3o *c3o3o3o3o *c3o *c3o",
+    "x4o3o3o3o3o3o3o3o3o3o3o3o3o3o3*a *a3o3o3o3o3o3o3o3o3o",
+    "o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3o3*a"
+))
+def test_cycle_trees(diagram):
+    assert minDistance(diagram) >= MIN_DISTANCE
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_unicyclic(seed):
+    generator = random.Random(seed)
+    diagram = randomUnicyclic(generator.randint(3, 12), generator.randint(1, 60), generator)
+    assert minDistance(diagram) >= MIN_DISTANCE
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_tree(seed):
+    generator = random.Random(seed)
+    diagram = randomTree(generator.randint(4, 80), generator)
+    assert minDistance(diagram) >= MIN_DISTANCE
+
+# Trees and rings too wide for a row get folded, which shouldn't make any nodes overlap either.
+@pytest.mark.parametrize("diagram", (
+    branchingDiagram(300, every = 2, branch = 1),
+    branchingDiagram(200, every = 5, branch = 4),
+    "x" + "3o" * 499 + "3*a",
+    "x" + "3o" * 500 + "3*a",
+    randomTree(2000, random.Random(0))
+))
+def test_folded(diagram):
+    assert minDistance(diagram, LARGE_LIMITS) >= MIN_DISTANCE
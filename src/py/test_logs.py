@@ -0,0 +1,68 @@
+import gzip
+import logging
+import os
+import queue
+import time
+from logs import KeyValueFormatter, CompressedRotatingFileHandler, NonBlockingQueueHandler, formatValue
+
+# Tests for the bot's logging.
+
+# Makes a log record, with some extra fields.
+def makeRecord(message, **extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, message, (), None)
+    record.__dict__.update(extra)
+    return record
+
+def test_format():
+    line = KeyValueFormatter().format(makeRecord("Bot is ready.", command = "cd", latency_ms = 52, user = None))
+    assert line.split(" ", 1)[1] == 'level=INFO msg="Bot is ready." command=cd latency_ms=52 user=-'
+
+def test_format_value():
+    assert formatValue("x4o3o") == "x4o3o"
+    assert formatValue("") == '""'
+    assert formatValue('say "hi"\nthen=go') == '"say \\"hi\\"\\nthen=go"'
+
+# Files get rotated when they get too big, and the rotated ones get gzipped, newest first.
+def test_rotation(tmp_path):
+    filename = str(tmp_path / "log.txt")
+    handler = CompressedRotatingFileHandler(filename, maxBytes = 100, backupCount = 2)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    for i in range(4):
+        handler.emit(makeRecord(f"{i}" * 60))
+    handler.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["log.txt", "log.txt.1.gz", "log.txt.2.gz"]
+    with open(filename, encoding = "utf-8") as file:
+        assert file.read() == "3" * 60 + "\n"
+
+    for backup, i in ((1, 2), (2, 1)):
+        with gzip.open(f"{filename}.{backup}.gz", "rt", encoding = "utf-8") as file:
+            assert file.read() == f"{i}" * 60 + "\n"
+
+# Files get rotated at midnight as well, unless they're empty.
+def test_midnight_rotation(tmp_path):
+    filename = str(tmp_path / "log.txt")
+    handler = CompressedRotatingFileHandler(filename)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    assert handler.rolloverAt > time.time()
+
+    handler.rolloverAt = time.time()
+    handler.emit(makeRecord("first"))
+    handler.rolloverAt = time.time()
+    handler.emit(makeRecord("second"))
+    handler.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["log.txt", "log.txt.1.gz"]
+    assert handler.rolloverAt > time.time()
+
+# Records that don't fit in the queue get dropped and counted, without blocking.
+def test_dropped():
+    records = queue.Queue(2)
+    handler = NonBlockingQueueHandler(records)
+
+    for i in range(5):
+        handler.handle(makeRecord(f"record {i}"))
+
+    assert handler.dropped == 3
+    assert [records.get_nowait().getMessage() for _ in range(2)] == ["record 0", "record 1"]
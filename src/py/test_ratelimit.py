@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from ratelimit import TokenBucket, RateLimiter
+from render import Coalescer
+
+# Tests for rate limiting and render coalescing.
+
+# A clock that only moves when told to.
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_bucket_refill():
+    bucket = TokenBucket(capacity = 4, rate = 2, now = 0)
+    bucket.take(4)
+    assert bucket.wait(1) == 0.5
+
+    bucket.refill(0.25)
+    assert bucket.tokens == 0.5 and bucket.wait(1) == 0.25
+
+    bucket.refill(1)
+    assert bucket.tokens == 2 and bucket.wait(1) == 0
+
+# Buckets never hold more than their capacity, and costs above it are capped to it.
+def test_bucket_capacity():
+    bucket = TokenBucket(capacity = 4, rate = 2, now = 0)
+    bucket.refill(100)
+    assert bucket.tokens == 4
+
+    assert bucket.wait(10) == 0
+    bucket.take(10)
+    assert bucket.tokens == 0 and bucket.wait(10) == 2
+
+def test_limiter():
+    clock = FakeClock()
+    limiter = RateLimiter({'user': (2, 1)}, clock = clock)
+
+    assert limiter.take([('user', 1)]) == 0
+    assert limiter.take([('user', 1)]) == 0
+    assert limiter.take([('user', 1)]) == 1
+    assert limiter.take([('user', 2)]) == 0
+
+    clock.now = 1
+    assert limiter.take([('user', 1)]) == 0
+    assert limiter.take([('user', 1)]) == 1
+
+# Tokens only get taken when every bucket allows it.
+def test_limiter_scopes():
+    clock = FakeClock()
+    limiter = RateLimiter({'user': (3, 1), 'guild': (4, 1)}, clock = clock)
+
+    assert limiter.take([('user', 1), ('guild', 9)], cost = 3) == 0
+    assert limiter.take([('user', 2), ('guild', 9)], cost = 2) == 1
+    assert limiter.take([('user', 2), ('guild', 9)], cost = 1) == 0
+    assert limiter.buckets[('user', 2)].tokens == 2
+
+    # Scopes without a limit, and None ids, don't count.
+    assert limiter.take([('channel', 5), ('guild', None), ('user', 3)], cost = 3) == 0
+
+def test_limiter_prune():
+    clock = FakeClock()
+    limiter = RateLimiter({'user': (1, 1)}, maxKeys = 2, clock = clock)
+
+    for id in range(3):
+        limiter.take([('user', id)])
+
+    clock.now = 0.5
+    limiter.take([('user', 3)])
+    assert len(limiter.buckets) == 4
+
+    clock.now = 1.25
+    limiter.take([('user', 4)])
+    assert list(limiter.buckets) == [('user', 3), ('user', 4)]
+
+# Runs coroutines for the same key at the same time, and returns their results and the coalescer.
+def runCoalesced(keys, fail = False):
+    coalescer = Coalescer()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+
+        if fail:
+            raise ValueError(key)
+
+        return [key]
+
+    async def main():
+        return await asyncio.gather(
+            *(coalescer.run(key, work, key) for key in keys), return_exceptions = True
+        )
+
+    return asyncio.run(main()), calls, coalescer
+
+# Requests for the same key share a single result.
+def test_coalescer():
+    results, calls, coalescer = runCoalesced(['a', 'a', 'b', 'a'])
+
+    assert calls == ['a', 'b']
+    assert [shared for _, shared in results] == [False, True, False, True]
+    assert results[0][0] is results[1][0] is results[3][0]
+    assert coalescer.coalesced == 2 and not coalescer.inFlight
+
+def test_coalescer_error():
+    results, calls, coalescer = runCoalesced(['a', 'a'], fail = True)
+
+    assert calls == ['a']
+    assert all(isinstance(result, ValueError) for result in results)
+    assert not coalescer.inFlight
+
+# A cancelled request doesn't cancel the work the others are waiting on.
+def test_coalescer_cancel():
+    coalescer = Coalescer()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return 1
+
+    async def main():
+        first = asyncio.ensure_future(coalescer.run('a', work))
+        second = asyncio.ensure_future(coalescer.run('a', work))
+        await asyncio.sleep(0.005)
+        first.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        return await second
+
+    assert asyncio.run(main()) == (1, True)
@@ -0,0 +1,158 @@
+import io
+import os
+import pytest
+from PIL import Image, ImageChops
+from cd import CD
+from cdError import CDError
+import draw
+from draw import Draw, SCALE, renderSettings, encodeImage
+from limits import Limits
+from testHelpers import pixelDiff
+
+# Tests for the raster and SVG renderers. Run them with `python -m pytest`.
+
+DIAGRAMS = (
+    "x3o3o", "x4o3o3o3o", "s3s4o3x", "x4x4x4x4x4*a *a4*c4*e4*b4*d4*a x4x", "*-c3x3x3x o3o3o3o3o",
+    "(-a)3(5/2)4(7)3s3ß q3f4u", "x" + "4q" * 50
+)
+
+# Maximum mean difference between two renders of the same diagram, in grey levels out of 255.
+# Anti-aliasing differs between render modes, but a misplaced or missing node goes well over this.
+MAX_DIFF = 8
+
+# Diagrams with golden images, by name. Between them, they cover every node and edge type, and every layout.
+GOLDEN = {
+    "chain": "x4o3o",
+    "node types": "s3s4o3x",
+    "labels": "(-a)3(5/2)4(7)3s3ß q3f4u",
+    "edge types": "x∞o5/2oØo...o4'x",
+    "components": "x3o o5o x",
+    "tree": "x3o3o3o *c3o3o3o3o",
+    "cycle": "x4x4x4x4x4*a *a4*c4*e4*b4*d4*a x4x",
+    "cycle with trees": "o3o3o3o3o3o3o3*a *c3o3o *d3o *d3o *d3o *c3o *d3o *b3o",
+    "polygon": "x3x3x3*a3o3o *b3o *c3o4o"
+}
+
+# Folder with the golden images. Run `python test_render.py` to regenerate them,
+# after checking that a change to the output is wanted, and bump RENDERER_VERSION in draw.py.
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+# Renders can have at most GOLDEN_PIXELS pixels more than GOLDEN_LEVELS grey levels off their golden image.
+# Leaves room for anti-aliasing to change between Pillow versions, but not for a single wrong letter.
+GOLDEN_LEVELS = 128
+GOLDEN_PIXELS = 8
+
+# Gets the path to the golden image of a diagram.
+def goldenPath(name):
+    return os.path.join(GOLDEN_DIR, name.replace(" ", "_") + ".png")
+
+# Counts the pixels of two images of the same size that are more than some number of grey levels apart.
+def changedPixels(image0, image1, levels):
+    return sum(ImageChops.difference(image0, image1).convert('L').histogram()[levels + 1:])
+
+# Renders should look the same as their golden image.
+@pytest.mark.parametrize("name", GOLDEN)
+def test_golden(name):
+    image = Draw(CD(GOLDEN[name]).toGraph()).draw()
+
+    with Image.open(goldenPath(name)) as golden:
+        assert image.size == golden.size
+        assert changedPixels(golden.convert('RGB'), image, GOLDEN_LEVELS) <= GOLDEN_PIXELS
+
+# Stamping node sprites should look like drawing each node shape by shape.
+# Sprites are anti-aliased, and snapped to whole pixels, so they're only within a few grey levels.
+@pytest.mark.parametrize("diagram", (
+    "x3o3o", "s3s4o3x", "(-a)3(5/2)4(7)3s3ß q3f4u", "x" + "3o" * 99, "x" + "4q" * 50, "s" + "3ß" * 99
+))
+def test_node_sprites(diagram):
+    graph = CD(diagram).toGraph()
+    assert pixelDiff(Draw(graph, sprites = False).draw(), Draw(graph).draw()) <= MAX_DIFF
+
+# Drawing at the final resolution should look like drawing at full size and resizing.
+@pytest.mark.parametrize("diagram", DIAGRAMS)
+@pytest.mark.parametrize("supersample", (1, 2))
+def test_render_modes(diagram, supersample):
+    graph = CD(diagram).toGraph()
+    reference = Draw(graph, mode = 'resize').draw()
+    image = Draw(graph, mode = 'direct', supersample = supersample).draw()
+
+    assert image.size == reference.size
+    assert pixelDiff(reference, image) <= MAX_DIFF
+
+# The pixel limit applies to the canvas that gets allocated, scale and supersampling included.
+# Canvases just over it give up on supersampling first, and only fail if that's not enough.
+@pytest.mark.parametrize("mode, supersample", (('resize', 1), ('direct', 1), ('direct', 2), ('direct', 3)))
+def test_pixel_limit(mode, supersample):
+    graph = CD("x" + "3o" * 20).toGraph()
+    width, height = Draw(graph).size()
+    size = (round(width * SCALE), round(height * SCALE))
+
+    if mode == 'resize':
+        canvasWidth, canvasHeight = width, height
+    else:
+        canvasWidth, canvasHeight = size[0] * supersample, size[1] * supersample
+
+    fits = Limits(pixels = canvasWidth * canvasHeight)
+    assert Draw(graph, limits = fits, mode = mode, supersample = supersample).draw().size == size
+
+    tooSmall = Limits(pixels = canvasWidth * canvasHeight - 1)
+    if mode == 'direct' and supersample == 1:
+        with pytest.raises(CDError):
+            Draw(graph, limits = tooSmall, mode = mode, supersample = supersample).draw()
+    else:
+        assert Draw(graph, limits = tooSmall, mode = mode, supersample = supersample).draw().size == size
+
+# Images that don't fit even without supersampling get scaled down, as far as the minimum scale allows.
+def test_min_scale():
+    graph = CD("x" + "3o" * 20).toGraph()
+    width, height = Draw(graph).size()
+    pixels = round(width * SCALE) * round(height * SCALE) // 4
+
+    image = Draw(graph, limits = Limits(pixels = pixels, minScale = SCALE / 4)).draw()
+    assert image.size[0] * image.size[1] <= pixels
+    assert image.size[0] >= round(width * SCALE) / 2 - 1
+
+    with pytest.raises(CDError):
+        Draw(graph, limits = Limits(pixels = pixels, minScale = SCALE * 3 / 4)).draw()
+
+# SVG output declares its size at the final scale, which gets checked the same way.
+def test_svg_pixel_limit():
+    graph = CD("x" + "3o" * 20).toGraph()
+    width, height = Draw(graph).size()
+    pixels = round(width * SCALE) * round(height * SCALE)
+
+    assert Draw(graph, limits = Limits(pixels = pixels)).svg().startswith("<svg")
+    with pytest.raises(CDError):
+        Draw(graph, limits = Limits(pixels = pixels - 1)).svg()
+
+# Settings changed at runtime change both the output and the cache key, never just one of them.
+@pytest.mark.parametrize("setting, value", (
+    ('RENDER_MODE', 'resize'), ('SUPERSAMPLE', 3), ('IMAGE_MODE', 'rgb'), ('PALETTE_LEVELS', 4), ('ENCODE_PROFILE', 'speed')
+))
+def test_runtime_settings(monkeypatch, setting, value):
+    graph = CD("x4o3o *b3x").toGraph()
+    before, key = Draw(graph).encode("PNG"), renderSettings()
+
+    monkeypatch.setattr(draw, setting, value)
+    assert renderSettings() != key
+    assert Draw(graph).encode("PNG") != before
+
+# Palettes get as many grey levels as asked for, and PNGs only get packed into 4 bits when they fit.
+@pytest.mark.parametrize("levels", (2, 16, 17, 256))
+def test_palette_levels(levels):
+    image = Image.linear_gradient('L').convert('RGB')
+    data = encodeImage(image, "PNG", mode = 'palette', levels = levels)
+
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert len(decoded.convert('L').getcolors()) == levels
+
+# Regenerates the golden images.
+def saveGoldens():
+    os.makedirs(GOLDEN_DIR, exist_ok = True)
+
+    for name, diagram in GOLDEN.items():
+        Draw(CD(diagram).toGraph()).draw().save(goldenPath(name))
+        print(f"Saved {goldenPath(name)}")
+
+if __name__ == "__main__":
+    saveGoldens()
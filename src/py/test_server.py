@@ -0,0 +1,115 @@
+import asyncio
+from urllib.parse import quote
+import pytest
+from cdError import CDError
+from render import RenderPool
+from server import RenderServer
+
+# Tests for the HTTP render server. Requests go through a real socket on localhost.
+
+# A pool that renders every diagram into its own string, counting renders, or fails if told to.
+class FakePool:
+    def __init__(self, error = None):
+        self.error = error
+        self.renders = 0
+
+    async def render(self, diagram, format = "png"):
+        self.renders += 1
+        await asyncio.sleep(0)
+
+        if self.error is not None:
+            raise self.error
+
+        return f"{format}:{diagram}".encode('utf-8')
+
+# Sends requests, given as (target, headers) pairs, over one connection to a server using a given pool.
+# Returns the status, headers and body of each response.
+def requests(pool, *requests):
+    async def main():
+        renderServer = RenderServer(pool)
+        server = await asyncio.start_server(renderServer.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+
+        for target, headers in requests:
+            lines = [f"GET {target} HTTP/1.1", "Host: localhost"] + [f"{name}: {value}" for name, value in headers]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            responseHeaders = {}
+            while (line := (await reader.readline()).rstrip(b"\r\n")):
+                name, _, value = line.decode('latin-1').partition(":")
+                responseHeaders[name.lower()] = value.strip()
+
+            body = await reader.readexactly(int(responseHeaders.get("content-length", 0)))
+            responses.append((status, responseHeaders, body))
+
+            if responseHeaders["connection"] == "close":
+                break
+
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    return asyncio.run(main())
+
+def target(diagram, fileFormat = "png"):
+    return f"/cd?d={quote(diagram)}&fmt={fileFormat}"
+
+def test_ok():
+    pool = RenderPool(mode = 'thread', workers = 1)
+    try:
+        [(status, headers, body)] = requests(pool, (target("x4o3o"), ()))
+    finally:
+        pool.shutdown()
+
+    assert status == 200
+    assert headers["content-type"] == "image/png" and body.startswith(b"\x89PNG")
+    assert headers["etag"] and headers["cache-control"]
+
+# Matching ETags get a 304 without a render, others get the image again, from the cache.
+def test_not_modified():
+    pool = FakePool()
+    (status, headers, body), = requests(pool, (target("x3o"), ()))
+    etag = headers["etag"]
+
+    responses = requests(
+        pool, (target("x3o"), (("If-None-Match", etag),)), (target("x3o"), (("If-None-Match", f'"other", {etag}'),)),
+        (target("x3o"), (("If-None-Match", '"other"'),)), (target("x3o", "svg"), (("If-None-Match", etag),))
+    )
+
+    assert [status for status, _, _ in responses] == [304, 304, 200, 200]
+    assert all(headers["etag"] == etag and body == b"" for _, headers, body in responses[:2])
+    assert responses[3][1]["etag"] != etag
+    assert pool.renders == 3
+
+# Parse errors get a 400, and don't close the connection.
+@pytest.mark.parametrize("query", (target("x3o  o"), target("x3o3"), "/cd?fmt=png", target("x3o", "bmp")))
+def test_bad_request(query):
+    pool = RenderPool(mode = 'thread', workers = 1)
+    try:
+        responses = requests(pool, (query, ()), (query, ()))
+    finally:
+        pool.shutdown()
+
+    assert [status for status, _, _ in responses] == [400, 400]
+    assert responses[0][1]["connection"] == "keep-alive"
+
+def test_render_error():
+    (status, _, body), = requests(FakePool(CDError("Diagram too big.")), (target("x3o"), ()))
+    assert (status, body) == (400, b"Diagram too big.")
+
+# Unexpected errors get a 500, and close the connection.
+def test_unexpected_error():
+    responses = requests(FakePool(RuntimeError("bug")), (target("x3o"), ()), (target("x3o"), ()))
+
+    assert len(responses) == 1
+    status, headers, body = responses[0]
+    assert status == 500 and headers["connection"] == "close" and b"bug" not in body
+
+def test_not_found():
+    (status, _, _), = requests(FakePool(), ("/render?d=x3o", ()))
+    assert status == 404